@@ -1,11 +1,40 @@
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from core.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base.settings')
 
+django_asgi_app = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from core.routing import websocket_urlpatterns  # noqa: E402
+from core.background import shutdown_pools  # noqa: E402
+from core.detectors import close_pools  # noqa: E402
+from core.inference import get_backend, shutdown_backend  # noqa: E402
+
+if getattr(settings, 'DETECTOR_POOL_WARMUP', True):
+    get_backend().warm_up()
+
+
+async def lifespan(scope, receive, send):
+    """Stops the inference backend, background pools and detectors on server shutdown.
+
+    Only servers sending ASGI lifespan events (e.g. uvicorn) call this.
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            shutdown_backend()
+            shutdown_pools()
+            close_pools()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": URLRouter(websocket_urlpatterns),
+    "lifespan": lifespan,
 })
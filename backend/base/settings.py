@@ -82,6 +82,121 @@ CHANNEL_LAYERS = {
     },
 }
 
+# MediaPipe detector pool (shared by all WebSocket connections in a process)
+DETECTOR_POOL_SIZE = 2
+DETECTOR_POOL_TIMEOUT = 1.0  # seconds to wait for a free detector
+DETECTOR_POOL_WARMUP = True  # load models at ASGI startup (or a list of kinds, e.g. ['face'])
+DETECTOR_IDLE_TIMEOUT = 600  # seconds before an unused detector is closed (None keeps them)
+
+# Inference workers: 'thread' (dedicated thread pool), 'process' (worker
+# processes with shared-memory frame handoff), 'batch' (thread pool fed
+# with micro-batches of frames from many connections) or 'channels'
+# (separate `manage.py inference_worker` processes, over the channel layer)
+INFERENCE_BACKEND = 'thread'
+INFERENCE_WORKERS = 2  # keep <= DETECTOR_POOL_SIZE for the thread backend
+INFERENCE_MAX_PENDING = 32  # frames in flight before new ones are dropped
+INFERENCE_PARALLEL_MODELS = True  # run hand and face models concurrently in combined mode
+INFERENCE_BATCH_MAX_SIZE = 8  # 'batch' backend: frames per batch
+INFERENCE_BATCH_MAX_WAIT_MS = 3  # 'batch' backend: how long a batch collects frames
+INFERENCE_CHANNEL_LAYER = 'default'  # 'channels' backend: layer shared with the workers
+INFERENCE_CHANNEL_TIMEOUT = 1.0  # 'channels' backend: seconds to wait for a worker's result
+INFERENCE_CHANNEL_HEARTBEAT = 0.5  # seconds between worker load reports
+INFERENCE_CHANNEL_FALLBACK = True  # process locally when no worker has room (else drop)
+
+# Share of wall time one stream may keep an inference worker busy while all
+# workers are busy; the consumer then rests in proportion to measured
+# latency (1.0 = back-to-back). Streams never rest while a worker is free
+STREAM_MAX_DUTY_CYCLE = 0.5
+
+# MediaPipe VIDEO mode: each stream leases tracking detectors from a bounded
+# pool (thread backend only) and falls back to IMAGE mode when none is free
+# or frames are further apart than VIDEO_MAX_FRAME_GAP_MS
+VIDEO_TRACKING = True
+VIDEO_DETECTOR_POOL_SIZE = 4
+VIDEO_MAX_FRAME_GAP_MS = 500
+VIDEO_LEASE_IDLE_SECONDS = 5  # return detectors of models a stream stopped using
+
+# 'delta' result format: a keyframe every RESULT_KEYFRAME_INTERVAL frames,
+# otherwise only landmarks that moved by RESULT_DELTA_THRESHOLD or more
+RESULT_KEYFRAME_INTERVAL = 30
+RESULT_DELTA_THRESHOLD = 0.0005
+
+# One Euro smoothing of landmarks. Frames skipped by the mailbox are
+# answered with landmarks extrapolated from the filter (up to
+# LANDMARK_MAX_PREDICTION_MS after the last processed frame)
+LANDMARK_SMOOTHING = True
+LANDMARK_SMOOTHING_MIN_CUTOFF = 1.0  # Hz
+LANDMARK_SMOOTHING_BETA = 60.0
+LANDMARK_MAX_PREDICTION_MS = 200
+
+# Expression rules over face blendshapes, see core.expressions. Leave unset
+# for core.expressions.DEFAULT_EXPRESSION_RULES, e.g.:
+# EXPRESSION_RULES = [
+#     {'name': 'Smiling', 'all': {'mouthSmileLeft': 0.5, 'mouthSmileRight': 0.5},
+#      'hysteresis': 0.1},
+# ]
+
+# Region of interest: crop frames around the previous frame's landmarks
+# (padded by ROI_MARGIN, at least ROI_MIN_SIZE of the frame), with a
+# full-frame pass every ROI_REDETECT_INTERVAL frames and whenever
+# landmarks are lost
+ROI_CROPPING = True
+ROI_MARGIN = 0.25
+ROI_MIN_SIZE = 0.3
+ROI_REDETECT_INTERVAL = 30
+
+# Per-stage timings, frame counters and pool stats served at /metrics
+METRICS_ENABLED = True
+
+# White background removal for generated assets (and uploads posted with
+# remove_background=1): soften the cut-out edge over ASSET_MATTING_FEATHER
+# pixels, and only remove white connected to the image border so white
+# details inside the object are kept
+ASSET_MATTING_FEATHER = 1
+ASSET_MATTING_FROM_BORDER = True
+
+# AI asset generation runs as background jobs (see core.jobs):
+# ASSET_GENERATION_WORKERS at a time, refusing new jobs beyond
+# ASSET_GENERATION_MAX_QUEUED. ASSET_GENERATOR may point at a stub with
+# generate_ai_asset's signature to work offline
+ASSET_GENERATOR = 'core.utils.generate_ai_asset'
+ASSET_GENERATION_WORKERS = 2
+ASSET_GENERATION_MAX_QUEUED = 16
+ASSET_JOB_POLL_SECONDS = 5  # ws/assets/jobs/<id>/ re-reads the job in case a push is lost
+# Jobs unfinished this many seconds after submission (e.g. lost in a crash)
+# are reported FAILED, and ws/assets/jobs/<id>/ stops waiting for them
+ASSET_JOB_TIMEOUT = 600
+
+# Generated assets are reused for requests with the same prompt (ignoring
+# case and whitespace) and anchor, for ASSET_CACHE_TTL seconds, keeping at
+# most ASSET_CACHE_MAX_ENTRIES prompts (least recently used dropped first)
+ASSET_CACHE_ENABLED = True
+ASSET_CACHE_TTL = 7 * 24 * 3600
+ASSET_CACHE_MAX_ENTRIES = 1000
+
+# api/assets/ pages are cached (per asset list version, see core.asset_list)
+# for this many seconds
+ASSET_LIST_CACHE_TIMEOUT = 300
+
+# New 2D assets get resized copies in the background (see core.ingest): each
+# of ASSET_VARIANT_SIZES (longest side in pixels, never upscaled) in each of
+# ASSET_VARIANT_FORMATS, listed under "variants" in asset responses
+ASSET_VARIANTS_ENABLED = True
+ASSET_VARIANT_WORKERS = 1
+ASSET_VARIANT_SIZES = {'thumb': 128, 'small': 512, 'large': 1024}
+ASSET_VARIANT_FORMATS = ['webp', 'avif']
+ASSET_VARIANT_QUALITY = {'webp': 80, 'avif': 60}
+
+# Input resolution: streams start at INPUT_RESOLUTION and clients may ask for
+# up to INPUT_MAX_RESOLUTION ({"config": {"resolution": [w, h]}}). With
+# INPUT_ADAPTIVE the size moves along the ladder to keep inference under
+# INPUT_TARGET_LATENCY_MS, stepping up when detections drop out.
+INPUT_RESOLUTION_LADDER = [(160, 120), (240, 180), (320, 240), (480, 360), (640, 480)]
+INPUT_RESOLUTION = (160, 120)
+INPUT_MAX_RESOLUTION = (320, 240)
+INPUT_ADAPTIVE = True
+INPUT_TARGET_LATENCY_MS = 40
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
@@ -5,13 +5,17 @@ from django.contrib import admin
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from core.views import AssetListView, AssetDetailView, GenerateAssetView
+from core.views import (
+    AssetListView, AssetDetailView, GenerateAssetView, GenerationJobView, MetricsView,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/assets/', AssetListView.as_view(), name='asset-list'),
     path('api/assets/generate/', GenerateAssetView.as_view(), name='asset-generate'),
+    path('api/assets/jobs/<uuid:job_id>/', GenerationJobView.as_view(), name='asset-job'),
     path('api/assets/<uuid:asset_id>/', AssetDetailView.as_view(), name='asset-detail'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
 # Serve media files in development
@@ -0,0 +1,67 @@
+"""
+Reuse of generated assets for repeated prompts.
+
+Requests are keyed by their normalized prompt (case and whitespace folded)
+and anchor. A successful generation is recorded as a CachedGeneration and
+later requests with the same key get its asset instead of a new image.
+Entries expire ASSET_CACHE_TTL seconds after the generation, and beyond
+ASSET_CACHE_MAX_ENTRIES the least recently used ones are dropped (the
+assets themselves stay in the library).
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CachedGeneration
+
+DEFAULT_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def normalize_prompt(prompt):
+    return ' '.join(prompt.lower().split())
+
+
+def cache_key(prompt, anchor):
+    return hashlib.sha256(f'{anchor}\n{normalize_prompt(prompt)}'.encode()).hexdigest()
+
+
+def _enabled():
+    return getattr(settings, 'ASSET_CACHE_ENABLED', True)
+
+
+def _expiry_cutoff():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'ASSET_CACHE_TTL', DEFAULT_TTL))
+
+
+def lookup(key):
+    """The cached asset for ``key``, or None."""
+    if not _enabled():
+        return None
+    entry = CachedGeneration.objects.select_related('asset').filter(key=key).first()
+    if entry is None:
+        return None
+    if entry.created_at < _expiry_cutoff():
+        entry.delete()
+        return None
+    CachedGeneration.objects.filter(pk=entry.pk).update(hits=F('hits') + 1,
+                                                        last_used_at=timezone.now())
+    return entry.asset
+
+
+def store(key, prompt, anchor, asset):
+    """Record a generated asset and evict expired and least recently used entries."""
+    if not _enabled():
+        return
+    CachedGeneration.objects.update_or_create(key=key, defaults={
+        'prompt': prompt, 'anchor': anchor, 'asset': asset, 'hits': 0,
+        'created_at': timezone.now(), 'last_used_at': timezone.now()})
+
+    CachedGeneration.objects.filter(created_at__lt=_expiry_cutoff()).delete()
+    max_entries = getattr(settings, 'ASSET_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+    stale = (CachedGeneration.objects.order_by('-last_used_at')
+             .values_list('pk', flat=True)[max_entries:])
+    CachedGeneration.objects.filter(pk__in=list(stale)).delete()
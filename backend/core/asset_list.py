@@ -0,0 +1,118 @@
+"""
+Paginated, cached asset listing for AssetListView.
+
+Assets are listed newest first in pages of ``limit``, continued with an
+opaque cursor encoding the last asset's (created_at, id). Only the listed
+columns are read, with .values().
+
+The list version is read from the assets themselves: their count, which
+changes when one is deleted, and the newest updated_at, which changes when
+one is saved. It serves as the ETag, with that updated_at as Last-Modified,
+so it stays the same across restarts and server processes while nothing
+changes, and unchanged libraries are answered with 304s. It also keys the
+cached JSON of each page, kept for ASSET_LIST_CACHE_TIMEOUT seconds.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage, storages
+from django.db.models import Count, Max
+from django.utils.encoding import filepath_to_uri
+
+from .models import ARAsset
+from .serializers import variant_urls
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+DEFAULT_CACHE_TIMEOUT = 300  # seconds serialized pages are kept
+
+LIST_FIELDS = ('id', 'name', 'asset_type', 'anchor', 'file', 'scale', 'position_offset',
+               'rotation_offset', 'variants', 'created_at')
+
+EMPTY_LIST_MODIFIED = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def list_version():
+    """(version, last modified) of the asset list"""
+    state = ARAsset.objects.aggregate(count=Count('id'), modified=Max('updated_at'))
+    modified = state['modified'] or EMPTY_LIST_MODIFIED
+    return f"{state['count']}-{int(modified.timestamp() * 1_000_000):x}", modified
+
+
+def encode_cursor(created_at, asset_id):
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{asset_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Raises ValueError for a malformed cursor."""
+    try:
+        created_at, asset_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), uuid.UUID(asset_id)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def _url_builder():
+    """storage.url for file names, skipping its urljoin for local files"""
+    storage = storages['default']
+    if isinstance(storage, FileSystemStorage):
+        base_url = storage.base_url
+        return lambda name: base_url + filepath_to_uri(name)
+    return storage.url
+
+
+def _absolute(origin, url):
+    # Same as build_absolute_uri, without re-parsing the request per row
+    return origin + url if url.startswith('/') else url
+
+
+def _row_data(row, origin, file_url):
+    url = file_url(row['file']) if row['file'] else ''
+    return {
+        'id': str(row['id']),
+        'name': row['name'],
+        'asset_type': row['asset_type'],
+        'anchor': row['anchor'],
+        'file_url': _absolute(origin, url),
+        'variants': variant_urls(row['variants'], lambda name: _absolute(origin, file_url(name))),
+        'scale': row['scale'],
+        'position_offset': row['position_offset'],
+        'rotation_offset': row['rotation_offset'],
+        'created_at': row['created_at'].isoformat(),
+    }
+
+
+def render_page(origin, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """JSON for one page: {'assets': [...], 'next_cursor': ... or None}"""
+    queryset = ARAsset.objects.order_by('-created_at', '-id').values(*LIST_FIELDS)
+    if cursor is not None:
+        created_at, asset_id = cursor
+        # (created_at, id) < cursor, phrased so the index is searched from
+        # the cursor rather than scanned from the start
+        queryset = (queryset.filter(created_at__lte=created_at)
+                    .exclude(created_at=created_at, id__gte=asset_id))
+    # One extra row tells whether there is a next page
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    file_url = _url_builder()
+    return json.dumps({'assets': [_row_data(row, origin, file_url) for row in rows],
+                       'next_cursor': next_cursor})
+
+
+def cached_page(version, origin, cursor_param, limit):
+    """render_page() output for the current list version, from the cache when possible"""
+    key = f'assets:page:{version}:{origin}:{cursor_param or ""}:{limit}'
+    body = cache.get(key)
+    if body is None:
+        cursor = decode_cursor(cursor_param) if cursor_param else None
+        body = render_page(origin, cursor, limit)
+        cache.set(key, body, getattr(settings, 'ASSET_LIST_CACHE_TIMEOUT',
+                                     DEFAULT_CACHE_TIMEOUT))
+    return body
@@ -0,0 +1,48 @@
+"""
+Thread pools for background work outside the request cycle (asset
+generation in core.jobs, asset variants in core.ingest).
+
+Each pool is created on first use with the worker count read from its
+setting, and every task closes its thread's database connections when it
+finishes. shutdown_pools() is called from the ASGI lifespan shutdown in
+base/asgi.py.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def _get_pool(name, workers_setting, default_workers):
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            workers = getattr(settings, workers_setting, default_workers)
+            pool = _pools[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        return pool
+
+
+def _call(fn, args):
+    try:
+        return fn(*args)
+    finally:
+        # Pool threads outlive requests, so clean up their connections here
+        close_old_connections()
+
+
+def submit(name, workers_setting, default_workers, fn, *args):
+    """Run ``fn(*args)`` on the pool called ``name``; returns its Future."""
+    return _get_pool(name, workers_setting, default_workers).submit(_call, fn, args)
+
+
+def shutdown_pools():
+    """Stop all pools; queued tasks are dropped, running ones finish."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
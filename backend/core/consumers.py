@@ -2,71 +2,132 @@ import logging
 import json
 import base64
 import asyncio
-import cv2
-import numpy as np
-import os
-import mediapipe as mp
+import math
+import time
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
+from django.conf import settings
+from . import metrics
+from .decoding import IDENTITY, FrameDecoder
+from .detectors import VideoStream
+from .expressions import ExpressionTracker
+from .inference import InferenceBusy, get_backend
+from .jobs import FINISHED_JOB_STATUSES, get_job, job_group, job_timeout
+from .landmarks import round_landmarks, unletterbox
+from .pipeline import MODE_KINDS, get_expression_rules
+from .protocol import (
+    MODES, RESULT_DELTA, RESULT_FORMATS, RESULT_JSON, SUBPROTOCOL, ProtocolError, decode_image,
+    DEFAULT_DELTA_THRESHOLD, DEFAULT_KEYFRAME_INTERVAL, LANDMARK_KEYS, DeltaEncoder,
+    encode_json_results, pack_results, parse_frame,
+)
+from .quality import DEFAULT_LADDER, DEFAULT_TARGET_LATENCY_MS, ResolutionController
+from .roi import DEFAULT_MARGIN, DEFAULT_MIN_SIZE, DEFAULT_REDETECT_INTERVAL, RoiTracker
+from .serializers import job_data
+from .smoothing import DEFAULT_BETA, DEFAULT_MAX_PREDICTION_MS, DEFAULT_MIN_CUTOFF, LandmarkSmoother
 
 logger = logging.getLogger(__name__)
 
-# Calculate paths relative to the project root
-CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.dirname(os.path.dirname(CURRENT_DIR))
-MODELS_DIR = os.path.join(PROJECT_ROOT, 'models')
-
-# Processing constants
+# Processing constants: default inference size, and the JPEG quality
+# suggested to clients that negotiate their input resolution
 MAX_IMAGE_WIDTH = 160
 MAX_IMAGE_HEIGHT = 120
 JPEG_QUALITY = 0.3
 
+# Generation job watchers re-read the job this often, in case a push is lost
+ASSET_JOB_POLL_SECONDS = 5
+
+# Adaptive pacing: smoothing factor for the per-stream latency average, and
+# the default share of wall time one stream may keep an inference worker busy
+LATENCY_EWMA_ALPHA = 0.2
+DEFAULT_MAX_DUTY_CYCLE = 0.5
+
+
+def _usable_timestamp(value):
+    """Whether a client's capture time is a finite, non-zero number of milliseconds"""
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and math.isfinite(value) and value != 0)
+
 
 class VideoConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        await self.accept()
-        logger.info("WebSocket Connected: AI Stream")
-        self.mode = 'combined'
-        self.processing = False  # Flag to skip frames when busy
-        self.frame_count = 0
-        self.skip_frames = 2  # Process every Nth frame
-
-        # Initialize Models
-        self.hand_detector = None
-        self.face_detector = None
-        
-        # Init Hand Detector
-        hand_model = os.path.join(MODELS_DIR, "gesture_recognizer.task")
-        if os.path.exists(hand_model):
-            base_options_hand = python.BaseOptions(model_asset_path=hand_model)
-            options_hand = vision.GestureRecognizerOptions(
-                base_options=base_options_hand,
-                running_mode=vision.RunningMode.IMAGE,
-                num_hands=2)
-            self.hand_detector = vision.GestureRecognizer.create_from_options(options_hand)
-            logger.info("Hand detector initialized")
-        
-        # Init Face Detector
-        face_model = os.path.join(MODELS_DIR, "face_landmarker.task")
-        if os.path.exists(face_model):
-            base_options_face = python.BaseOptions(model_asset_path=face_model)
-            options_face = vision.FaceLandmarkerOptions(
-                base_options=base_options_face,
-                running_mode=vision.RunningMode.IMAGE,
-                num_faces=1,
-                output_face_blendshapes=True)
-            self.face_detector = vision.FaceLandmarker.create_from_options(options_face)
-            logger.info("Face detector initialized")
+        # Clients opt into binary frames through the WebSocket subprotocol
+        if SUBPROTOCOL in self.scope.get('subprotocols', []):
+            self.protocol = 'binary'
+            await self.accept(SUBPROTOCOL)
+        else:
+            self.protocol = 'json'
+            await self.accept()
+        logger.info(f"WebSocket Connected: AI Stream ({self.protocol})")
+        metrics.connections_active.inc()
+        # Clients may pick the mode up front (ws/detection/?mode=face), so the
+        # first frames only touch that mode's models
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.mode = query.get('mode', ['combined'])[0]
+        if self.mode not in MODE_KINDS:
+            self.mode = 'combined'
+        self.result_format = RESULT_JSON
+        self.send_blendshapes = False
+        self.expressions = ExpressionTracker(get_expression_rules())
+        self.delta = DeltaEncoder(
+            keyframe_interval=getattr(settings, 'RESULT_KEYFRAME_INTERVAL',
+                                      DEFAULT_KEYFRAME_INTERVAL),
+            threshold=getattr(settings, 'RESULT_DELTA_THRESHOLD', DEFAULT_DELTA_THRESHOLD))
+
+        # Input resolution, adapted to measured latency and detection dropouts
+        self.resolution = ResolutionController(
+            ladder=getattr(settings, 'INPUT_RESOLUTION_LADDER', DEFAULT_LADDER),
+            start=getattr(settings, 'INPUT_RESOLUTION', (MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT)),
+            ceiling=getattr(settings, 'INPUT_MAX_RESOLUTION', None),
+            target_latency_ms=getattr(settings, 'INPUT_TARGET_LATENCY_MS',
+                                      DEFAULT_TARGET_LATENCY_MS),
+            adaptive=getattr(settings, 'INPUT_ADAPTIVE', True))
+        self.resolution_negotiated = False
+        self.decoder = FrameDecoder(*self.resolution.size)
+
+        # Crop frames around the previous frame's landmarks
+        self.roi = None
+        if getattr(settings, 'ROI_CROPPING', True):
+            self.roi = RoiTracker(
+                margin=getattr(settings, 'ROI_MARGIN', DEFAULT_MARGIN),
+                min_size=getattr(settings, 'ROI_MIN_SIZE', DEFAULT_MIN_SIZE),
+                redetect_interval=getattr(settings, 'ROI_REDETECT_INTERVAL',
+                                          DEFAULT_REDETECT_INTERVAL))
+
+        # Landmark smoothing; skipped frames get results predicted from it
+        self.smoother = None
+        if getattr(settings, 'LANDMARK_SMOOTHING', True):
+            self.smoother = LandmarkSmoother(
+                min_cutoff=getattr(settings, 'LANDMARK_SMOOTHING_MIN_CUTOFF', DEFAULT_MIN_CUTOFF),
+                beta=getattr(settings, 'LANDMARK_SMOOTHING_BETA', DEFAULT_BETA),
+                max_prediction_ms=getattr(settings, 'LANDMARK_MAX_PREDICTION_MS',
+                                          DEFAULT_MAX_PREDICTION_MS))
+
+        # Single-slot mailbox: newer frames replace any frame still waiting
+        self.mailbox = None
+        self.mailbox_ready = asyncio.Event()
+        self.frames_superseded = 0
+        self.latency_ewma = None
+        self.max_duty_cycle = getattr(settings, 'STREAM_MAX_DUTY_CYCLE', DEFAULT_MAX_DUTY_CYCLE)
+        self.worker = asyncio.create_task(self._run_mailbox())
+
+        # Per-stream VIDEO-mode tracking (falls back to IMAGE mode per frame)
+        self.stream = None
+        if getattr(settings, 'VIDEO_TRACKING', True) and get_backend().supports_streams:
+            self.stream = VideoStream()
 
     async def disconnect(self, close_code):
-        if self.hand_detector:
-            self.hand_detector.close()
-        if self.face_detector:
-            self.face_detector.close()
+        self.worker.cancel()
+        if self.stream is not None:
+            self.stream.close()
+        metrics.connections_active.dec()
         logger.info("WebSocket Disconnected")
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            await self._receive_binary(bytes_data)
+            return
+
         try:
             data = json.loads(text_data)
         except json.JSONDecodeError:
@@ -74,111 +135,278 @@ class VideoConsumer(AsyncWebsocketConsumer):
         
         # Handle Configuration Updates
         if 'config' in data:
-            self.mode = data['config'].get('mode', 'combined')
-            logger.info(f"Switched mode to: {self.mode}")
+            config = data['config']
+            if 'mode' in config:
+                if config['mode'] not in MODE_KINDS:
+                    await self._send_error(f"Unknown mode {config['mode']!r}")
+                    return
+                self._set_mode(config['mode'])
+            if config.get('results') in RESULT_FORMATS:
+                self.result_format = config['results']
+                self.delta.reset()
+                logger.info(f"Switched result format to: {self.result_format}")
+            if 'blendshapes' in config:
+                self.send_blendshapes = bool(config['blendshapes'])
+            if config.get('keyframe'):
+                # Client lost track of delta results
+                self.delta.reset()
+            if 'resolution' in config or 'adaptive' in config:
+                try:
+                    size = self.resolution.negotiate(config.get('resolution'),
+                                                     config.get('adaptive'))
+                except ValueError as e:
+                    await self._send_error(str(e))
+                    return
+                self.decoder.set_size(*size)
+                self.resolution_negotiated = True
+                await self._send_input_config()
             return
 
-        # Skip if still processing previous frame
-        if self.processing:
+        # Expecting 'image' key with base64 data
+        if 'image' not in data:
             return
 
-        # Frame skipping for performance
-        self.frame_count += 1
-        if self.frame_count % self.skip_frames != 0:
+        await self._post(None, data['image'], data.get('timestamp'))
+
+    async def _receive_binary(self, bytes_data):
+        """Handle a binary frame (see core.protocol for the layout)"""
+        try:
+            header, payload = parse_frame(bytes_data)
+        except ProtocolError as e:
+            logger.warning(f"Dropping binary frame: {e}")
             return
 
-        # Expecting 'image' key with base64 data
-        if 'image' not in data:
+        mode = MODES.get(header.mode)
+        if mode and mode != self.mode:
+            self._set_mode(mode)
+
+        await self._post(header, payload, header.timestamp_ms)
+
+    def _set_mode(self, mode):
+        self.mode = mode
+        logger.info(f"Switched mode to: {self.mode}")
+        if self.roi is not None:
+            # Newly enabled models need to search the full frame
+            self.roi.reset()
+            self.decoder.set_crop(None)
+
+    async def _post(self, header, payload, capture_ms=None):
+        """Put a frame in the mailbox; frames are decoded only once picked up"""
+        metrics.frames_received.inc()
+        if not _usable_timestamp(capture_ms):
+            # Client sent no capture time (or not a number), use the arrival time instead
+            capture_ms = asyncio.get_running_loop().time() * 1000
+        superseded, self.mailbox = self.mailbox, (header, payload, capture_ms)
+        self.mailbox_ready.set()
+        if superseded is not None:
+            self.frames_superseded += 1
+            metrics.frames_superseded.inc()
+            await self._send_prediction(superseded[0], superseded[2])
+
+    async def _send_prediction(self, header, capture_ms):
+        """Answer a frame that won't be processed with extrapolated landmarks"""
+        if self.smoother is None:
             return
+        results = self.smoother.predict(capture_ms)
+        if results is not None:
+            metrics.frames_predicted.inc()
+            await self._send_results(results, header)
 
-        self.processing = True
-        try:
-            # Decode Image
-            image_data = base64.b64decode(data['image'].split(',')[1])
-            np_arr = np.frombuffer(image_data, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-            
-            if frame is None:
-                return
+    async def _run_mailbox(self):
+        """Process the newest frame whenever the previous one has finished"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.mailbox_ready.wait()
+            self.mailbox_ready.clear()
+            header, payload, capture_ms = self.mailbox
+            self.mailbox = None
 
-            # Resize for faster processing
-            frame = cv2.resize(frame, (MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT))
-            
-            # Process in thread pool to avoid blocking
-            results = await asyncio.to_thread(self._process_frame, frame)
-            
-            await self.send(text_data=json.dumps(results))
-            
-        except Exception as e:
-            logger.error(f"Processing error: {e}")
-        finally:
-            self.processing = False
-
-    def _process_frame(self, frame):
-        """Synchronous processing - runs in thread pool"""
-        # Convert to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        results = {
-            'gestures': [],
-            'expressions': [],
-            'hand_landmarks': [],
-            'face_landmarks': []
-        }
-
-        # Process Hand - create fresh mp.Image for hand detector
-        if self.hand_detector and self.mode in ['combined', 'hands']:
+            start = loop.time()
             try:
-                mp_image_hand = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame.copy())
-                hand_result = self.hand_detector.recognize(mp_image_hand)
-                if hand_result.gestures:
-                    for gestures in hand_result.gestures:
-                        if gestures:
-                            gesture = gestures[0]
-                            results['gestures'].append({
-                                'name': gesture.category_name,
-                                'score': round(gesture.score, 4)
-                            })
-                
-                if hand_result.hand_landmarks:
-                    for hand_lms in hand_result.hand_landmarks:
-                        landmarks = [{'x': round(lm.x, 4), 'y': round(lm.y, 4), 'z': round(lm.z, 4)} for lm in hand_lms]
-                        results['hand_landmarks'].append(landmarks)
+                frame = self._decode(header, payload)
+                await self._handle_frame(frame, header, capture_ms)
             except Exception as e:
-                logger.error(f"Hand detection error: {e}")
+                logger.error(f"Processing error: {e}")
+            elapsed = loop.time() - start
+            metrics.observe('frame', elapsed)
 
-        # Process Face - create fresh mp.Image for face detector
-        if self.face_detector and self.mode in ['combined', 'face']:
-            try:
-                mp_image_face = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame.copy())
-                face_result = self.face_detector.detect(mp_image_face)
-                
-                # Expressions
-                if face_result.face_blendshapes:
-                    blendshapes = face_result.face_blendshapes[0]
-                    
-                    def get_score(name):
-                        for b in blendshapes:
-                            if b.category_name == name:
-                                return b.score
-                        return 0.0
-
-                    if get_score('mouthSmileLeft') > 0.5 and get_score('mouthSmileRight') > 0.5:
-                        results['expressions'].append("Smiling")
-                    if get_score('eyeBlinkLeft') > 0.5:
-                        results['expressions'].append("Left Wink")
-                    if get_score('eyeBlinkRight') > 0.5:
-                        results['expressions'].append("Right Wink")
-                    if get_score('jawOpen') > 0.3:
-                        results['expressions'].append("Mouth Open")
-                
-                # Landmarks
-                if face_result.face_landmarks:
-                    for face_lms in face_result.face_landmarks:
-                        landmarks = [{'x': round(lm.x, 4), 'y': round(lm.y, 4), 'z': round(lm.z, 4)} for lm in face_lms]
-                        results['face_landmarks'].append(landmarks)
-            except Exception as e:
-                logger.error(f"Face detection error: {e}")
+            if self.latency_ewma is None:
+                self.latency_ewma = elapsed
+            else:
+                self.latency_ewma += LATENCY_EWMA_ALPHA * (elapsed - self.latency_ewma)
+
+            # Adaptive skipping: while every worker is busy, rest in proportion
+            # to the measured latency so a stream keeps a worker busy at most
+            # max_duty_cycle of the time. Frames arriving meanwhile only
+            # replace the mailbox contents. With a worker free, the next frame
+            # goes straight in.
+            backend = get_backend()
+            if self.max_duty_cycle < 1 and backend.pending >= backend.workers:
+                await asyncio.sleep(self.latency_ewma * (1 / self.max_duty_cycle - 1))
+
+    def _decode(self, header, payload):
+        """Decode to an RGB frame at the inference size"""
+        if header is None:
+            # Legacy JSON frame: base64 data URL
+            with metrics.timer('base64'):
+                data = base64.b64decode(payload.split(',')[1])
+            return self.decoder.decode(data)
+        return decode_image(header, payload, self.decoder)
+
+    async def _send_error(self, message):
+        await self.send(text_data=json.dumps({'error': message}))
 
-        return results
+    async def _send_input_config(self):
+        """Tell a negotiating client which input size and quality to send"""
+        await self.send(text_data=json.dumps({'config': {
+            'resolution': list(self.resolution.size),
+            'max_resolution': list(self.resolution.max_size),
+            'adaptive': self.resolution.adaptive,
+            'jpeg_quality': JPEG_QUALITY,
+        }}))
 
+    async def _handle_frame(self, frame, header=None, capture_ms=0.0):
+        if frame is None:
+            return
+        transform = self.decoder.transform
+        if self.stream is not None:
+            # Tracked regions don't carry over when the crop moves
+            self.stream.set_geometry(transform)
+
+        # Run inference on the dedicated worker pool, off the event loop
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            results = await get_backend().process(frame, self.mode, self.stream, capture_ms)
+        except InferenceBusy:
+            metrics.frames_dropped_busy.inc()
+            logger.debug("Inference queue full, dropping frame")
+            return
+        inference_ms = (loop.time() - start) * 1000
+        metrics.observe('inference', inference_ms / 1000)
+        for stage in ('hand', 'face'):
+            if f'{stage}_ms' in results['timings']:
+                metrics.observe(stage, results['timings'][f'{stage}_ms'] / 1000)
+
+        # Map letterboxed landmarks back to the client's frame
+        if transform != IDENTITY:
+            for key in LANDMARK_KEYS:
+                for landmarks in results[key]:
+                    unletterbox(landmarks, transform)
+
+        if self.roi is not None:
+            landmarks = [points for key in LANDMARK_KEYS for points in results[key]]
+            self.decoder.set_crop(self.roi.update(landmarks))
+
+        detected = any(results[key] for key in LANDMARK_KEYS)
+        new_size = self.resolution.update(inference_ms, detected)
+        if new_size is not None:
+            logger.info(f"Input resolution changed to {new_size[0]}x{new_size[1]}")
+            self.decoder.set_size(*new_size)
+            if self.resolution_negotiated:
+                await self._send_input_config()
+
+        if self.smoother is not None:
+            self.smoother.update(results, capture_ms)
+
+        # Re-classify with this stream's hysteresis
+        scores = results.pop('blendshapes', None)
+        if scores is None:
+            self.expressions.reset()
+        else:
+            results['expressions'] = self.expressions.update(scores)
+            if self.send_blendshapes:
+                results['blendshapes'] = round_landmarks(scores).tolist()
+
+        await self._send_results(results, header)
+
+    async def _send_results(self, results, header):
+        sequence = header.sequence if header is not None else 0
+        timestamp_ms = header.timestamp_ms if header is not None else 0.0
+
+        with metrics.timer('serialize'):
+            if self.result_format == RESULT_DELTA:
+                message = self.delta.pack(results, sequence, timestamp_ms)
+            elif self.result_format != RESULT_JSON:
+                message = pack_results(results, self.result_format, sequence, timestamp_ms)
+            else:
+                # Echo the client's sequence number so results can be matched to frames
+                if header is not None:
+                    results['seq'] = sequence
+                    results['timestamp'] = timestamp_ms
+                message = encode_json_results(results)
+        if message is None:
+            # Delta format, nothing changed since the last message
+            metrics.results_unchanged.inc()
+            return
+
+        with metrics.timer('send'):
+            if isinstance(message, str):
+                await self.send(text_data=message)
+            else:
+                await self.send(bytes_data=message)
+        metrics.results_sent.inc()
+
+
+_load_job = database_sync_to_async(get_job)
+
+
+class GenerationJobConsumer(AsyncWebsocketConsumer):
+    """Sends a generation job's status whenever it changes, closing once it finishes.
+
+    Changes are pushed by core.jobs over the channel layer; the job is also
+    re-read every ASSET_JOB_POLL_SECONDS in case a notification is lost (the
+    in-memory layer can't deliver them from the job threads at all).
+    """
+
+    async def connect(self):
+        self.job_id = self.scope['url_route']['kwargs']['job_id']
+        self.group = job_group(self.job_id)
+        self.status = None
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+        # Joined before reading, so a job finishing meanwhile is still seen
+        await self._send_status()
+        self.poller = asyncio.create_task(self._poll())
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'poller', None) is not None:
+            self.poller.cancel()
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def job_finished(self, event):
+        await self._send_status()
+
+    async def _poll(self):
+        interval = getattr(settings, 'ASSET_JOB_POLL_SECONDS', ASSET_JOB_POLL_SECONDS)
+        # By then get_job() has failed the job; this only guards against it not being saved
+        deadline = time.monotonic() + job_timeout() + interval
+        while self.status not in FINISHED_JOB_STATUSES:
+            if time.monotonic() > deadline:
+                await self.send(text_data=json.dumps({'error': 'Timed out waiting for the job'}))
+                await self.close()
+                return
+            await asyncio.sleep(interval)
+            await self._send_status()
+
+    def _build_url(self, path):
+        headers = dict(self.scope.get('headers', ()))
+        host = headers.get(b'host', b'').decode()
+        scheme = 'https' if self.scope.get('scheme') == 'wss' else 'http'
+        return f"{scheme}://{host}{path}" if host else path
+
+    async def _send_status(self):
+        if self.status in FINISHED_JOB_STATUSES:
+            return
+        job = await _load_job(self.job_id)
+        if job is None:
+            self.status = 'FAILED'
+            await self.send(text_data=json.dumps({'error': 'Job not found'}))
+            await self.close()
+            return
+        if job.status == self.status:
+            return
+        self.status = job.status
+        await self.send(text_data=json.dumps({'job': job_data(job, self._build_url)}))
+        if job.status in FINISHED_JOB_STATUSES:
+            await self.close()
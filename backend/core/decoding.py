@@ -0,0 +1,150 @@
+"""
+Per-connection frame decoding.
+
+Turns JPEG/WebP bytes or raw RGB pixels into an RGB frame at the inference
+size with as few full-frame allocations as possible:
+
+- JPEG/WebP are decoded at a reduced scale (IMREAD_REDUCED_COLOR_*) chosen
+  from the stream's source size, so the codec does most of the downscaling;
+- decoding goes straight to RGB where OpenCV supports IMREAD_COLOR_RGB,
+  otherwise the small output frame is converted in place;
+- the final resize writes into a buffer reused across the connection's
+  frames (the consumer only has one frame in flight at a time).
+
+Frames whose aspect ratio differs from the inference size are letterboxed
+(scaled to fit and padded) rather than stretched. Frames can also be
+cropped to a region of interest first (see core.roi), so the region is
+seen at a higher effective resolution. ``transform`` describes where the
+source sits in the frame so landmarks can be mapped back to source
+coordinates with core.landmarks.unletterbox.
+"""
+import cv2
+import numpy as np
+
+from . import metrics
+
+_RGB_FLAG = getattr(cv2, 'IMREAD_COLOR_RGB', None)
+
+# Normalized (scale_x, scale_y, offset_x, offset_y) of the content in the frame
+IDENTITY = (1.0, 1.0, 0.0, 0.0)
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _decode_flags(reduction):
+    flags = _REDUCED_FLAGS[reduction]
+    if _RGB_FLAG is not None:
+        flags = (flags & ~cv2.IMREAD_COLOR) | _RGB_FLAG
+    return flags
+
+
+class FrameDecoder:
+    def __init__(self, width, height):
+        self._source_size = None  # learned from the previous frame
+        self.crop = None
+        self.set_size(width, height)
+
+    def set_size(self, width, height):
+        """Change the inference size (takes effect from the next frame)."""
+        self.width = width
+        self.height = height
+        self._buffer = np.zeros((height, width, 3), np.uint8)
+        self._layout = None
+        self.transform = IDENTITY
+
+    def set_crop(self, region):
+        """Crop frames to ``region`` (normalized x0, y0, x1, y1), or None for the full frame."""
+        self.crop = region
+
+    def _crop_box(self, width, height):
+        """Pixel box of the crop, widened to the inference aspect ratio within the image"""
+        x0, y0, x1, y1 = self.crop
+        crop_width = (x1 - x0) * width
+        crop_height = (y1 - y0) * height
+        center_x = (x0 + x1) / 2 * width
+        center_y = (y0 + y1) / 2 * height
+
+        # Grow the short side so no inference pixels are spent on padding
+        aspect = self.width / self.height
+        crop_width = min(width, max(crop_width, crop_height * aspect))
+        crop_height = min(height, max(crop_height, crop_width / aspect))
+
+        left = round(min(max(0, center_x - crop_width / 2), width - crop_width))
+        top = round(min(max(0, center_y - crop_height / 2), height - crop_height))
+        return (left, top,
+                min(width, left + max(1, round(crop_width))),
+                min(height, top + max(1, round(crop_height))))
+
+    def _content_size(self, source_width, source_height):
+        scale = min(self.width / source_width, self.height / source_height)
+        return (max(1, min(self.width, round(source_width * scale))),
+                max(1, min(self.height, round(source_height * scale))))
+
+    def _reduction(self):
+        if self._source_size is None:
+            return 1
+        source_width, source_height = self._source_size
+        if self.crop is not None:
+            # Only the cropped part needs to reach the inference size
+            x0, y0, x1, y1 = self._crop_box(source_width, source_height)
+            source_width, source_height = x1 - x0, y1 - y0
+        content_width, content_height = self._content_size(source_width, source_height)
+        for reduction in (8, 4, 2):
+            if (source_width // reduction >= content_width
+                    and source_height // reduction >= content_height):
+                return reduction
+        return 1
+
+    def decode(self, data):
+        """Decode JPEG/WebP bytes (any buffer) to an RGB frame, or None."""
+        reduction = self._reduction()
+        with metrics.timer('imdecode'):
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), _decode_flags(reduction))
+        if image is None:
+            return None
+        height, width = image.shape[:2]
+        self._source_size = (width * reduction, height * reduction)
+        return self._fit(image, is_rgb=_RGB_FLAG is not None)
+
+    def from_rgb(self, image):
+        """Fit an RGB image (e.g. a zero-copy view of a raw frame) to the inference size."""
+        return self._fit(image, is_rgb=True)
+
+    def _fit(self, image, is_rgb):
+        height, width = image.shape[:2]
+        if self.crop is None and (height, width) == (self.height, self.width):
+            frame = image
+            self.transform = IDENTITY
+        else:
+            crop_left, crop_top = 0, 0
+            if self.crop is not None:
+                crop_left, crop_top, crop_right, crop_bottom = self._crop_box(width, height)
+                image = image[crop_top:crop_bottom, crop_left:crop_right]
+            image_height, image_width = image.shape[:2]
+
+            content_width, content_height = self._content_size(image_width, image_height)
+            left = (self.width - content_width) // 2
+            top = (self.height - content_height) // 2
+            layout = (content_width, content_height, left, top)
+            if layout != self._layout:
+                # Clear old content out of the padding when the geometry changes
+                self._buffer[...] = 0
+                self._layout = layout
+            content = self._buffer[top:top + content_height, left:left + content_width]
+            with metrics.timer('resize'):
+                cv2.resize(image, (content_width, content_height), dst=content)
+            frame = self._buffer
+            scale_x = content_width / image_width
+            scale_y = content_height / image_height
+            self.transform = (width * scale_x / self.width, height * scale_y / self.height,
+                              (left - crop_left * scale_x) / self.width,
+                              (top - crop_top * scale_y) / self.height)
+        if not is_rgb:
+            with metrics.timer('color'):
+                cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+        return frame
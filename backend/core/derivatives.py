@@ -0,0 +1,70 @@
+"""
+Resized, re-encoded copies of 2D assets.
+
+Overlays are drawn at a few hundred pixels and the asset panel shows small
+tiles, yet generated assets are 1024px PNGs. render_variants() produces,
+for each named size, the image scaled down to fit it (never up) and
+encoded in each of the given formats: WebP and AVIF keep the alpha channel
+at a fraction of the PNG's size. Formats this Pillow build can't write are
+skipped.
+
+core.ingest stores the results and records them on the asset.
+"""
+import hashlib
+import io
+
+from PIL import Image, ImageOps, features
+
+DEFAULT_SIZES = {'thumb': 128, 'small': 512, 'large': 1024}  # longest side, pixels
+DEFAULT_FORMATS = ('webp', 'avif')
+DEFAULT_QUALITY = {'webp': 80, 'avif': 60}
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(file):
+    """SHA-256 hex digest of a file object's contents, read from the start."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def supported_formats(formats):
+    return [fmt for fmt in formats if features.check(fmt)]
+
+
+def _prepare(image):
+    """Upright RGB or RGBA copy of ``image``, ready for resizing"""
+    image = ImageOps.exif_transpose(image)
+    has_alpha = (image.mode in ('RGBA', 'LA', 'PA')
+                 or (image.mode == 'P' and 'transparency' in image.info))
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def render_variants(image, sizes=None, formats=DEFAULT_FORMATS, quality=None):
+    """Encode ``image`` (a PIL image) at each size and format.
+
+    Returns {name: {'width': w, 'height': h, fmt: bytes, ...}}.
+    """
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    quality = {**DEFAULT_QUALITY, **(quality or {})}
+    formats = supported_formats(formats)
+    source = _prepare(image)
+
+    variants = {}
+    # Largest first, each resized from the previous one: cheaper than going
+    # back to the original every time, and LANCZOS keeps the detail
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        resized = source.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        source = resized
+        variant = {'width': resized.width, 'height': resized.height}
+        for fmt in formats:
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), quality=quality.get(fmt, 80))
+            variant[fmt] = buffer.getvalue()
+        variants[name] = variant
+    return variants
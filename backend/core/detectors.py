@@ -0,0 +1,425 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import mediapipe as mp
+import numpy as np
+from django.conf import settings
+from mediapipe.tasks import python
+from mediapipe.tasks.python import vision
+
+logger = logging.getLogger(__name__)
+
+# Calculate paths relative to the project root
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(CURRENT_DIR))
+MODELS_DIR = os.path.join(PROJECT_ROOT, 'models')
+
+HAND_MODEL = 'gesture_recognizer.task'
+FACE_MODEL = 'face_landmarker.task'
+
+# Pool defaults, overridable from Django settings
+DEFAULT_POOL_SIZE = 2
+DEFAULT_POOL_TIMEOUT = 1.0
+DEFAULT_VIDEO_POOL_SIZE = 4
+DEFAULT_MAX_FRAME_GAP_MS = 500
+DEFAULT_IDLE_TIMEOUT = 600.0  # seconds before an unused pooled detector is closed
+DEFAULT_LEASE_IDLE_SECONDS = 5.0  # seconds before a stream returns a detector it stopped using
+LEASE_RETRY_SECONDS = 5.0
+
+
+class DetectorPoolTimeout(Exception):
+    """Raised when no detector could be checked out within the timeout."""
+
+
+def _create_hand_detector(running_mode):
+    base_options = python.BaseOptions(model_asset_path=os.path.join(MODELS_DIR, HAND_MODEL))
+    options = vision.GestureRecognizerOptions(
+        base_options=base_options,
+        running_mode=running_mode,
+        num_hands=2)
+    return vision.GestureRecognizer.create_from_options(options)
+
+
+def _create_face_detector(running_mode):
+    base_options = python.BaseOptions(model_asset_path=os.path.join(MODELS_DIR, FACE_MODEL))
+    options = vision.FaceLandmarkerOptions(
+        base_options=base_options,
+        running_mode=running_mode,
+        num_faces=1,
+        output_face_blendshapes=True)
+    return vision.FaceLandmarker.create_from_options(options)
+
+
+# kind -> (model file, factory)
+DETECTORS = {
+    'hand': (HAND_MODEL, _create_hand_detector),
+    'face': (FACE_MODEL, _create_face_detector),
+}
+
+
+class DetectorPool:
+    """Bounded pool of detectors sharing the same model and options.
+
+    Detectors are created lazily up to ``size`` and handed out one caller at
+    a time, so memory grows with the pool size rather than with the number of
+    open connections. Detectors left idle for ``idle_timeout`` seconds are
+    closed, so models of modes nobody uses stop taking memory.
+    """
+
+    def __init__(self, kind, running_mode, size, idle_timeout=None):
+        self.kind = kind
+        self.running_mode = running_mode
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._factory = DETECTORS[kind][1]
+        self._idle = []  # (detector, released at), most recently released last
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+
+        # Wait time metrics
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.evicted = 0
+
+    @property
+    def key(self):
+        return (self.kind, self.running_mode.name)
+
+    def _create(self):
+        """Create a detector in a slot already reserved by the caller"""
+        try:
+            detector = self._factory(self.running_mode)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+                self._available.notify()
+            raise
+        logger.info(f"Created {self.kind} detector "
+                    f"({self._created}/{self.size}, {self.running_mode.name})")
+        return detector
+
+    def warm_up(self, count=None):
+        """Pre-create detectors so the first connections skip model loading."""
+        count = self.size if count is None else min(count, self.size)
+        while True:
+            with self._lock:
+                if self._created >= count:
+                    return
+                self._created += 1
+            detector = self._create()
+            self.release(detector)
+
+    def acquire(self, timeout=None):
+        if timeout is None:
+            timeout = getattr(settings, 'DETECTOR_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)
+        start = time.perf_counter()
+        with self._lock:
+            # Wait for an idle detector or a free slot to create one in
+            if not self._available.wait_for(
+                    lambda: self._idle or self._created < self.size, timeout):
+                self.timeouts += 1
+                raise DetectorPoolTimeout(f"No {self.kind} detector free after {timeout}s")
+            if self._idle:
+                detector = self._idle.pop()[0]
+            else:
+                self._created += 1
+                detector = None
+        if detector is None:
+            detector = self._create()
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return detector
+
+    def release(self, detector):
+        with self._lock:
+            self._idle.append((detector, time.monotonic()))
+            self._available.notify()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        detector = self.acquire(timeout)
+        try:
+            yield detector
+        finally:
+            self.release(detector)
+
+    def evict_idle(self):
+        """Close detectors idle for longer than idle_timeout; returns how many."""
+        if not self.idle_timeout:
+            return 0
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            # The least recently released detectors come first
+            count = 0
+            while count < len(self._idle) and self._idle[count][1] < cutoff:
+                count += 1
+            expired, self._idle = self._idle[:count], self._idle[count:]
+            self._created -= count
+            self.evicted += count
+            if count:
+                self._available.notify(count)
+        for detector, _ in expired:
+            _video_timestamps.pop(id(detector), None)
+            detector.close()
+        if expired:
+            logger.info(f"Closed {len(expired)} idle {self.kind} detector(s) "
+                        f"({self.running_mode.name})")
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'kind': self.kind,
+                'running_mode': self.running_mode.name,
+                'size': self.size,
+                'created': self._created,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'evicted': self.evicted,
+                'wait_avg_ms': (round(self.wait_total / self.checkouts * 1000, 3)
+                                if self.checkouts else 0.0),
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+            }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for detector, _ in idle:
+            _video_timestamps.pop(id(detector), None)
+            detector.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_reaper = None
+
+
+def model_available(kind):
+    return os.path.exists(os.path.join(MODELS_DIR, DETECTORS[kind][0]))
+
+
+def get_pool(kind, running_mode=vision.RunningMode.IMAGE):
+    """Return the shared pool for ``kind``, or None if its model file is missing."""
+    key = (kind, running_mode.name)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+    if not model_available(kind):
+        return None
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if running_mode == vision.RunningMode.VIDEO:
+                size = getattr(settings, 'VIDEO_DETECTOR_POOL_SIZE', DEFAULT_VIDEO_POOL_SIZE)
+            else:
+                size = getattr(settings, 'DETECTOR_POOL_SIZE', DEFAULT_POOL_SIZE)
+            idle_timeout = getattr(settings, 'DETECTOR_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT)
+            pool = DetectorPool(kind, running_mode, size, idle_timeout)
+            _pools[key] = pool
+            if idle_timeout:
+                _start_reaper(idle_timeout)
+    return pool
+
+
+def _reap(interval):
+    while True:
+        time.sleep(interval)
+        for pool in list(_pools.values()):
+            try:
+                pool.evict_idle()
+            except Exception as e:
+                logger.error(f"Failed to close idle {pool.kind} detectors: {e}")
+
+
+def _start_reaper(idle_timeout):
+    """Start the thread closing idle detectors (called with _pools_lock held)"""
+    global _reaper
+    if _reaper is None:
+        _reaper = threading.Thread(target=_reap, args=(max(1.0, idle_timeout / 4),),
+                                   name='detector-reaper', daemon=True)
+        _reaper.start()
+
+
+# Last timestamp fed to each VIDEO-mode detector, kept across leases
+_video_timestamps = {}
+
+# Fed to a VIDEO-mode detector to make it drop its tracking state
+_BLANK_IMAGE = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.zeros((64, 64, 3), np.uint8))
+
+
+class VideoStream:
+    """VIDEO-mode detectors leased to a single stream.
+
+    In VIDEO mode MediaPipe tracks landmarks from frame to frame and only
+    re-runs palm/face detection when tracking is lost, but a detector must
+    see strictly increasing timestamps from one stream. Detectors are leased
+    from a bounded pool for the lifetime of the stream; detect() returns None
+    whenever the caller should fall back to IMAGE mode instead (no detector
+    free, or frames too far apart to track).
+
+    Tracking carries the previous frame's hand/face regions over, which is
+    wrong for a detector last used by another stream or after the frame
+    geometry changed (see set_geometry). Such detectors first see a blank
+    frame so they detect from scratch.
+
+    Detectors are leased on first use by a kind's model, and a detector the
+    stream stops using (e.g. after switching to a single-model mode) goes
+    back to the pool after ``lease_idle_seconds``.
+    """
+
+    def __init__(self, max_gap_ms=None, lease_idle_seconds=None):
+        if max_gap_ms is None:
+            max_gap_ms = getattr(settings, 'VIDEO_MAX_FRAME_GAP_MS', DEFAULT_MAX_FRAME_GAP_MS)
+        if lease_idle_seconds is None:
+            lease_idle_seconds = getattr(settings, 'VIDEO_LEASE_IDLE_SECONDS',
+                                         DEFAULT_LEASE_IDLE_SECONDS)
+        self.max_gap_ms = max_gap_ms
+        self.lease_idle_seconds = lease_idle_seconds
+        self._leases = {}  # kind -> (pool, detector)
+        self._last_used = {}  # kind -> monotonic time of the last detection
+        self._stale = set()  # kinds whose detector must drop its tracking state
+        self._geometry = None
+        self._lease_failed = {}  # kind -> monotonic time of last failed lease
+        self._client_ts = None
+        self._gap_ms = 1
+        self._tracking = False
+        self._lock = threading.Lock()
+        self._busy = False
+        self._closed = False
+
+    def set_geometry(self, geometry):
+        """Describe how frames map to the source (e.g. a crop transform)."""
+        if geometry != self._geometry:
+            self._geometry = geometry
+            self._stale.update(self._leases)
+
+    @contextmanager
+    def frame(self, timestamp_ms):
+        """Bracket one frame; detectors are not released while a frame runs."""
+        with self._lock:
+            if self._closed:
+                self._tracking = False
+                yield self
+                return
+            self._busy = True
+        try:
+            # close() leaves the leases alone while a frame runs
+            self._release_idle()
+            previous, self._client_ts = self._client_ts, timestamp_ms
+            if previous is None:
+                self._tracking, self._gap_ms = True, 1
+            else:
+                gap = timestamp_ms - previous
+                # Sporadic or out-of-order frames are processed in IMAGE mode
+                self._tracking = 0 < gap <= self.max_gap_ms
+                self._gap_ms = max(1, int(round(gap))) if self._tracking else 1
+            yield self
+        finally:
+            with self._lock:
+                self._busy = False
+                if self._closed:
+                    self._release_all()
+
+    def _lease(self, kind):
+        lease = self._leases.get(kind)
+        if lease is not None:
+            return lease[1]
+        failed_at = self._lease_failed.get(kind)
+        if failed_at is not None and time.monotonic() - failed_at < LEASE_RETRY_SECONDS:
+            return None
+
+        pool = get_pool(kind, vision.RunningMode.VIDEO)
+        if pool is None:
+            self._lease_failed[kind] = time.monotonic()
+            return None
+        try:
+            detector = pool.acquire(timeout=0)
+        except DetectorPoolTimeout:
+            self._lease_failed[kind] = time.monotonic()
+            return None
+        self._leases[kind] = (pool, detector)
+        self._stale.add(kind)
+        return detector
+
+    def _advance(self, detector):
+        timestamp = _video_timestamps.get(id(detector), 0) + self._gap_ms
+        _video_timestamps[id(detector)] = timestamp
+        return timestamp
+
+    def detect(self, kind, image):
+        """Run the stream's VIDEO-mode detector, or return None for IMAGE fallback."""
+        if not self._tracking:
+            return None
+        detector = self._lease(kind)
+        if detector is None:
+            return None
+        self._last_used[kind] = time.monotonic()
+
+        run = detector.recognize_for_video if kind == 'hand' else detector.detect_for_video
+        if kind in self._stale:
+            self._stale.discard(kind)
+            run(_BLANK_IMAGE, self._advance(detector))
+        return run(image, self._advance(detector))
+
+    def _release_idle(self):
+        cutoff = time.monotonic() - self.lease_idle_seconds
+        for kind in [kind for kind in self._leases if self._last_used.get(kind, 0) < cutoff]:
+            pool, detector = self._leases.pop(kind)
+            self._stale.discard(kind)
+            pool.release(detector)
+
+    def _release_all(self):
+        for pool, detector in self._leases.values():
+            pool.release(detector)
+        self._leases.clear()
+
+    def close(self):
+        """Return leased detectors, deferred until any running frame finishes."""
+        with self._lock:
+            self._closed = True
+            if not self._busy:
+                self._release_all()
+
+
+def warm_up_pools(count=None):
+    """Create the IMAGE-mode detectors up front (called at ASGI startup).
+
+    ``settings.DETECTOR_POOL_WARMUP`` may list the kinds to load, e.g.
+    ``['face']`` when clients only use face mode; other kinds load on first use.
+    """
+    kinds = getattr(settings, 'DETECTOR_POOL_WARMUP', True)
+    if not isinstance(kinds, (list, tuple)):
+        kinds = DETECTORS
+    for kind in kinds:
+        pool = get_pool(kind)
+        if pool is None:
+            logger.warning(f"{DETECTORS[kind][0]} missing, {kind} detection disabled")
+            continue
+        try:
+            pool.warm_up(count)
+        except Exception as e:
+            logger.error(f"Failed to warm up {kind} detectors: {e}")
+
+
+def pool_stats():
+    return [pool.stats() for pool in list(_pools.values())]
+
+
+def close_pools():
+    """Close idle detectors and forget all pools (called at ASGI shutdown)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
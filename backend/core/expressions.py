@@ -0,0 +1,129 @@
+"""
+Facial expressions from MediaPipe face blendshapes.
+
+Blendshapes are converted once per frame into a fixed-index score vector
+(BLENDSHAPE_NAMES order). Expressions are then declared as rules over
+those scores and evaluated all at once:
+
+    {'name': 'Smiling', 'all': {'mouthSmileLeft': 0.5, 'mouthSmileRight': 0.5}}
+
+A rule matches when all (``'all'``) or any (``'any'``) of its blendshapes
+score above their threshold. With ``'hysteresis'`` a matched rule keeps
+matching until the scores drop that far below the thresholds, which stops
+expressions from flickering on borderline scores (see ExpressionTracker).
+
+Like core.landmarks this module has no Django dependency, so the demo in
+examples/ uses it too.
+"""
+from operator import attrgetter
+
+import numpy as np
+
+BLENDSHAPE_NAMES = (
+    '_neutral', 'browDownLeft', 'browDownRight', 'browInnerUp', 'browOuterUpLeft',
+    'browOuterUpRight', 'cheekPuff', 'cheekSquintLeft', 'cheekSquintRight', 'eyeBlinkLeft',
+    'eyeBlinkRight', 'eyeLookDownLeft', 'eyeLookDownRight', 'eyeLookInLeft', 'eyeLookInRight',
+    'eyeLookOutLeft', 'eyeLookOutRight', 'eyeLookUpLeft', 'eyeLookUpRight', 'eyeSquintLeft',
+    'eyeSquintRight', 'eyeWideLeft', 'eyeWideRight', 'jawForward', 'jawLeft',
+    'jawOpen', 'jawRight', 'mouthClose', 'mouthDimpleLeft', 'mouthDimpleRight',
+    'mouthFrownLeft', 'mouthFrownRight', 'mouthFunnel', 'mouthLeft', 'mouthLowerDownLeft',
+    'mouthLowerDownRight', 'mouthPressLeft', 'mouthPressRight', 'mouthPucker', 'mouthRight',
+    'mouthRollLower', 'mouthRollUpper', 'mouthShrugLower', 'mouthShrugUpper', 'mouthSmileLeft',
+    'mouthSmileRight', 'mouthStretchLeft', 'mouthStretchRight', 'mouthUpperUpLeft',
+    'mouthUpperUpRight', 'noseSneerLeft', 'noseSneerRight',
+)
+BLENDSHAPE_INDEX = {name: index for index, name in enumerate(BLENDSHAPE_NAMES)}
+
+DEFAULT_EXPRESSION_RULES = [
+    {'name': 'Smiling', 'all': {'mouthSmileLeft': 0.5, 'mouthSmileRight': 0.5}, 'hysteresis': 0.1},
+    {'name': 'Left Wink', 'all': {'eyeBlinkLeft': 0.5}, 'hysteresis': 0.1},
+    {'name': 'Right Wink', 'all': {'eyeBlinkRight': 0.5}, 'hysteresis': 0.1},
+    {'name': 'Mouth Open', 'all': {'jawOpen': 0.3}, 'hysteresis': 0.05},
+]
+
+_index = attrgetter('index')
+_score = attrgetter('score')
+
+
+def blendshapes_to_array(blendshapes):
+    """Convert a face's blendshape categories into a BLENDSHAPE_NAMES-ordered score vector."""
+    count = len(blendshapes)
+    values = np.fromiter(map(_score, blendshapes), np.float32, count)
+    if count == len(BLENDSHAPE_NAMES) and blendshapes[-1].index == count - 1:
+        # MediaPipe lists every category in index order
+        return values
+    scores = np.zeros(len(BLENDSHAPE_NAMES), np.float32)
+    scores[np.fromiter(map(_index, blendshapes), np.intp, count)] = values
+    return scores
+
+
+class ExpressionRules:
+    """A compiled table of expression rules."""
+
+    def __init__(self, rules=None):
+        rules = DEFAULT_EXPRESSION_RULES if rules is None else rules
+        self.names = []
+        indices, thresholds, owners, starts, sizes = [], [], [], [], []
+        require_all, hysteresis = [], []
+        for rule in rules:
+            combine = 'all' if 'all' in rule else 'any'
+            conditions = rule.get(combine)
+            if not conditions:
+                raise ValueError(
+                    f"Expression rule {rule.get('name')!r} has no 'all' or 'any' conditions")
+            starts.append(len(indices))
+            for name, threshold in conditions.items():
+                if name not in BLENDSHAPE_INDEX:
+                    raise ValueError(f"Unknown blendshape {name!r} "
+                                     f"in expression rule {rule.get('name')!r}")
+                indices.append(BLENDSHAPE_INDEX[name])
+                thresholds.append(threshold)
+                owners.append(len(self.names))
+            sizes.append(len(conditions))
+            require_all.append(combine == 'all')
+            hysteresis.append(rule.get('hysteresis', 0.0))
+            self.names.append(rule['name'])
+
+        self._indices = np.array(indices, np.intp)
+        self._thresholds = np.array(thresholds, np.float32)
+        self._owners = np.array(owners, np.intp)
+        self._starts = np.array(starts, np.intp)
+        self._sizes = np.array(sizes, np.intp)
+        self._require_all = np.array(require_all, bool)
+        self._hysteresis = np.array(hysteresis, np.float32)
+
+    def evaluate(self, scores, active=None):
+        """Return which rules match ``scores``.
+
+        ``active`` (the previous result) enables hysteresis.
+        """
+        if not self.names:
+            return np.zeros(0, bool)
+        thresholds = self._thresholds
+        if active is not None:
+            thresholds = thresholds - (self._hysteresis * active)[self._owners]
+        passed = scores[self._indices] > thresholds
+        counts = np.add.reduceat(passed.astype(np.intp), self._starts)
+        return np.where(self._require_all, counts == self._sizes, counts > 0)
+
+    def expressions(self, matched):
+        return [name for name, on in zip(self.names, matched.tolist()) if on]
+
+    def classify(self, scores):
+        """Expression names for one frame, without hysteresis."""
+        return self.expressions(self.evaluate(scores))
+
+
+class ExpressionTracker:
+    """Classifies a stream's frames, applying each rule's hysteresis."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.active = None
+
+    def update(self, scores):
+        self.active = self.rules.evaluate(scores, self.active)
+        return self.rules.expressions(self.active)
+
+    def reset(self):
+        self.active = None
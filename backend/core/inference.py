@@ -0,0 +1,700 @@
+"""
+Inference backends that run process_frame off the ASGI event loop.
+
+Three backends are available, selected with ``settings.INFERENCE_BACKEND``:
+
+- ``thread``: a dedicated thread pool (separate from the default executor
+  used by asyncio.to_thread and sync_to_async). MediaPipe releases the GIL
+  in native code, and each worker checks out its own detector from the
+  shared pool.
+- ``process``: a pool of worker processes, each with its own detectors.
+  Frames are handed over through shared memory so only a small descriptor
+  is pickled per frame.
+- ``batch``: the thread pool fed by a scheduler that groups frames from
+  many connections into micro-batches (up to INFERENCE_BATCH_MAX_SIZE
+  frames, collected for at most INFERENCE_BATCH_MAX_WAIT_MS). Each batch
+  runs back-to-back on one worker holding one detector per model, which
+  saves a pool checkout and an executor hop per frame at high connection
+  counts.
+
+- ``channels``: frames are sent over the channel layer to inference
+  workers (``manage.py inference_worker``), which may run on other hosts.
+  Workers announce their load with heartbeats and each frame goes to the
+  least loaded one. With no worker available the frame is processed
+  locally (INFERENCE_CHANNEL_FALLBACK) or dropped.
+
+Only the thread and batch backends support VIDEO-mode tracking (supports_streams):
+a stream's leased detectors live in this process, while the process and
+channels backends may send consecutive frames of a stream to different workers.
+
+All backends bound the number of frames in flight. When the limit is
+reached, process() raises InferenceBusy and the caller drops the frame
+rather than queueing it.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .detectors import warm_up_pools
+from .pipeline import process_batch, process_frame
+from .protocol import LANDMARK_KEYS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'thread'
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 32
+DEFAULT_BATCH_MAX_SIZE = 8
+DEFAULT_BATCH_MAX_WAIT_MS = 3
+DEFAULT_CHANNEL_LAYER = 'default'
+DEFAULT_CHANNEL_TIMEOUT = 1.0  # seconds
+DEFAULT_CHANNEL_HEARTBEAT = 0.5  # seconds
+
+# Channel layer groups: workers announce their load to gateways (processes
+# running the channels backend), gateways ask workers to announce themselves
+GATEWAY_GROUP = 'inference-gateways'
+WORKER_GROUP = 'inference-workers'
+GROUP_REJOIN_SECONDS = 3600  # group memberships expire (a day by default)
+LISTEN_RETRY_MIN_SECONDS = 0.5  # backoff after a failed receive, doubling up to the max
+LISTEN_RETRY_MAX_SECONDS = 10
+
+
+class InferenceBusy(Exception):
+    """Raised when the inference queue is at its depth limit."""
+
+
+class ThreadInferenceBackend:
+    name = 'thread'
+    supports_streams = True
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+
+    def _reserve(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise InferenceBusy()
+            self.pending += 1
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+
+    def warm_up(self):
+        warm_up_pools(self.workers)
+
+    async def process(self, frame, mode, stream=None, timestamp_ms=0.0):
+        self._reserve()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, process_frame, frame, mode, stream, timestamp_ms)
+        finally:
+            self._release()
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared memory blocks attached by this worker process, most recent last
+_attached = OrderedDict()
+_MAX_ATTACHED = 64
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+    if getattr(settings, 'DETECTOR_POOL_WARMUP', True):
+        warm_up_pools(1)
+
+
+def _attach(name):
+    shm = _attached.get(name)
+    if shm is not None:
+        _attached.move_to_end(name)
+        return shm
+    try:
+        shm = SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: spawned workers share the parent's resource tracker,
+        # so registering the block again is harmless
+        shm = SharedMemory(name=name)
+    _attached[name] = shm
+    if len(_attached) > _MAX_ATTACHED:
+        _attached.popitem(last=False)[1].close()
+    return shm
+
+
+def _process_shared(name, shape, mode):
+    shm = _attach(name)
+    frame = np.ndarray(shape, np.uint8, buffer=shm.buf)
+    return process_frame(frame, mode)
+
+
+def _warm(_):
+    return os.getpid()
+
+
+class ProcessInferenceBackend(ThreadInferenceBackend):
+    name = 'process'
+    supports_streams = False
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'base.settings'),))
+        self._lock = threading.Lock()
+        self._slots = deque()
+        self.pending = 0
+        self.rejected = 0
+
+    def warm_up(self):
+        # Each concurrent submission spawns (and initializes) another worker
+        list(self._executor.map(_warm, range(self.workers)))
+
+    def _take_slot(self, size):
+        with self._lock:
+            shm = self._slots.pop() if self._slots else None
+        if shm is not None and shm.size >= size:
+            return shm
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        return SharedMemory(create=True, size=size)
+
+    async def process(self, frame, mode, stream=None, timestamp_ms=0.0):
+        # Streams are not supported here, frames always run in IMAGE mode
+        self._reserve()
+        shm = None
+        try:
+            shm = self._take_slot(frame.nbytes)
+            np.ndarray(frame.shape, np.uint8, buffer=shm.buf)[...] = frame
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, _process_shared, shm.name, frame.shape, mode)
+        except asyncio.CancelledError:
+            # The worker may still be reading this block, so don't reuse it
+            shm.close()
+            shm.unlink()
+            shm = None
+            raise
+        finally:
+            if shm is not None:
+                with self._lock:
+                    self._slots.append(shm)
+            self._release()
+
+    def shutdown(self):
+        super().shutdown()
+        with self._lock:
+            while self._slots:
+                shm = self._slots.pop()
+                shm.close()
+                shm.unlink()
+
+
+class BatchingInferenceBackend(ThreadInferenceBackend):
+    name = 'batch'
+    supports_streams = True
+
+    def __init__(self, workers, max_pending):
+        super().__init__(workers, max_pending)
+        self.max_batch = getattr(settings, 'INFERENCE_BATCH_MAX_SIZE', DEFAULT_BATCH_MAX_SIZE)
+        self.max_wait = getattr(settings, 'INFERENCE_BATCH_MAX_WAIT_MS',
+                                DEFAULT_BATCH_MAX_WAIT_MS) / 1000
+        self._queue = queue.SimpleQueue()
+        # A batch is only collected once a worker can take it, so frames
+        # queue up (and batches grow) while all workers are busy
+        self._free_workers = threading.Semaphore(workers)
+
+        # Throughput and latency metrics
+        self.batches = 0
+        self.frames = 0
+        self.queue_wait_total = 0.0
+        self.latency_total = 0.0
+        self.started = time.monotonic()
+
+        self._collector = threading.Thread(target=self._collect, name='inference-batcher',
+                                           daemon=True)
+        self._collector.start()
+
+    async def process(self, frame, mode, stream=None, timestamp_ms=0.0):
+        self._reserve()
+        try:
+            future = Future()
+            self._queue.put(((frame, mode, stream, timestamp_ms), future, time.perf_counter()))
+            return await asyncio.wrap_future(future)
+        finally:
+            self._release()
+
+    def _collect(self):
+        while True:
+            self._free_workers.acquire()
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                self._executor.submit(self._run_batch, batch)
+            except RuntimeError:
+                # Executor shut down
+                return
+
+    def _run_batch(self, batch):
+        try:
+            # Skip frames whose caller has gone away (cancelled futures)
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                return
+            start = time.perf_counter()
+            # Counted before any caller sees its result, so stats read then include it
+            with self._lock:
+                self.batches += 1
+            outcomes = process_batch([job for job, _, _ in batch])
+            for (_, future, queued), outcome in zip(batch, outcomes):
+                with self._lock:
+                    self.frames += 1
+                    self.queue_wait_total += start - queued
+                    self.latency_total += time.perf_counter() - queued
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+        finally:
+            self._free_workers.release()
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            frames, batches = self.frames, self.batches
+            stats.update({
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': batches,
+                'frames': frames,
+                'batch_size_avg': round(frames / batches, 2) if batches else 0.0,
+                'queue_wait_avg_ms': (round(self.queue_wait_total / frames * 1000, 3)
+                                      if frames else 0.0),
+                'latency_avg_ms': round(self.latency_total / frames * 1000, 3) if frames else 0.0,
+                'throughput_fps': round(frames / (time.monotonic() - self.started), 2),
+            })
+        return stats
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._free_workers.release()
+        super().shutdown()
+
+
+async def _stay_in_group(layer, group, channel):
+    while True:
+        await asyncio.sleep(GROUP_REJOIN_SECONDS)
+        await layer.group_add(group, channel)
+
+
+def _encode_frame(frame):
+    return {'frame': frame.tobytes(), 'shape': list(frame.shape)}
+
+
+def _decode_frame(message):
+    return np.frombuffer(message['frame'], np.uint8).reshape(message['shape'])
+
+
+def _encode_results(results):
+    """Results as channel layer message values (msgpack has no numpy arrays)"""
+    encoded = dict(results)
+    for key in LANDMARK_KEYS:
+        encoded[key] = [np.asarray(points, np.float32).tobytes() for points in results[key]]
+    if 'blendshapes' in results:
+        encoded['blendshapes'] = np.asarray(results['blendshapes'], np.float32).tobytes()
+    return encoded
+
+
+def _decode_results(encoded):
+    results = dict(encoded)
+    for key in LANDMARK_KEYS:
+        # Copies, consumers adjust landmarks in place
+        results[key] = [np.frombuffer(data, np.float32).reshape(-1, 3).copy()
+                        for data in encoded[key]]
+    if 'blendshapes' in encoded:
+        results['blendshapes'] = np.frombuffer(encoded['blendshapes'], np.float32)
+    return results
+
+
+class ChannelLayerInferenceBackend(ThreadInferenceBackend):
+    name = 'channels'
+    supports_streams = False
+
+    def __init__(self, workers, max_pending):
+        self.local_workers = workers  # for the fallback
+        self.max_pending = max_pending
+        self.alias = getattr(settings, 'INFERENCE_CHANNEL_LAYER', DEFAULT_CHANNEL_LAYER)
+        self.timeout = getattr(settings, 'INFERENCE_CHANNEL_TIMEOUT', DEFAULT_CHANNEL_TIMEOUT)
+        heartbeat = getattr(settings, 'INFERENCE_CHANNEL_HEARTBEAT', DEFAULT_CHANNEL_HEARTBEAT)
+        # Workers missing three heartbeats are considered gone
+        self.worker_expiry = heartbeat * 3
+        self.fallback = getattr(settings, 'INFERENCE_CHANNEL_FALLBACK', True)
+        self._lock = threading.Lock()
+        self._local = None  # ThreadInferenceBackend for fallback, created on first use
+        self._started = None  # task joining the channel layer, per event loop
+        self._tasks = ()
+        self._layer = None
+        self._reply_channel = None
+        self._remote = {}  # worker channel -> last heartbeat, plus our frames in flight
+        self._waiting = {}  # request id -> future
+        self._next_id = 0
+        self.pending = 0
+        self.rejected = 0
+        self.remote_frames = 0
+        self.fallback_frames = 0
+        self.timeouts = 0
+        self.worker_busy = 0
+
+    @property
+    def workers(self):
+        """Workers of all live inference workers, or the fallback's when there are none"""
+        now = time.monotonic()
+        remote = sum(state['workers'] for state in list(self._remote.values())
+                     if now - state['seen'] <= self.worker_expiry)
+        return remote or self.local_workers
+
+    def warm_up(self):
+        # Detectors load in the workers; the fallback loads them on first use
+        pass
+
+    async def _start(self):
+        self._layer = get_channel_layer(self.alias)
+        self._reply_channel = await self._layer.new_channel('inference-gateway')
+        await self._layer.group_add(GATEWAY_GROUP, self._reply_channel)
+        self._tasks = (
+            asyncio.create_task(self._listen(self._layer, self._reply_channel)),
+            asyncio.create_task(_stay_in_group(self._layer, GATEWAY_GROUP, self._reply_channel)))
+        # Running workers answer with a heartbeat straight away
+        await self._layer.group_send(WORKER_GROUP, {'type': 'inference.hello'})
+        logger.info(f"Inference gateway listening on {self._reply_channel}")
+
+    async def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        started = self._started
+        failed = (started is not None and started.done()
+                  and (started.cancelled() or started.exception()))
+        if started is None or started.get_loop() is not loop or failed:
+            # First frame, a new event loop (the layer is bound to one), or
+            # the last attempt failed (e.g. the layer's server was down)
+            for task in self._tasks:
+                task.cancel()
+            self._remote.clear()
+            self._started = loop.create_task(self._start())
+        await self._started
+
+    async def _listen(self, layer, channel):
+        failures = 0
+        while True:
+            try:
+                if failures:
+                    # The layer may have lost our membership (e.g. Redis restarted)
+                    await layer.group_add(GATEWAY_GROUP, channel)
+                    await layer.group_send(WORKER_GROUP, {'type': 'inference.hello'})
+                message = await layer.receive(channel)
+            except Exception as e:
+                failures += 1
+                delay = min(LISTEN_RETRY_MIN_SECONDS * 2 ** (failures - 1),
+                            LISTEN_RETRY_MAX_SECONDS)
+                logger.error(f"Inference gateway receive failed, retrying in {delay:g}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            if failures:
+                logger.info("Inference gateway receiving again")
+                failures = 0
+            try:
+                self._dispatch(message)
+            except Exception as e:
+                logger.error(f"Bad message on the inference gateway channel: {e}")
+
+    def _dispatch(self, message):
+        if message['type'] == 'inference.heartbeat':
+            self._heartbeat(message)
+        elif message['type'] == 'inference.result':
+            future = self._waiting.pop(message['id'], None)
+            if future is not None and not future.done():
+                future.set_result(message)
+
+    def _heartbeat(self, message):
+        worker = message['channel']
+        if message.get('leaving'):
+            self._remote.pop(worker, None)
+            logger.info(f"Inference worker {worker} left")
+            return
+        if worker not in self._remote:
+            logger.info(f"Inference worker {worker} joined ({message['workers']} workers)")
+            self._remote[worker] = {'in_flight': 0}
+        self._remote[worker].update(pending=message['pending'], workers=message['workers'],
+                                    max_pending=message['max_pending'], seen=time.monotonic())
+
+    def _choose(self):
+        """The least loaded live worker with room for another frame, or None"""
+        now = time.monotonic()
+        best, best_load = None, None
+        for worker, state in list(self._remote.items()):
+            if now - state['seen'] > self.worker_expiry:
+                logger.warning(f"Inference worker {worker} stopped sending heartbeats")
+                del self._remote[worker]
+                continue
+            # The last reported queue plus what we sent since
+            queued = state['pending'] + state['in_flight']
+            if queued >= state['max_pending']:
+                continue
+            load = queued / max(1, state['workers'])
+            if best is None or load < best_load:
+                best, best_load = worker, load
+        return best
+
+    async def process(self, frame, mode, stream=None, timestamp_ms=0.0):
+        # Streams are not supported here, frames always run in IMAGE mode
+        await self._ensure_started()
+        worker = self._choose()
+        if worker is None:
+            if not self.fallback:
+                with self._lock:
+                    self.rejected += 1
+                raise InferenceBusy()
+            # Counted in pending like remote frames, for the consumers' pacing
+            self._reserve()
+            try:
+                with self._lock:
+                    if self._local is None:
+                        logger.warning("No inference worker available, processing frames locally")
+                        self._local = ThreadInferenceBackend(self.local_workers, self.max_pending)
+                    self.fallback_frames += 1
+                return await self._local.process(frame, mode, None, timestamp_ms)
+            finally:
+                self._release()
+
+        self._reserve()
+        state = self._remote[worker]
+        state['in_flight'] += 1
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        try:
+            await self._layer.send(worker, {
+                'type': 'inference.request',
+                'id': request_id,
+                'reply': self._reply_channel,
+                'mode': mode,
+                'timestamp_ms': timestamp_ms,
+                # Wall clock, for workers on other hosts to skip frames nobody waits for
+                'expires': time.time() + self.timeout,
+                **_encode_frame(frame),
+            })
+            reply = await asyncio.wait_for(future, self.timeout)
+        except ChannelFull:
+            self.worker_busy += 1
+            raise InferenceBusy()
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            # Route around the worker until its next heartbeat
+            self._remote.pop(worker, None)
+            logger.warning(f"Inference worker {worker} timed out")
+            raise InferenceBusy()
+        finally:
+            self._waiting.pop(request_id, None)
+            state['in_flight'] -= 1
+            self._release()
+
+        if 'error' in reply:
+            if reply['error'] == 'busy':
+                self.worker_busy += 1
+                raise InferenceBusy()
+            raise RuntimeError(f"Inference worker error: {reply['error']}")
+        self.remote_frames += 1
+        return _decode_results(reply['results'])
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            'remote_workers': len(self._remote),
+            'remote_frames': self.remote_frames,
+            'fallback_frames': self.fallback_frames,
+            'timeouts': self.timeouts,
+            'worker_busy': self.worker_busy,
+        })
+        return stats
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._local is not None:
+            self._local.shutdown()
+
+
+class InferenceWorker:
+    """Serves inference requests from channels backends over the channel layer.
+
+    Frames run on a local backend (thread, process or batch). The worker
+    reports its queue to all gateways every ``heartbeat`` seconds and
+    answers frames beyond its ``max_pending`` limit with a busy error.
+    """
+
+    def __init__(self, backend, alias=None, heartbeat=None):
+        self.backend = backend
+        self.alias = alias or getattr(settings, 'INFERENCE_CHANNEL_LAYER', DEFAULT_CHANNEL_LAYER)
+        self.heartbeat = heartbeat or getattr(settings, 'INFERENCE_CHANNEL_HEARTBEAT',
+                                              DEFAULT_CHANNEL_HEARTBEAT)
+        self.layer = None
+        self.channel = None
+        self.processed = 0
+        self.expired = 0
+        self._stopping = None
+        self._tasks = set()
+
+    async def _announce(self, leaving=False):
+        await self.layer.group_send(GATEWAY_GROUP, {
+            'type': 'inference.heartbeat',
+            'channel': self.channel,
+            'pending': self.backend.pending,
+            'workers': self.backend.workers,
+            'max_pending': self.backend.max_pending,
+            'leaving': leaving,
+        })
+
+    async def _heartbeats(self):
+        while True:
+            await self._announce()
+            await asyncio.sleep(self.heartbeat)
+
+    async def _handle(self, message):
+        reply = {'type': 'inference.result', 'id': message['id']}
+        if time.time() > message['expires']:
+            # The gateway has given up on this frame
+            self.expired += 1
+            return
+        try:
+            results = await self.backend.process(_decode_frame(message), message['mode'],
+                                                 None, message['timestamp_ms'])
+            reply['results'] = _encode_results(results)
+            self.processed += 1
+        except InferenceBusy:
+            reply['error'] = 'busy'
+        except Exception as e:
+            logger.error(f"Processing error: {e}")
+            reply['error'] = str(e)
+        try:
+            await self.layer.send(message['reply'], reply)
+        except ChannelFull:
+            logger.warning(f"Reply channel {message['reply']} is full, dropping result")
+
+    async def run(self):
+        """Serve requests until stop() is called."""
+        self._stopping = asyncio.Event()
+        self.layer = get_channel_layer(self.alias)
+        self.channel = await self.layer.new_channel('inference-worker')
+        await self.layer.group_add(WORKER_GROUP, self.channel)
+        background = (asyncio.create_task(self._heartbeats()),
+                      asyncio.create_task(_stay_in_group(self.layer, WORKER_GROUP, self.channel)))
+        stopping = asyncio.create_task(self._stopping.wait())
+        logger.info(f"Inference worker listening on {self.channel}")
+        try:
+            while True:
+                receive = asyncio.create_task(self.layer.receive(self.channel))
+                await asyncio.wait((receive, stopping), return_when=asyncio.FIRST_COMPLETED)
+                if stopping.done():
+                    receive.cancel()
+                    break
+                message = receive.result()
+                if message['type'] == 'inference.hello':
+                    await self._announce()
+                elif message['type'] == 'inference.request':
+                    task = asyncio.create_task(self._handle(message))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        finally:
+            for task in background:
+                task.cancel()
+            await self.layer.group_discard(WORKER_GROUP, self.channel)
+            await self._announce(leaving=True)
+            # Finish the frames already accepted
+            if self._tasks:
+                await asyncio.wait(self._tasks)
+            logger.info(f"Inference worker stopped ({self.processed} frames processed)")
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+
+BACKENDS = {
+    'thread': ThreadInferenceBackend,
+    'process': ProcessInferenceBackend,
+    'batch': BatchingInferenceBackend,
+    'channels': ChannelLayerInferenceBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide inference backend, creating it from settings."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'INFERENCE_BACKEND', DEFAULT_BACKEND)
+                workers = getattr(settings, 'INFERENCE_WORKERS', DEFAULT_WORKERS)
+                max_pending = getattr(settings, 'INFERENCE_MAX_PENDING', DEFAULT_MAX_PENDING)
+                _backend = BACKENDS[name](workers, max_pending)
+                logger.info(f"Inference backend: {name} "
+                            f"({workers} workers, max {max_pending} pending)")
+    return _backend
+
+
+def shutdown_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.shutdown()
+            _backend = None
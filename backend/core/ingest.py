@@ -0,0 +1,116 @@
+"""
+Ingest of new assets: deduplication and derivatives.
+
+attach_file() hashes a file before it is stored on an asset. A file
+identical to one already in the library is not stored again: the asset
+reuses the existing file and its variants.
+
+New 2D assets are then processed in the background, once the creating
+transaction commits, on ASSET_VARIANT_WORKERS threads: core.derivatives
+renders ASSET_VARIANT_SIZES in ASSET_VARIANT_FORMATS, which are stored
+under assets/variants/<content hash>/ and recorded in ARAsset.variants for
+the API to turn into URLs. Until then, or if processing fails, clients use
+file_url. ``manage.py process_assets`` processes existing assets.
+"""
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
+
+from . import background
+from .derivatives import (
+    DEFAULT_FORMATS, DEFAULT_QUALITY, DEFAULT_SIZES, content_hash, render_variants,
+)
+from .models import ARAsset
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 1
+VARIANTS_DIR = 'assets/variants'
+
+
+def attach_file(asset, file):
+    """Set ``asset.file`` (unsaved) to ``file``, or to an identical stored file.
+
+    Returns True when an existing file was reused.
+    """
+    asset.content_hash = content_hash(file)
+    existing = (ARAsset.objects.filter(content_hash=asset.content_hash).exclude(file='')
+                .order_by('created_at').first())
+    if existing is not None and existing.file.storage.exists(existing.file.name):
+        asset.file = existing.file.name
+        asset.variants = existing.variants
+        return True
+    asset.file = file
+    return False
+
+
+def schedule(asset_id):
+    """Process the asset in the background once the current transaction commits."""
+    if not getattr(settings, 'ASSET_VARIANTS_ENABLED', True):
+        return
+    transaction.on_commit(lambda: background.submit(
+        'asset-variants', 'ASSET_VARIANT_WORKERS', DEFAULT_WORKERS, _run, asset_id))
+
+
+def _run(asset_id):
+    try:
+        process_asset(asset_id)
+    except Exception as e:
+        logger.warning(f"Could not process asset {asset_id}: {e}")
+
+
+def process_asset(asset_id, force=False):
+    """Hash the asset and store its variants; returns the asset.
+
+    Variants already made for the same content are reused unless ``force``.
+    """
+    asset = ARAsset.objects.get(id=asset_id)
+    if asset.asset_type != '2D_IMAGE' or not asset.file:
+        return asset
+    if not asset.content_hash:
+        with asset.file.open('rb') as file:
+            asset.content_hash = content_hash(file)
+
+    same_content = ARAsset.objects.filter(content_hash=asset.content_hash).exclude(id=asset.id)
+    done = None if force else same_content.exclude(variants={}).first()
+    if done is not None:
+        asset.variants = done.variants
+    else:
+        with asset.file.open('rb') as file:
+            image = Image.open(file)
+            image.load()
+        asset.variants = _store(asset, render_variants(
+            image,
+            sizes=getattr(settings, 'ASSET_VARIANT_SIZES', DEFAULT_SIZES),
+            formats=getattr(settings, 'ASSET_VARIANT_FORMATS', DEFAULT_FORMATS),
+            quality=getattr(settings, 'ASSET_VARIANT_QUALITY', DEFAULT_QUALITY)))
+    asset.save(update_fields=['content_hash', 'variants', 'updated_at'])
+
+    # Duplicates created while this ran share the result; queried afresh
+    # since they may have been saved after the lookup above
+    for other in same_content if force else same_content.filter(variants={}):
+        other.variants = asset.variants
+        other.save(update_fields=['variants', 'updated_at'])
+    return asset
+
+
+def _store(asset, rendered):
+    """Save rendered variants; returns them with storage names in place of bytes"""
+    storage = asset.file.storage
+    variants = {}
+    for name, variant in rendered.items():
+        stored = {}
+        for key, value in variant.items():
+            if isinstance(value, bytes):
+                path = f'{VARIANTS_DIR}/{asset.content_hash}/{name}.{key}'
+                # Same content, same variants: replace rather than pile up renamed copies
+                if storage.exists(path):
+                    storage.delete(path)
+                value = storage.save(path, ContentFile(value))
+            stored[key] = value
+        variants[name] = stored
+    return variants
+
@@ -0,0 +1,181 @@
+"""
+Background AI asset generation.
+
+GenerateAssetView records a GenerationJob and returns straight away; the
+job then runs on a small thread pool (ASSET_GENERATION_WORKERS), so slow
+image generation never holds a request worker. Clients poll the job's
+status endpoint, or connect to ws/assets/jobs/<id>/ to be told when it
+finishes.
+
+Repeated prompts are answered from core.asset_cache, and a request
+identical to a job still pending or running gets that job instead of a
+new one, so simultaneous requests share one generation. A unique
+constraint on the unfinished jobs' cache_key enforces this across server
+processes.
+
+Jobs beyond ASSET_GENERATION_MAX_QUEUED waiting or running in this process
+are refused with QueueFull. Jobs still unfinished ASSET_JOB_TIMEOUT seconds
+after they were created, e.g. lost with a crashed or restarted process, are
+marked FAILED when read through get_job() or before a new job is
+submitted.
+
+The generator is ``settings.ASSET_GENERATOR`` (a dotted path,
+core.utils.generate_ai_asset by default), which offline setups and tests
+can point at a stub with the same signature.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import asset_cache, background
+from .models import GenerationJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GENERATOR = 'core.utils.generate_ai_asset'
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUED = 16
+DEFAULT_JOB_TIMEOUT = 600  # seconds
+
+FINISHED_JOB_STATUSES = ('SUCCEEDED', 'FAILED')
+UNFINISHED_JOB_STATUSES = ('PENDING', 'RUNNING')
+TIMED_OUT_ERROR = 'Asset generation timed out.'
+
+
+class QueueFull(Exception):
+    """Raised when too many generation jobs are already queued."""
+
+
+def job_group(job_id):
+    """Channel layer group notified when the job finishes"""
+    return f'asset-job-{job_id}'
+
+
+_queued = 0
+_lock = threading.Lock()
+
+
+def job_timeout():
+    """Seconds after which an unfinished job is considered lost"""
+    return getattr(settings, 'ASSET_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)
+
+
+def fail_stale_jobs(jobs):
+    """Mark the jobs in the queryset unfinished for longer than job_timeout() FAILED"""
+    now = timezone.now()
+    return (jobs.filter(status__in=UNFINISHED_JOB_STATUSES,
+                        created_at__lt=now - timedelta(seconds=job_timeout()))
+            .update(status='FAILED', error=TIMED_OUT_ERROR, finished_at=now))
+
+
+def get_job(job_id):
+    """The job with its asset, or None if there is none"""
+    jobs = GenerationJob.objects.select_related('asset').filter(id=job_id)
+    job = jobs.first()
+    if job is not None and job.status in UNFINISHED_JOB_STATUSES and fail_stale_jobs(jobs):
+        job = jobs.first()
+    return job
+
+
+def submit_generation(prompt, anchor):
+    """Return a GenerationJob for the request: finished when the result was cached,
+    an identical job already in progress, or a newly queued one."""
+    key = asset_cache.cache_key(prompt, anchor)
+    fail_stale_jobs(GenerationJob.objects.filter(cache_key=key))
+    in_flight = (GenerationJob.objects
+                 .filter(cache_key=key, status__in=UNFINISHED_JOB_STATUSES).first())
+    if in_flight is not None:
+        return in_flight
+
+    asset = asset_cache.lookup(key)
+    if asset is not None:
+        now = timezone.now()
+        return GenerationJob.objects.create(
+            prompt=prompt, anchor=anchor, cache_key=key, cached=True, status='SUCCEEDED',
+            asset=asset, started_at=now, finished_at=now)
+
+    return _queue(prompt, anchor, key)
+
+
+def _queue(prompt, anchor, key):
+    global _queued
+    max_queued = getattr(settings, 'ASSET_GENERATION_MAX_QUEUED', DEFAULT_MAX_QUEUED)
+    with _lock:
+        if _queued >= max_queued:
+            raise QueueFull(f"{_queued} generation jobs already queued")
+        _queued += 1
+    try:
+        with transaction.atomic():
+            job = GenerationJob.objects.create(prompt=prompt, anchor=anchor, cache_key=key)
+        background.submit('asset-generation', 'ASSET_GENERATION_WORKERS', DEFAULT_WORKERS,
+                          _run, job.id)
+    except IntegrityError:
+        with _lock:
+            _queued -= 1
+        # An identical job was queued since the check, possibly by another
+        # process; it may even have finished already
+        return GenerationJob.objects.filter(cache_key=key).order_by('-created_at').first()
+    except Exception:
+        with _lock:
+            _queued -= 1
+        raise
+    return job
+
+
+def _run(job_id):
+    global _queued
+    try:
+        # Claimed only while pending: a job that timed out in the queue stays failed
+        jobs = GenerationJob.objects.filter(id=job_id)
+        if not jobs.filter(status='PENDING').update(status='RUNNING', started_at=timezone.now()):
+            return
+        job = jobs.get()
+
+        try:
+            generate = import_string(getattr(settings, 'ASSET_GENERATOR', DEFAULT_GENERATOR))
+            job.asset = generate(job.prompt, job.anchor)
+            if job.asset is None:
+                job.error = 'Failed to generate asset.'
+        except Exception as e:
+            logger.error(f"Asset generation failed: {e}")
+            job.error = str(e)
+        if job.asset is not None:
+            # Cached before the job is marked done, so requests arriving
+            # in between find one or the other
+            try:
+                asset_cache.store(job.cache_key, job.prompt, job.anchor, job.asset)
+            except Exception as e:
+                logger.warning(f"Could not cache generated asset: {e}")
+        job.status = 'FAILED' if job.asset is None else 'SUCCEEDED'
+        job.finished_at = timezone.now()
+        # Unless it timed out meanwhile, then it keeps that result
+        if jobs.filter(status='RUNNING').update(status=job.status, asset=job.asset, error=job.error,
+                                                finished_at=job.finished_at):
+            _notify(job)
+    except Exception as e:
+        logger.error(f"Generation job {job_id} failed: {e}")
+    finally:
+        with _lock:
+            _queued -= 1
+
+
+def _notify(job):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(job_group(job.id), {
+            'type': 'job.finished',
+            'job_id': str(job.id),
+        })
+    except Exception as e:
+        # Pollers still see the result
+        logger.warning(f"Could not notify job {job.id} watchers: {e}")
+
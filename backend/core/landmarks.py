@@ -0,0 +1,59 @@
+"""
+Conversion of MediaPipe landmark lists into NumPy arrays.
+
+This module has no Django dependency so the standalone demo in examples/
+can share it with the WebSocket consumer.
+"""
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+
+_xyz = attrgetter('x', 'y', 'z')
+
+INT16_SCALE = 10000  # 1e-4 resolution, same as the JSON rounding
+
+
+def landmarks_to_array(landmarks):
+    """Convert a list of NormalizedLandmark into an (N, 3) float32 array in one pass."""
+    count = len(landmarks)
+    flat = np.fromiter(chain.from_iterable(map(_xyz, landmarks)), np.float32, count * 3)
+    return flat.reshape(count, 3)
+
+
+def extract_landmarks(landmark_lists):
+    """Convert MediaPipe's per-hand/per-face landmark lists into a list of arrays."""
+    return [landmarks_to_array(landmarks) for landmarks in landmark_lists or ()]
+
+
+def round_landmarks(points, decimals=4):
+    """Round all coordinates at once, returned as float64 for exact JSON output."""
+    return np.round(points.astype(np.float64), decimals)
+
+
+def quantize_float16(points):
+    return points.astype('<f2')
+
+
+def quantize_int16(points, scale=INT16_SCALE):
+    return np.clip(np.rint(points * scale), -32768, 32767).astype('<i2')
+
+
+def to_pixels(points, width, height):
+    """Map normalized landmarks to integer (x, y) pixel coordinates."""
+    return (points[:, :2] * (width, height)).astype(np.int32)
+
+
+def unletterbox(points, transform):
+    """Map landmarks from a letterboxed frame back to source coordinates, in place.
+
+    ``transform`` is FrameDecoder.transform: the normalized scale and offset of
+    the content inside the frame. z shares x's scale, as in MediaPipe.
+    """
+    scale_x, scale_y, offset_x, offset_y = transform
+    points[:, 0] -= offset_x
+    points[:, 0] /= scale_x
+    points[:, 1] -= offset_y
+    points[:, 1] /= scale_y
+    points[:, 2] /= scale_x
+    return points
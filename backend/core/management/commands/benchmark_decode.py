@@ -0,0 +1,66 @@
+import time
+import tracemalloc
+
+import cv2
+import mediapipe as mp
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from core.consumers import MAX_IMAGE_HEIGHT, MAX_IMAGE_WIDTH
+from core.decoding import FrameDecoder
+
+
+def _legacy_decode(data):
+    """The original path: BGR decode, resize, RGB conversion, one copy per detector"""
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    frame = cv2.resize(frame, (MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT))
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return [mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame.copy()) for _ in range(2)]
+
+
+def _make_decoder():
+    decoder = FrameDecoder(MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT)
+
+    def decode(data):
+        rgb_frame = decoder.decode(data)
+        return [mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)]
+    return decode
+
+
+class Command(BaseCommand):
+    help = 'Compare time and allocations of the legacy and current frame decode paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='JPEG/WebP file to decode (default: synthetic frame)')
+        parser.add_argument('--width', type=int, default=640, help='Synthetic frame width')
+        parser.add_argument('--height', type=int, default=480, help='Synthetic frame height')
+        parser.add_argument('--frames', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options['image']:
+            with open(options['image'], 'rb') as f:
+                data = f.read()
+        else:
+            rng = np.random.default_rng(0)
+            image = cv2.GaussianBlur(
+                rng.integers(0, 256, (options['height'], options['width'], 3), np.uint8), (9, 9), 0)
+            data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 40])[1].tobytes()
+        if cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) is None:
+            raise CommandError('Input is not a decodable image')
+
+        for name, decode in (('legacy', _legacy_decode), ('current', _make_decoder())):
+            decode(data)  # warm up (lets the decoder learn the source size)
+
+            start = time.perf_counter()
+            for _ in range(options['frames']):
+                decode(data)
+            per_frame_ms = (time.perf_counter() - start) / options['frames'] * 1000
+
+            # numpy (and OpenCV's numpy-backed outputs) report to tracemalloc
+            tracemalloc.start()
+            decode(data)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(f"{name:8s} {per_frame_ms:7.3f} ms/frame  "
+                              f"peak traced {peak / 1024:8.1f} KiB/frame")
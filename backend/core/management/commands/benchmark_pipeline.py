@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.consumers import JPEG_QUALITY
+from core.decoding import FrameDecoder
+from core.detectors import VideoStream, pool_stats, warm_up_pools
+from core.management.replay import (
+    add_source_arguments, environment, load_frames, parse_size, peak_rss_mb, percentiles,
+    reset_peak_rss,
+)
+from core.pipeline import MODE_KINDS, process_frame
+
+FRAME_INTERVAL_MS = 1000 / 30  # timestamps for VIDEO-mode tracking
+
+
+class Command(BaseCommand):
+    help = ('Replay a video, image or synthetic frames through the decode and detection '
+            'pipeline and report throughput, latency percentiles and peak RSS')
+
+    def add_arguments(self, parser):
+        add_source_arguments(parser)
+        parser.add_argument('--frames', type=int, default=200, help='Frames per run')
+        parser.add_argument('--resolution', action='append', type=parse_size,
+                            help='Inference size WIDTHxHEIGHT (repeatable, default: 160x120)')
+        parser.add_argument('--mode', action='append', choices=sorted(MODE_KINDS),
+                            help='Detection mode (repeatable, default: combined)')
+        parser.add_argument('--concurrency', action='append', type=int,
+                            help='Streams processed in parallel (repeatable, default: 1)')
+        parser.add_argument('--tracking', action='store_true',
+                            help='Give each stream a VideoStream (MediaPipe VIDEO mode)')
+        parser.add_argument('--jpeg-quality', type=int, default=int(JPEG_QUALITY * 100),
+                            help='Quality frames are encoded at, as clients send them')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+
+    def _run(self, frames, mode, size, concurrency, tracking):
+        """Process all frames split over ``concurrency`` streams; returns per-frame timings"""
+        timings = []
+        timings_lock = threading.Lock()
+
+        def stream_worker(index):
+            decoder = FrameDecoder(*size)
+            stream = VideoStream() if tracking else None
+            own = []
+            try:
+                for n, data in enumerate(frames[index::concurrency]):
+                    start = time.perf_counter()
+                    frame = decoder.decode(data)
+                    decoded = time.perf_counter()
+                    process_frame(frame, mode, stream, n * FRAME_INTERVAL_MS)
+                    done = time.perf_counter()
+                    own.append((decoded - start, done - decoded, done - start))
+            finally:
+                if stream is not None:
+                    stream.close()
+            with timings_lock:
+                timings.extend(own)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(stream_worker, range(concurrency)))
+        return time.perf_counter() - start, np.array(timings) * 1000
+
+    def handle(self, *args, **options):
+        frames = load_frames(options, options['frames'], options['jpeg_quality'])
+        sizes = options['resolution'] or [(160, 120)]
+        modes = options['mode'] or ['combined']
+        levels = options['concurrency'] or [1]
+        pool_size = getattr(settings, 'DETECTOR_POOL_SIZE', None)
+        if pool_size and max(levels) > pool_size and not options['tracking']:
+            self.stderr.write(f"Concurrency above DETECTOR_POOL_SIZE ({pool_size}) "
+                              "waits for detectors")
+
+        warm_up_pools(max(levels))
+        # Warm up with one frame per mode (first inference initializes the graphs)
+        for mode in modes:
+            process_frame(FrameDecoder(*sizes[0]).decode(frames[0]), mode)
+
+        # Each run's own peak RSS where it can be reset between runs; elsewhere
+        # only how much a run raised the process's peak
+        per_run_peak = reset_peak_rss()
+        rss_field = 'peak_rss_mb' if per_run_peak else 'rss_growth_mb'
+
+        runs = []
+        self.stdout.write(f"{'mode':9s} {'size':>9s} {'conc':>4s} {'fps':>8s} "
+                          f"{'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} "
+                          f"{'rss MB' if per_run_peak else 'rss +MB':>8s}")
+        for mode in modes:
+            for size in sizes:
+                for concurrency in levels:
+                    reset_peak_rss()
+                    rss_before = peak_rss_mb()
+                    wall, timings = self._run(frames, mode, size, concurrency, options['tracking'])
+                    rss = peak_rss_mb() if per_run_peak else round(peak_rss_mb() - rss_before, 1)
+                    latency = percentiles(timings[:, 2])
+                    run = {
+                        'mode': mode,
+                        'resolution': list(size),
+                        'concurrency': concurrency,
+                        'tracking': options['tracking'],
+                        'frames': len(timings),
+                        'throughput_fps': round(len(timings) / wall, 2),
+                        'latency_ms': latency,
+                        'decode_ms': percentiles(timings[:, 0]),
+                        'inference_ms': percentiles(timings[:, 1]),
+                        rss_field: rss,
+                    }
+                    runs.append(run)
+                    self.stdout.write(
+                        f"{mode:9s} {size[0]:>4d}x{size[1]:<4d} {concurrency:>4d} "
+                        f"{run['throughput_fps']:>8.1f} {latency['p50']:>8.2f} "
+                        f"{latency['p95']:>8.2f} {latency['p99']:>8.2f} {rss:>8.1f}")
+
+        if options['output']:
+            report = {
+                'meta': environment(options),
+                'runs': runs,
+                'pools': pool_stats(),
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
@@ -0,0 +1,47 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.inference import (
+    BACKENDS, DEFAULT_MAX_PENDING, DEFAULT_WORKERS, ChannelLayerInferenceBackend, InferenceWorker,
+)
+
+
+class Command(BaseCommand):
+    help = ('Serve inference for the channels backend: process frames sent over the channel '
+            'layer by WebSocket servers with INFERENCE_BACKEND = "channels"')
+
+    def add_arguments(self, parser):
+        local_backends = sorted(name for name, backend in BACKENDS.items()
+                                if backend is not ChannelLayerInferenceBackend)
+        parser.add_argument('--backend', choices=local_backends, default='thread',
+                            help='How this worker runs inference (default: thread)')
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'INFERENCE_WORKERS', DEFAULT_WORKERS),
+                            help='Inference threads or processes (default: INFERENCE_WORKERS)')
+        parser.add_argument('--max-pending', type=int,
+                            default=getattr(settings, 'INFERENCE_MAX_PENDING', DEFAULT_MAX_PENDING),
+                            help='Frames queued before new ones are refused '
+                                 '(default: INFERENCE_MAX_PENDING)')
+        parser.add_argument('--layer',
+                            help='Channel layer alias (default: INFERENCE_CHANNEL_LAYER)')
+
+    def handle(self, *args, **options):
+        backend = BACKENDS[options['backend']](options['workers'], options['max_pending'])
+        backend.warm_up()
+        worker = InferenceWorker(backend, options['layer'])
+
+        async def serve():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, worker.stop)
+            await worker.run()
+
+        self.stdout.write(f"Inference worker: {options['backend']} backend, "
+                          f"{options['workers']} workers")
+        try:
+            asyncio.run(serve())
+        finally:
+            backend.shutdown()
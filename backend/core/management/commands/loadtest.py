@@ -0,0 +1,338 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit, urlunsplit
+from urllib.request import urlopen
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from core import metrics
+from core.consumers import JPEG_QUALITY
+from core.inference import (
+    DEFAULT_MAX_PENDING, DEFAULT_WORKERS, InferenceWorker, ThreadInferenceBackend, get_backend,
+    shutdown_backend,
+)
+from core.management.replay import add_source_arguments, environment, load_frames, percentiles
+from core.pipeline import MODE_KINDS
+from core.protocol import (
+    MODE_CODES, RESULT_DELTA, RESULT_FORMATS, RESULT_JSON, SUBPROTOCOL, ProtocolError, pack_frame,
+    unpack_results,
+)
+
+WS_PATH = '/ws/detection/'
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+DRAIN_SECONDS = 2.0  # wait for results still in flight after the last frame
+
+
+def _scrape_counter(ws_url, counter):
+    """A counter's value on the server's /metrics endpoint, or None if it can't be read"""
+    parts = urlsplit(ws_url)
+    scheme = 'https' if parts.scheme == 'wss' else 'http'
+    url = urlunsplit((scheme, parts.netloc, '/metrics', '', ''))
+    try:
+        with urlopen(url, timeout=5) as response:
+            text = response.read().decode()
+    except (OSError, ValueError):
+        return None
+    for line in text.splitlines():
+        name, _, value = line.partition(' ')
+        if name == counter.name:
+            return float(value)
+    return None
+
+
+class _CommunicatorConnection:
+    """Client connected to the ASGI application in this process"""
+
+    def __init__(self, application):
+        from channels.testing import WebsocketCommunicator
+        self.communicator = WebsocketCommunicator(application, WS_PATH, subprotocols=[SUBPROTOCOL])
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(timeout=30)
+        if not connected:
+            raise CommandError(f"Connection to {WS_PATH} was rejected")
+
+    async def send(self, data):
+        if isinstance(data, str):
+            await self.communicator.send_to(text_data=data)
+        else:
+            await self.communicator.send_to(bytes_data=data)
+
+    async def recv(self):
+        message = await self.communicator.receive_output(timeout=3600)
+        if message['type'] == 'websocket.close':
+            raise ConnectionError('closed by server')
+        return message.get('bytes') or message.get('text')
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class _WebsocketConnection:
+    """Client connected to a running server"""
+
+    def __init__(self, url):
+        self.url = url
+        self.websocket = None
+
+    async def connect(self):
+        try:
+            from websockets.asyncio.client import connect
+        except ImportError:
+            raise CommandError("--url needs the 'websockets' package")
+        self.websocket = await connect(self.url, subprotocols=[SUBPROTOCOL], max_size=None)
+
+    async def send(self, data):
+        await self.websocket.send(data)
+
+    async def recv(self):
+        return await self.websocket.recv()
+
+    async def close(self):
+        await self.websocket.close()
+
+
+class _Client:
+    """One simulated stream: sends frames at a fixed rate and matches results to them"""
+
+    def __init__(self, connection, frames, mode, fps, results):
+        self.connection = connection
+        self.frames = frames
+        self.mode = MODE_CODES[mode]
+        self.interval = 1 / fps
+        self.result_format = results
+        self.sent_at = {}  # sequence -> perf_counter() when sent
+        self.latencies = []
+        self.results = 0
+        self.predicted = 0
+        self.errors = 0
+        self.previous = None  # last decoded delta-format result
+
+    async def run(self, duration, delay):
+        await asyncio.sleep(delay)
+        await self.connection.connect()
+        if self.result_format != RESULT_JSON:
+            await self.connection.send(json.dumps({'config': {'results': self.result_format}}))
+        receiver = asyncio.create_task(self._receive())
+        try:
+            await self._send(duration)
+            await asyncio.sleep(DRAIN_SECONDS)
+        finally:
+            receiver.cancel()
+            await self.connection.close()
+
+    async def _send(self, duration):
+        start = time.perf_counter()
+        sequence = 0
+        while True:
+            due = start + sequence * self.interval
+            if due - start >= duration:
+                return
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            sent = time.perf_counter()
+            # Sequence numbers wrap at 32 bits; a run never gets near that
+            self.sent_at[sequence] = sent
+            await self.connection.send(pack_frame(self.frames[sequence % len(self.frames)],
+                                                  sequence=sequence, timestamp_ms=sent * 1000,
+                                                  mode=self.mode))
+            sequence += 1
+
+    async def _receive(self):
+        while True:
+            message = await self.connection.recv()
+            received = time.perf_counter()
+            result = self._parse(message)
+            if result is None or 'seq' not in result:
+                continue
+            sent = self.sent_at.pop(result['seq'], None)
+            if sent is None:
+                continue
+            self.results += 1
+            if result.get('predicted'):
+                self.predicted += 1
+            else:
+                self.latencies.append((received - sent) * 1000)
+
+    def _parse(self, message):
+        if isinstance(message, str):
+            result = json.loads(message)
+            if 'error' in result:
+                self.errors += 1
+            # Config replies carry no results
+            return None if 'config' in result else result
+        try:
+            result = unpack_results(message, self.previous)
+        except ProtocolError:
+            self.errors += 1
+            self.previous = None
+            return None
+        if self.result_format == RESULT_DELTA:
+            self.previous = result
+        return result
+
+
+class Command(BaseCommand):
+    help = ('Simulate concurrent clients streaming frames to ws/detection/ and report '
+            'result latency, drop rate and throughput')
+
+    def add_arguments(self, parser):
+        add_source_arguments(parser)
+        parser.add_argument('--clients', type=int, default=4, help='Concurrent connections')
+        parser.add_argument('--fps', type=float, default=15,
+                            help='Frames per second sent by each client')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds each client streams for')
+        parser.add_argument('--ramp', type=float, default=0,
+                            help='Seconds over which client connections are spread')
+        parser.add_argument('--mode', choices=sorted(MODE_KINDS), default='combined',
+                            help='Detection mode')
+        parser.add_argument('--results', choices=RESULT_FORMATS, default=RESULT_JSON,
+                            help='Result format requested by the clients')
+        parser.add_argument('--frames', type=int, default=60,
+                            help='Distinct frames to cycle through')
+        parser.add_argument('--jpeg-quality', type=int, default=int(JPEG_QUALITY * 100),
+                            help='Quality frames are encoded at, as clients send them')
+        parser.add_argument('--url',
+                            help='Server to test, e.g. ws://localhost:8000/ws/detection/ '
+                                 '(default: the application in this process, fully offline). '
+                                 'With delta results, its /metrics is read to tell skipped '
+                                 'results from drops, so other traffic skews the drop rate')
+        parser.add_argument('--channel-workers', type=int, default=0,
+                            help='In-process only: use the channels inference backend, served by '
+                                 'this many inference workers on the in-memory channel layer')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+
+    async def _run(self, options, frames, connect):
+        # Inference workers for the channels backend, each with its own thread pool
+        workers = [InferenceWorker(ThreadInferenceBackend(
+            getattr(settings, 'INFERENCE_WORKERS', DEFAULT_WORKERS),
+            getattr(settings, 'INFERENCE_MAX_PENDING', DEFAULT_MAX_PENDING)))
+            for _ in range(options['channel_workers'])]
+        worker_tasks = [asyncio.create_task(worker.run()) for worker in workers]
+        try:
+            return await self._run_clients(options, frames, connect)
+        finally:
+            for worker in workers:
+                worker.stop()
+            await asyncio.gather(*worker_tasks)
+            for worker in workers:
+                worker.backend.shutdown()
+
+    async def _run_clients(self, options, frames, connect):
+        clients = [_Client(connect(), frames, options['mode'], options['fps'], options['results'])
+                   for _ in range(options['clients'])]
+        ramp_step = options['ramp'] / len(clients)
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(client.run(options['duration'], i * ramp_step) for i, client in enumerate(clients)),
+            return_exceptions=True)
+        wall = time.perf_counter() - start - DRAIN_SECONDS
+        failed = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if len(failed) == len(clients):
+            raise CommandError(f"All clients failed: {failed[0]!r}")
+
+        # A frame is sent once its sequence is recorded, answered once it's removed again
+        sent = sum(client.results + len(client.sent_at) for client in clients)
+        results = sum(client.results for client in clients)
+        predicted = sum(client.predicted for client in clients)
+        latencies = np.array([latency for client in clients for latency in client.latencies])
+        return {
+            'clients': options['clients'],
+            'clients_failed': len(failed),
+            'fps_per_client': options['fps'],
+            'duration_s': options['duration'],
+            'mode': options['mode'],
+            'results_format': options['results'],
+            'frames_sent': sent,
+            'results': results,
+            'results_predicted': predicted,
+            'protocol_errors': sum(client.errors for client in clients),
+            'send_fps': round(sent / wall, 2),
+            'processed_fps': round((results - predicted) / wall, 2),
+            'latency_ms': percentiles(latencies) if len(latencies) else None,
+        }
+
+    def _unchanged_counter(self, options):
+        """Reads the server's count of delta results skipped because nothing changed"""
+        if options['results'] != RESULT_DELTA:
+            return lambda: 0
+        if options['url']:
+            return lambda: _scrape_counter(options['url'], metrics.results_unchanged)
+        return lambda: metrics.results_unchanged.value if metrics.enabled() else None
+
+    def _count_drops(self, report, unchanged):
+        # Skipped delta results answer their frame; only the server knows how many there were
+        report['results_unchanged'] = unchanged
+        sent = report['frames_sent']
+        if unchanged is None:
+            report['drop_rate'] = None
+            return
+        report['drop_rate'] = round(1 - (report['results'] + unchanged) / sent, 4) if sent else 0.0
+        if unchanged and report['send_fps']:
+            # Processed too, just not worth a message
+            wall = sent / report['send_fps']
+            report['processed_fps'] = round(report['processed_fps'] + unchanged / wall, 2)
+
+    def _print(self, report):
+        self.stdout.write(f"clients        {report['clients']} ({report['clients_failed']} failed)")
+        self.stdout.write(f"frames sent    {report['frames_sent']} ({report['send_fps']:.1f}/s)")
+        self.stdout.write(f"results        {report['results']} "
+                          f"({report['results_predicted']} predicted)")
+        if report['results_unchanged']:
+            self.stdout.write(f"unchanged      {report['results_unchanged']} "
+                              "(delta results not sent)")
+        if report['drop_rate'] is None:
+            self.stdout.write("drop rate      unknown (the server's /metrics can't be read "
+                              "to count unchanged delta results)")
+        else:
+            self.stdout.write(f"drop rate      {report['drop_rate']:.1%}")
+        self.stdout.write(f"processed      {report['processed_fps']:.1f} frames/s")
+        latency = report['latency_ms']
+        if latency:
+            self.stdout.write(f"latency ms     p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+                              f"p99 {latency['p99']:.1f}")
+        if report['protocol_errors']:
+            self.stderr.write(f"{report['protocol_errors']} result messages could not be decoded")
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['fps'] <= 0 or options['duration'] <= 0:
+            raise CommandError("--clients, --fps and --duration must be positive")
+        frames = load_frames(options, options['frames'], options['jpeg_quality'])
+
+        if options['url'] and options['channel_workers']:
+            raise CommandError("--channel-workers only applies without --url")
+
+        read_unchanged = self._unchanged_counter(options)
+        unchanged_before = read_unchanged()
+        if options['url']:
+            report = asyncio.run(self._run(options, frames,
+                                           lambda: _WebsocketConnection(options['url'])))
+        else:
+            overrides = {'CHANNEL_LAYERS': IN_MEMORY_CHANNEL_LAYERS}
+            if options['channel_workers']:
+                overrides['INFERENCE_BACKEND'] = 'channels'
+            with override_settings(**overrides):
+                from channels.routing import get_default_application
+                # Start from a backend created with the overridden settings
+                shutdown_backend()
+                application = get_default_application()
+                try:
+                    report = asyncio.run(self._run(options, frames,
+                                                   lambda: _CommunicatorConnection(application)))
+                    report['inference'] = get_backend().stats()
+                finally:
+                    shutdown_backend()
+        unchanged_after = read_unchanged()
+        self._count_drops(report, None if unchanged_before is None or unchanged_after is None
+                          else int(unchanged_after - unchanged_before))
+
+        self._print(report)
+        if options['output']:
+            report = {'meta': environment(options), **report}
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
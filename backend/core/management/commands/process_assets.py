@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.ingest import process_asset
+from core.models import ARAsset
+
+
+def _size(storage, name):
+    try:
+        return storage.size(name)
+    except OSError:
+        return 0
+
+
+class Command(BaseCommand):
+    help = 'Hash 2D assets and render their variants (new assets are processed automatically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render assets that already have variants')
+
+    def handle(self, *args, **options):
+        assets = (ARAsset.objects.filter(asset_type='2D_IMAGE').exclude(file='')
+                  .order_by('created_at'))
+        if not options['force']:
+            assets = assets.filter(variants={})
+
+        processed = failed = 0
+        original_bytes = {}
+        variant_bytes = {}
+        rendered = set()
+        start = time.perf_counter()
+        for asset_id, content_hash in assets.values_list('id', 'content_hash'):
+            # Duplicates share the variants rendered for the first of them
+            force = options['force'] and not (content_hash and content_hash in rendered)
+            try:
+                asset = process_asset(asset_id, force=force)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{asset_id}: {e}")
+                continue
+            processed += 1
+            rendered.add(asset.content_hash)
+            storage = asset.file.storage
+            original_bytes[asset.file.name] = _size(storage, asset.file.name)
+            for name, variant in asset.variants.items():
+                for key, value in variant.items():
+                    if isinstance(value, str):
+                        variant_bytes.setdefault(f'{name}.{key}', {})[value] = _size(storage, value)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f"Processed {processed} assets ({failed} failed) in {elapsed:.1f}s, "
+                          f"{len(original_bytes)} distinct files")
+        if original_bytes:
+            total = sum(original_bytes.values())
+            self.stdout.write(f"{'original':14s} {total / len(original_bytes) / 1024:9.1f} KiB avg")
+            for key, sizes in sorted(variant_bytes.items()):
+                average = sum(sizes.values()) / len(sizes)
+                self.stdout.write(f"{key:14s} {average / 1024:9.1f} KiB avg  "
+                                  f"{average / (total / len(original_bytes)):6.1%} of original")
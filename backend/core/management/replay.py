@@ -0,0 +1,119 @@
+"""
+Frame sources and report helpers shared by the benchmark and load-test commands.
+"""
+import os
+import platform
+import resource
+import subprocess
+from datetime import datetime, timezone
+
+import cv2
+import mediapipe as mp
+import numpy as np
+from django.conf import settings
+from django.core.management.base import CommandError
+
+
+def parse_size(value):
+    """argparse type for WIDTHxHEIGHT"""
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise CommandError(f"Invalid size {value!r}, expected WIDTHxHEIGHT")
+    return width, height
+
+
+def add_source_arguments(parser):
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--video', help='Video file to replay')
+    source.add_argument('--image', help='Image file to replay as every frame')
+    parser.add_argument('--source-size', type=parse_size, default=(640, 480),
+                        help='Size of synthetic frames (default: 640x480)')
+
+
+def describe_source(options):
+    width, height = options['source_size']
+    return options['video'] or options['image'] or f"synthetic {width}x{height}"
+
+
+def load_frames(options, count, jpeg_quality):
+    """Return ``count`` frames from the chosen source, JPEG-encoded like client uploads."""
+    if options['video']:
+        capture = cv2.VideoCapture(options['video'])
+        images = []
+        while len(images) < count:
+            ok, image = capture.read()
+            if not ok:
+                break
+            images.append(image)
+        capture.release()
+        if not images:
+            raise CommandError(f"Could not read frames from {options['video']}")
+    elif options['image']:
+        image = cv2.imread(options['image'])
+        if image is None:
+            raise CommandError(f"Could not read {options['image']}")
+        images = [image]
+    else:
+        # Smooth noise drifting across the frame, so every frame differs
+        width, height = options['source_size']
+        rng = np.random.default_rng(0)
+        base = cv2.GaussianBlur(rng.integers(0, 256, (height, width * 2, 3), np.uint8), (15, 15), 0)
+        images = [base[:, i % width:i % width + width] for i in range(min(count, 30))]
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    encoded = [cv2.imencode('.jpg', image, params)[1].tobytes() for image in images]
+    return [encoded[i % len(encoded)] for i in range(count)]
+
+
+def percentiles(values):
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': round(float(p50), 3), 'p95': round(float(p95), 3),
+            'p99': round(float(p99), 3), 'mean': round(float(np.mean(values)), 3)}
+
+
+def reset_peak_rss():
+    """Restart the peak RSS measurement; returns False where that isn't possible (non-Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss(), or since the process started"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss can't be reset; it's in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if platform.system() == 'Darwin' else 1024), 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(options):
+    """Report metadata identifying the run, for comparing results between commits"""
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'source': describe_source(options),
+        'jpeg_quality': options['jpeg_quality'],
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'mediapipe': mp.__version__,
+        'numpy': np.__version__,
+    }
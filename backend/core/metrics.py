@@ -0,0 +1,193 @@
+"""
+In-process metrics, rendered in the Prometheus text format at /metrics.
+
+The frame hot path records per-stage durations with ``timer(stage)``:
+
+    with metrics.timer('imdecode'):
+        image = cv2.imdecode(...)
+
+With ``settings.METRICS_ENABLED = False`` timer() returns a shared no-op
+context manager and counters do nothing, so instrumentation costs a
+function call per stage.
+
+Detector pool and inference backend figures are read when the endpoint is
+scraped rather than tracked on the hot path.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from django.conf import settings
+
+PREFIX = 'pixelsight'
+
+# Seconds, from sub-millisecond decode steps up to slow inference
+STAGE_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+_enabled = None
+
+
+def enabled():
+    global _enabled
+    if _enabled is None:
+        _enabled = getattr(settings, 'METRICS_ENABLED', True)
+    return _enabled
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, values)) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help, label, buckets=STAGE_BUCKETS):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_value, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {values[-2]}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {values[-1]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, kind='counter'):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help
+        self.kind = kind
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if enabled():
+            with self._lock:
+                self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}',
+                f'{self.name} {self.value}']
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stage_seconds.observe(self.stage, perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+stage_seconds = Histogram('stage_seconds', 'Time spent per frame in each processing stage.',
+                          'stage')
+frames_received = Counter('frames_received_total', 'Frames received from clients.')
+frames_superseded = Counter('frames_superseded_total',
+                            'Frames replaced in a mailbox by a newer frame.')
+frames_dropped_busy = Counter('frames_dropped_busy_total',
+                              'Frames dropped because the inference queue was full.')
+frames_predicted = Counter('frames_predicted_total',
+                           'Skipped frames answered with predicted landmarks.')
+results_sent = Counter('results_sent_total', 'Result messages sent to clients.')
+results_unchanged = Counter('results_unchanged_total',
+                            'Delta-format results not sent because nothing changed.')
+connections_active = Counter('connections_active', 'Open WebSocket streams.', kind='gauge')
+
+COUNTERS = (frames_received, frames_superseded, frames_dropped_busy, frames_predicted,
+            results_sent, results_unchanged, connections_active)
+
+
+def timer(stage):
+    """Context manager recording the duration of ``stage`` (no-op when disabled)."""
+    if not enabled():
+        return _NULL_TIMER
+    return _Timer(stage)
+
+
+def observe(stage, seconds):
+    """Record a stage duration measured elsewhere (e.g. on an inference worker)."""
+    if enabled():
+        stage_seconds.observe(stage, seconds)
+
+
+def _gauges(name, help, samples):
+    """Render gauge samples given as (labels dict, value) pairs"""
+    name = f'{PREFIX}_{name}'
+    lines = [f'# HELP {name} {help}', f'# TYPE {name} gauge']
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(labels.keys(), labels.values())} {value}')
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    from .detectors import pool_stats
+    from .inference import get_backend
+
+    lines = stage_seconds.render()
+    for counter in COUNTERS:
+        lines += counter.render()
+
+    pools = pool_stats()
+    for field, help in (('size', 'Maximum detectors in the pool.'),
+                        ('created', 'Detectors created.'),
+                        ('idle', 'Detectors waiting to be checked out.'),
+                        ('checkouts', 'Detector checkouts.'),
+                        ('timeouts', 'Checkouts that timed out.'),
+                        ('evicted', 'Idle detectors closed.'),
+                        ('wait_avg_ms', 'Average checkout wait in milliseconds.'),
+                        ('wait_max_ms', 'Longest checkout wait in milliseconds.')):
+        lines += _gauges(f'detector_pool_{field}', help, [
+            ({'kind': stats['kind'], 'running_mode': stats['running_mode']}, stats[field])
+            for stats in pools])
+
+    backend = get_backend().stats()
+    name = backend.pop('backend')
+    for field, value in backend.items():
+        lines += _gauges(f'inference_{field}', f'Inference backend {field}.',
+                         [({'backend': name}, value)])
+
+    return '\n'.join(lines) + '\n'
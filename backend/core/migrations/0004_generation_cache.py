@@ -0,0 +1,42 @@
+# Generated by Django 6.1.2 on 2026-10-17 02:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='cached',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='CachedGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('prompt', models.TextField()),
+                ('anchor', models.CharField(choices=[('FACE', 'Face Center'), ('HAND_WRIST', 'Hand Wrist'), ('HAND_PALM', 'Hand Palm'), ('HAND_INDEX_TIP', 'Index Finger Tip')], default='FACE', max_length=20)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.arasset')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='generationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'RUNNING']), models.Q(('cache_key', ''), _negated=True)), fields=('cache_key',), name='generationjob_one_in_flight'),
+        ),
+    ]
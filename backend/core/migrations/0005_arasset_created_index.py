@@ -0,0 +1,22 @@
+# Generated by Django 6.1.2 on 2026-10-17 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_generation_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arasset',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='arasset',
+            index=models.Index(fields=['-created_at', '-id'], name='arasset_created_idx'),
+        ),
+    ]
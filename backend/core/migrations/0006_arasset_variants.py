@@ -0,0 +1,23 @@
+# Generated by Django 6.1.2 on 2026-10-17 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_arasset_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arasset',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='arasset',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 
 
 class ARAsset(models.Model):
@@ -29,8 +30,73 @@ class ARAsset(models.Model):
     position_offset = models.JSONField(default=dict) 
     rotation_offset = models.JSONField(default=dict)
 
+    # SHA-256 of the file, shared by deduplicated uploads (see core.ingest)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Resized/re-encoded copies: {name: {'width': w, 'height': h, format: storage name}}
+    variants = models.JSONField(default=dict, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
+    # Newest change to any asset, part of the asset list version (see core.asset_list)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Newest-first listing and its (created_at, id) cursor
+            models.Index(fields=['-created_at', '-id'], name='arasset_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_asset_type_display()})"
 
+
+
+class GenerationJob(models.Model):
+    """An AI asset generation request, run in the background (see core.jobs)."""
+    STATUSES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    prompt = models.TextField()
+    anchor = models.CharField(max_length=20, choices=ARAsset.ANCHOR_POINTS, default='FACE')
+    status = models.CharField(max_length=10, choices=STATUSES, default='PENDING')
+    asset = models.ForeignKey(ARAsset, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True)
+    # Identical requests share a key (see core.asset_cache)
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)
+    cached = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # One unfinished job per request, so identical requests coalesce
+            # even when made to different server processes (see core.jobs)
+            models.UniqueConstraint(
+                fields=['cache_key'],
+                condition=models.Q(status__in=['PENDING', 'RUNNING']) & ~models.Q(cache_key=''),
+                name='generationjob_one_in_flight'),
+        ]
+
+    def __str__(self):
+        return f"{self.prompt[:30]} ({self.get_status_display()})"
+
+
+class CachedGeneration(models.Model):
+    """A generated asset reused for later requests with the same prompt and anchor."""
+    key = models.CharField(max_length=64, unique=True)
+    prompt = models.TextField()
+    anchor = models.CharField(max_length=20, choices=ARAsset.ANCHOR_POINTS, default='FACE')
+    asset = models.ForeignKey(ARAsset, on_delete=models.CASCADE)
+    hits = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.prompt[:30]} ({self.hits} hits)"
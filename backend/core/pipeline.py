@@ -0,0 +1,199 @@
+"""
+Frame processing shared by every inference backend.
+
+process_frame is a plain module-level function so it can be shipped to
+worker processes as well as run on threads.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+
+import mediapipe as mp
+from django.conf import settings
+
+from .detectors import DetectorPoolTimeout, get_pool
+from .expressions import ExpressionRules, blendshapes_to_array
+from .landmarks import extract_landmarks
+
+logger = logging.getLogger(__name__)
+
+# Models run for each mode
+MODE_KINDS = {
+    'combined': ('hand', 'face'),
+    'hands': ('hand',),
+    'face': ('face',),
+}
+
+# Helper threads running the second model of a combined-mode frame
+_model_executor = None
+_model_executor_lock = threading.Lock()
+
+
+_expression_rules = None
+
+
+def get_expression_rules():
+    """The expression rule table from settings.EXPRESSION_RULES, compiled once."""
+    global _expression_rules
+    if _expression_rules is None:
+        _expression_rules = ExpressionRules(getattr(settings, 'EXPRESSION_RULES', None))
+    return _expression_rules
+
+
+def _get_model_executor():
+    global _model_executor
+    if _model_executor is None:
+        with _model_executor_lock:
+            if _model_executor is None:
+                workers = getattr(settings, 'INFERENCE_WORKERS', None) or os.cpu_count()
+                _model_executor = ThreadPoolExecutor(max_workers=workers,
+                                                     thread_name_prefix='inference-model')
+    return _model_executor
+
+
+def _detect(kind, pool, image, stream):
+    """Prefer the stream's VIDEO-mode tracker, else a pooled IMAGE-mode detector"""
+    if stream is not None:
+        result = stream.detect(kind, image)
+        if result is not None:
+            return result
+    with pool.checkout() as detector:
+        if kind == 'hand':
+            return detector.recognize(image)
+        return detector.detect(image)
+
+
+class _HeldDetector:
+    """Pool stand-in handing out a detector already checked out for a batch"""
+
+    def __init__(self, detector):
+        self.detector = detector
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        yield self.detector
+
+
+def process_frame(frame, mode, stream=None, timestamp_ms=0.0, pools=None):
+    """Synchronous processing - runs on an inference worker.
+
+    ``frame`` is a contiguous RGB uint8 array (see core.decoding).
+
+    With a VideoStream, detectors track landmarks across the stream's frames
+    (MediaPipe VIDEO mode) using the client's timestamps; otherwise every
+    frame is detected from scratch (IMAGE mode).
+
+    Landmarks are returned as (N, 3) float32 arrays; they are encoded for
+    the wire by the consumer according to the connection's result format.
+    When a face is found, ``blendshapes`` holds its scores in
+    core.expressions.BLENDSHAPE_NAMES order.
+
+    ``pools`` optionally maps a model kind to the pool to use instead of the
+    shared IMAGE-mode pool (see process_batch).
+    """
+    with stream.frame(timestamp_ms) if stream is not None else nullcontext():
+        return _process_frame(frame, mode, stream, pools or {})
+
+
+def process_batch(jobs):
+    """Run (frame, mode, stream, timestamp_ms) jobs back-to-back on this worker.
+
+    One IMAGE-mode detector per model is checked out for the whole batch
+    instead of once per frame. Yields each job's results, or the exception
+    it raised, in order as soon as that job has finished.
+    """
+    kinds = {kind for job in jobs for kind in MODE_KINDS.get(job[1], ())}
+    with ExitStack() as stack:
+        held = {}
+        for kind in kinds:
+            pool = get_pool(kind)
+            if pool is None:
+                continue
+            try:
+                held[kind] = _HeldDetector(stack.enter_context(pool.checkout()))
+            except DetectorPoolTimeout:
+                # Frames check out detectors one at a time instead
+                pass
+
+        for frame, mode, stream, timestamp_ms in jobs:
+            try:
+                yield process_frame(frame, mode, stream, timestamp_ms, held)
+            except Exception as e:
+                yield e
+
+
+def _process_hands(mp_image, pool, stream, results):
+    """Run the gesture recognizer and fill gestures/hand_landmarks"""
+    start = time.perf_counter()
+    try:
+        hand_result = _detect('hand', pool, mp_image, stream)
+        if hand_result.gestures:
+            for gestures in hand_result.gestures:
+                if gestures:
+                    gesture = gestures[0]
+                    results['gestures'].append({
+                        'name': gesture.category_name,
+                        'score': round(gesture.score, 4)
+                    })
+        
+        results['hand_landmarks'] = extract_landmarks(hand_result.hand_landmarks)
+    except Exception as e:
+        logger.error(f"Hand detection error: {e}")
+    results['timings']['hand_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def _process_face(mp_image, pool, stream, results):
+    """Run the face landmarker and fill expressions/face_landmarks"""
+    start = time.perf_counter()
+    try:
+        face_result = _detect('face', pool, mp_image, stream)
+        
+        # Expressions
+        if face_result.face_blendshapes:
+            scores = blendshapes_to_array(face_result.face_blendshapes[0])
+            results['blendshapes'] = scores
+            results['expressions'] = get_expression_rules().classify(scores)
+        
+        # Landmarks
+        results['face_landmarks'] = extract_landmarks(face_result.face_landmarks)
+    except Exception as e:
+        logger.error(f"Face detection error: {e}")
+    results['timings']['face_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def _process_frame(rgb_frame, mode, stream, pools):
+    results = {
+        'gestures': [],
+        'expressions': [],
+        'hand_landmarks': [],
+        'face_landmarks': [],
+        'timings': {},
+    }
+
+    kinds = MODE_KINDS.get(mode, ())
+    hand_pool = (pools.get('hand') or get_pool('hand')) if 'hand' in kinds else None
+    face_pool = (pools.get('face') or get_pool('face')) if 'face' in kinds else None
+
+    if not (hand_pool or face_pool):
+        return results
+
+    # One mp.Image wraps the frame for both detectors, which only read it
+    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+
+    if hand_pool and face_pool and getattr(settings, 'INFERENCE_PARALLEL_MODELS', True):
+        # Both models release the GIL while running, so run the face model on
+        # a helper thread while this worker handles the hands
+        face_job = _get_model_executor().submit(_process_face, mp_image, face_pool, stream,
+                                                results)
+        _process_hands(mp_image, hand_pool, stream, results)
+        face_job.result()
+    else:
+        if hand_pool:
+            _process_hands(mp_image, hand_pool, stream, results)
+        if face_pool:
+            _process_face(mp_image, face_pool, stream, results)
+
+    return results
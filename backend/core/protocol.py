@@ -0,0 +1,298 @@
+"""
+Binary WebSocket frame protocol.
+
+Clients that connect with the ``pixelsight.binary.v1`` subprotocol may send
+frames as binary messages instead of base64 data URLs inside JSON. Each
+message is a fixed little-endian header followed by the raw image payload:
+
+    offset  size  field
+    0       1     version        (PROTOCOL_VERSION)
+    1       1     mode           (0 = unchanged, 1 = combined, 2 = hands, 3 = face)
+    2       1     pixel_format   (0 = JPEG, 1 = WebP, 2 = raw RGB)
+    3       1     flags          (reserved, 0)
+    4       4     sequence       (uint32)
+    8       8     timestamp_ms   (float64, client clock)
+    16      2     width          (raw formats only, else 0)
+    18      2     height         (raw formats only, else 0)
+
+JSON text messages (``config`` and ``image``) keep working on every
+connection.
+
+Results are sent as JSON by default. A client can switch any connection to
+packed binary results with ``{"config": {"results": "float16"}}`` (or
+``"int16"``). Packed results are a fixed little-endian header, a JSON
+metadata block and the quantized landmark data:
+
+    offset  size  field
+    0       1     version        (PROTOCOL_VERSION)
+    1       1     encoding       (1 = float16, 2 = int16 scaled by INT16_SCALE, 3 = delta)
+    2       1     hand_count
+    3       1     face_count
+    4       4     sequence       (uint32, echoed from the frame)
+    8       8     timestamp_ms   (float64, echoed from the frame)
+    16      2     hand_points    (landmarks per hand)
+    18      2     face_points    (landmarks per face)
+    20      4     meta_length    (bytes, always even)
+    24      ...   meta           (UTF-8 JSON: gestures, expressions, ...)
+    ...           landmarks      (hands then faces, x/y/z interleaved)
+
+With ``{"config": {"results": "delta"}}`` most messages only carry what
+changed since the previous message (see DeltaEncoder). Keyframes are plain
+int16 messages. Delta messages use encoding 3 and the same header. The
+meta of every message in this format holds ``msg``, a message number
+counted by the server: the header's sequence echoes the client's frame and
+is 0 for JSON frames, so it can't identify messages. Delta messages also
+hold ``base``, the ``msg`` of the message they apply to, and their
+landmark block is replaced by:
+
+    changed x uint16   indices of the landmarks that moved (hands then faces)
+    changed x 3 int8   x/y/z change of each, in int16 units
+
+A message is skipped entirely when nothing moved by more than the
+threshold and gestures/expressions are unchanged. A client whose last
+result is not ``base`` sends ``{"config": {"keyframe": true}}`` to resync.
+"""
+import json
+import struct
+from typing import NamedTuple
+
+import numpy as np
+
+from .landmarks import INT16_SCALE, quantize_float16, quantize_int16, round_landmarks
+
+PROTOCOL_VERSION = 1
+SUBPROTOCOL = 'pixelsight.binary.v1'
+
+HEADER = struct.Struct('<BBBBIdHH')
+HEADER_SIZE = HEADER.size
+
+MODE_UNCHANGED = 0
+MODES = {1: 'combined', 2: 'hands', 3: 'face'}
+MODE_CODES = {name: code for code, name in MODES.items()}
+
+RESULT_HEADER = struct.Struct('<BBBBIdHHI')
+
+RESULT_JSON = 'json'
+RESULT_FLOAT16 = 'float16'
+RESULT_INT16 = 'int16'
+RESULT_DELTA = 'delta'
+RESULT_ENCODINGS = {RESULT_FLOAT16: 1, RESULT_INT16: 2, RESULT_DELTA: 3}
+RESULT_FORMATS = (RESULT_JSON, RESULT_FLOAT16, RESULT_INT16, RESULT_DELTA)
+
+DEFAULT_KEYFRAME_INTERVAL = 30
+DEFAULT_DELTA_THRESHOLD = 0.0005  # normalized units
+
+LANDMARK_KEYS = ('hand_landmarks', 'face_landmarks')
+
+PIXEL_JPEG = 0
+PIXEL_WEBP = 1
+PIXEL_RGB = 2
+ENCODED_FORMATS = (PIXEL_JPEG, PIXEL_WEBP)
+
+
+class ProtocolError(ValueError):
+    """Raised for binary frames that cannot be parsed."""
+
+
+class FrameHeader(NamedTuple):
+    version: int
+    mode: int
+    pixel_format: int
+    flags: int
+    sequence: int
+    timestamp_ms: float
+    width: int
+    height: int
+
+
+def parse_frame(data):
+    """Split a binary message into its header and a zero-copy payload view."""
+    if len(data) < HEADER_SIZE:
+        raise ProtocolError(f"Frame too short ({len(data)} bytes)")
+    header = FrameHeader._make(HEADER.unpack_from(data))
+    if header.version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {header.version}")
+    return header, memoryview(data)[HEADER_SIZE:]
+
+
+def decode_image(header, payload, decoder):
+    """Decode a frame payload to an RGB image at the decoder's size, or None."""
+    if header.pixel_format in ENCODED_FORMATS:
+        return decoder.decode(payload)
+    if header.pixel_format == PIXEL_RGB:
+        buf = np.frombuffer(payload, np.uint8)
+        expected = header.width * header.height * 3
+        if not expected or buf.size != expected:
+            raise ProtocolError(f"RGB payload is {buf.size} bytes, expected {expected}")
+        return decoder.from_rgb(buf.reshape(header.height, header.width, 3))
+    raise ProtocolError(f"Unknown pixel format {header.pixel_format}")
+
+
+def pack_frame(payload, sequence=0, timestamp_ms=0.0, mode=MODE_UNCHANGED,
+               pixel_format=PIXEL_JPEG, width=0, height=0):
+    """Build a binary frame message (used by clients and tools)."""
+    header = HEADER.pack(PROTOCOL_VERSION, mode, pixel_format, 0,
+                         sequence & 0xFFFFFFFF, timestamp_ms, width, height)
+    return header + bytes(payload)
+
+
+def _landmarks_to_dicts(landmarks):
+    return [{'x': x, 'y': y, 'z': z} for x, y, z in round_landmarks(landmarks).tolist()]
+
+
+def encode_json_results(results):
+    """Serialize results with landmark arrays as lists of {'x','y','z'} dicts."""
+    data = dict(results)
+    for key in LANDMARK_KEYS:
+        data[key] = [_landmarks_to_dicts(lms) for lms in results[key]]
+    return json.dumps(data)
+
+
+def _stack(landmark_arrays):
+    if not landmark_arrays:
+        return np.empty((0, 0, 3), np.float32)
+    return np.stack(landmark_arrays)
+
+
+def _meta(results):
+    return {key: value for key, value in results.items() if key not in LANDMARK_KEYS}
+
+
+def _pack(encoding, hands, faces, meta, data, sequence, timestamp_ms):
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode()
+    if len(meta_bytes) % 2:
+        # Keep the landmark block 2-byte aligned for typed-array views
+        meta_bytes += b' '
+    header = RESULT_HEADER.pack(PROTOCOL_VERSION, RESULT_ENCODINGS[encoding],
+                                hands.shape[0], faces.shape[0],
+                                sequence & 0xFFFFFFFF, timestamp_ms,
+                                hands.shape[1], faces.shape[1], len(meta_bytes))
+    return b''.join((header, meta_bytes, data))
+
+
+def pack_results(results, encoding, sequence=0, timestamp_ms=0.0):
+    """Build a packed binary result message from landmark arrays."""
+    hands = _stack(results['hand_landmarks'])
+    faces = _stack(results['face_landmarks'])
+
+    coords = np.concatenate((hands.ravel(), faces.ravel()))
+    if encoding == RESULT_FLOAT16:
+        data = quantize_float16(coords)
+    elif encoding == RESULT_INT16:
+        data = quantize_int16(coords)
+    else:
+        raise ValueError(f"Unknown result encoding {encoding!r}")
+
+    return _pack(encoding, hands, faces, _meta(results), data.tobytes(), sequence, timestamp_ms)
+
+
+class DeltaEncoder:
+    """Per-connection encoder for the ``delta`` result format.
+
+    Keeps the int16 landmarks the client holds so deltas never drift: a
+    landmark is only sent once it has moved by ``threshold`` from what the
+    client last received. A keyframe is sent first, every
+    ``keyframe_interval`` frames, when the number of hands/faces changes,
+    and when a change doesn't fit in int8.
+
+    Messages are numbered by the encoder (``msg`` in the meta) and deltas
+    name the message they apply to (``base``), independently of the frame
+    sequence numbers echoed in the header.
+    """
+
+    def __init__(self, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 threshold=DEFAULT_DELTA_THRESHOLD):
+        self.keyframe_interval = keyframe_interval
+        self.threshold = max(1, round(threshold * INT16_SCALE))
+        self.keyframes = 0
+        self.deltas = 0
+        self.skipped = 0
+        # Not restarted by reset(), so a client can't mistake a message for an older one
+        self._messages = 0
+        self.reset()
+
+    def reset(self):
+        """Make the next message a keyframe."""
+        self._reference = None
+        self._shape = None
+        self._state = None
+        self._since_keyframe = 0
+
+    def _next_message(self):
+        self._messages = (self._messages + 1) & 0xFFFFFFFF
+        return self._messages
+
+    def pack(self, results, sequence=0, timestamp_ms=0.0):
+        """Return the message for these results, or None if there is nothing to send."""
+        hands = _stack(results['hand_landmarks'])
+        faces = _stack(results['face_landmarks'])
+        shape = (hands.shape[:2], faces.shape[:2])
+        coords = quantize_int16(np.concatenate((hands.ravel(), faces.ravel()))).reshape(-1, 3)
+        meta = _meta(results)
+        # Timings change every frame and don't make a message worth sending
+        state = {key: value for key, value in meta.items() if key != 'timings'}
+
+        if (self._reference is not None and shape == self._shape
+                and self._since_keyframe < self.keyframe_interval):
+            delta = coords.astype(np.int32) - self._reference
+            changed = np.flatnonzero(np.abs(delta).max(axis=1) >= self.threshold)
+            delta = delta[changed]
+            if not delta.size or np.abs(delta).max() <= 127:
+                self._since_keyframe += 1
+                if not changed.size and state == self._state:
+                    self.skipped += 1
+                    return None
+                self._reference[changed] += delta
+                meta['base'] = self._messages
+                meta['msg'] = self._next_message()
+                self._state = state
+                self.deltas += 1
+                data = changed.astype('<u2').tobytes() + delta.astype('<i1').tobytes()
+                return _pack(RESULT_DELTA, hands, faces, meta, data, sequence, timestamp_ms)
+
+        self._reference = coords.astype(np.int32)
+        self._shape = shape
+        self._state = state
+        self._since_keyframe = 0
+        meta['msg'] = self._next_message()
+        self.keyframes += 1
+        return _pack(RESULT_INT16, hands, faces, meta, coords.tobytes(), sequence, timestamp_ms)
+
+
+def unpack_results(data, previous=None):
+    """Decode a packed result message back into landmark arrays (for tools).
+
+    Delta messages are applied to ``previous``, the last decoded result.
+    """
+    (version, encoding, hand_count, face_count, sequence, timestamp_ms,
+     hand_points, face_points, meta_length) = RESULT_HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    offset = RESULT_HEADER.size
+    results = json.loads(bytes(data[offset:offset + meta_length]))
+    offset += meta_length
+
+    if encoding == RESULT_ENCODINGS[RESULT_DELTA]:
+        if previous is None or previous.get('msg') != results['base']:
+            raise ProtocolError("Delta does not apply to the previous result, a keyframe is needed")
+        count = (len(data) - offset) // 5
+        changed = np.frombuffer(data, '<u2', count, offset)
+        delta = np.frombuffer(data, '<i1', count * 3, offset + count * 2).reshape(count, 3)
+        coords = np.concatenate(
+            [np.ravel(points) for key in LANDMARK_KEYS for points in previous[key]]
+            or [np.empty(0, np.float32)])
+        coords = np.rint(coords * INT16_SCALE).reshape(-1, 3)
+        coords[changed] += delta
+        coords = (coords / INT16_SCALE).astype(np.float32).ravel()
+    else:
+        dtype = '<f2' if encoding == RESULT_ENCODINGS[RESULT_FLOAT16] else '<i2'
+        coords = np.frombuffer(data, dtype, offset=offset).astype(np.float32)
+        if encoding == RESULT_ENCODINGS[RESULT_INT16]:
+            coords /= INT16_SCALE
+
+    hand_size = hand_count * hand_points * 3
+    results['hand_landmarks'] = list(coords[:hand_size].reshape(hand_count, hand_points, 3))
+    results['face_landmarks'] = list(coords[hand_size:].reshape(face_count, face_points, 3))
+    results['seq'] = sequence
+    results['timestamp'] = timestamp_ms
+    return results
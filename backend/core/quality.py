@@ -0,0 +1,112 @@
+"""
+Per-connection input resolution control.
+
+Each stream runs inference at one step of a resolution ladder. Clients may
+negotiate a ceiling; within it the controller trades precision for
+throughput based on what it measures:
+
+- when inference latency exceeds the target, it steps down;
+- when detections drop out (landmarks seen on the previous frame are lost)
+  and the next step is predicted to stay within the target, it steps up.
+
+A cooldown between changes keeps it from oscillating.
+"""
+
+DEFAULT_LADDER = [(160, 120), (240, 180), (320, 240), (480, 360), (640, 480)]
+DEFAULT_TARGET_LATENCY_MS = 40.0
+
+EWMA_ALPHA = 0.2
+COOLDOWN_FRAMES = 15
+DROPOUT_THRESHOLD = 0.2
+STEP_UP_HEADROOM = 0.8  # predicted latency must stay under 80% of the target
+
+
+def _parse_resolution(resolution):
+    if (not isinstance(resolution, (list, tuple)) or len(resolution) != 2
+            or not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+                       for value in resolution)):
+        raise ValueError(f"Invalid resolution {resolution!r}, expected [width, height]")
+    return int(resolution[0]), int(resolution[1])
+
+
+class ResolutionController:
+    def __init__(self, ladder=None, start=None, ceiling=None,
+                 target_latency_ms=DEFAULT_TARGET_LATENCY_MS, adaptive=True):
+        self.ladder = sorted(tuple(size) for size in (ladder or DEFAULT_LADDER))
+        self.target_latency_ms = target_latency_ms
+        self.adaptive = adaptive
+        self.server_ceiling = self._index_at_most(ceiling) if ceiling else len(self.ladder) - 1
+        self.ceiling = self.server_ceiling
+        self.index = min(self._index_at_most(start) if start else 0, self.ceiling)
+
+        self.latency_ewma = None
+        self.dropout_rate = 0.0
+        self._had_detection = False
+        self._cooldown = 0
+
+    def _index_at_most(self, size):
+        """Largest ladder step no bigger than ``size`` (the smallest step at minimum)"""
+        width, height = size
+        index = 0
+        for i, (step_width, step_height) in enumerate(self.ladder):
+            if step_width <= width and step_height <= height:
+                index = i
+        return index
+
+    @property
+    def size(self):
+        return self.ladder[self.index]
+
+    @property
+    def max_size(self):
+        return self.ladder[self.ceiling]
+
+    def negotiate(self, resolution=None, adaptive=None):
+        """Apply a client's requested resolution ceiling and adaptivity.
+
+        Raises ValueError, changing nothing, if ``resolution`` isn't [width, height].
+        """
+        if resolution is not None:
+            resolution = _parse_resolution(resolution)
+            # Start at the requested step; adaptation may lower it later
+            self.ceiling = min(self._index_at_most(resolution), self.server_ceiling)
+            self.index = self.ceiling
+        if adaptive is not None:
+            self.adaptive = bool(adaptive)
+        self._cooldown = COOLDOWN_FRAMES
+        return self.size
+
+    def update(self, latency_ms, detected):
+        """Record one processed frame; returns the new size if it should change."""
+        if self.latency_ewma is None:
+            self.latency_ewma = latency_ms
+        else:
+            self.latency_ewma += EWMA_ALPHA * (latency_ms - self.latency_ewma)
+        dropout = self._had_detection and not detected
+        self.dropout_rate += EWMA_ALPHA * (dropout - self.dropout_rate)
+        self._had_detection = detected
+
+        if not self.adaptive:
+            return None
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return None
+
+        index = self.index
+        if self.latency_ewma > self.target_latency_ms and index > 0:
+            index -= 1
+        elif self.dropout_rate > DROPOUT_THRESHOLD and index < self.ceiling:
+            width, height = self.ladder[index]
+            next_width, next_height = self.ladder[index + 1]
+            predicted = self.latency_ewma * (next_width * next_height) / (width * height)
+            if predicted < self.target_latency_ms * STEP_UP_HEADROOM:
+                index += 1
+
+        if index == self.index:
+            return None
+        self.index = index
+        self._cooldown = COOLDOWN_FRAMES
+        # Measurements at the old size no longer apply
+        self.latency_ewma = None
+        self.dropout_rate = 0.0
+        return self.size
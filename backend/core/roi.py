@@ -0,0 +1,73 @@
+"""
+Per-connection region-of-interest tracking.
+
+Hands and faces usually cover a small part of the frame and move little
+between frames. Once landmarks have been found, the next frames are cropped
+to the region around them (see FrameDecoder.set_crop), so the detectors see
+that region at a higher effective resolution for the same pixel count.
+
+The region is kept while the landmarks stay well inside it, so crops stay
+stable for VIDEO-mode tracking. Frames go back to full-frame detection
+when landmarks are lost, and every ``redetect_interval`` frames so that
+hands or faces entering the picture are found.
+"""
+import numpy as np
+
+DEFAULT_MARGIN = 0.25  # padding around the landmarks, relative to their extent
+DEFAULT_MIN_SIZE = 0.3  # smallest region, relative to the frame
+DEFAULT_REDETECT_INTERVAL = 30  # cropped frames between full-frame passes
+
+
+class RoiTracker:
+    def __init__(self, margin=DEFAULT_MARGIN, min_size=DEFAULT_MIN_SIZE,
+                 redetect_interval=DEFAULT_REDETECT_INTERVAL):
+        self.margin = margin
+        self.min_size = min_size
+        self.redetect_interval = redetect_interval
+        self.region = None  # normalized (x0, y0, x1, y1), None = full frame
+        self._cropped_frames = 0
+
+    def reset(self):
+        self.region = None
+        self._cropped_frames = 0
+
+    def _expand(self, low, high, margin):
+        """Grow a bounding box by ``margin`` of its extent (at least min_size), clamped
+        to the frame"""
+        center = (low + high) / 2
+        extent = np.maximum((high - low) * (1 + 2 * margin), self.min_size)
+        low = np.clip(center - extent / 2, 0.0, 1.0)
+        high = np.clip(center + extent / 2, 0.0, 1.0)
+        return low, high
+
+    def update(self, landmark_arrays):
+        """Record the landmarks found in a frame, in source coordinates.
+
+        Returns the region to crop the next frame to, or None for the full frame.
+        """
+        if not landmark_arrays:
+            self.reset()
+            return None
+
+        if self.region is not None:
+            self._cropped_frames += 1
+            if self._cropped_frames >= self.redetect_interval:
+                self.reset()
+                return None
+
+        points = np.concatenate([landmarks[:, :2] for landmarks in landmark_arrays])
+        low, high = points.min(axis=0), points.max(axis=0)
+
+        if self.region is not None:
+            # Keep the current region while the landmarks, with half the
+            # margin, are inside it and it isn't much larger than needed
+            inner_low, inner_high = self._expand(low, high, self.margin / 2)
+            region_low, region_high = np.array(self.region[:2]), np.array(self.region[2:])
+            wanted_low, wanted_high = self._expand(low, high, self.margin)
+            if (np.all(inner_low >= region_low) and np.all(inner_high <= region_high)
+                    and np.prod(region_high - region_low) <= 2 * np.prod(wanted_high - wanted_low)):
+                return self.region
+
+        low, high = self._expand(low, high, self.margin)
+        self.region = (float(low[0]), float(low[1]), float(high[0]), float(high[1]))
+        return self.region
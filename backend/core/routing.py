@@ -3,4 +3,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/detection/$', consumers.VideoConsumer.as_asgi()),
+    re_path(r'ws/assets/jobs/(?P<job_id>[0-9a-f-]{36})/$',
+            consumers.GenerationJobConsumer.as_asgi()),
 ]
@@ -0,0 +1,49 @@
+"""
+JSON representations of assets and generation jobs.
+
+``build_url`` turns a path into an absolute URL: request.build_absolute_uri
+in views, or the connection's host for WebSocket messages.
+"""
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+
+def variant_urls(variants, url):
+    """ARAsset.variants with each stored file's name replaced by url(name)"""
+    return {name: {key: url(value) if isinstance(value, str) else value
+                   for key, value in variant.items()}
+            for name, variant in variants.items()}
+
+
+def asset_data(asset, build_url):
+    return {
+        'id': str(asset.id),
+        'name': asset.name,
+        'asset_type': asset.asset_type,
+        'anchor': asset.anchor,
+        'file_url': build_url(asset.file.url) if asset.file else '',
+        'variants': variant_urls(asset.variants, lambda name: build_url(default_storage.url(name))),
+        'scale': asset.scale,
+        'position_offset': asset.position_offset,
+        'rotation_offset': asset.rotation_offset,
+        'created_at': asset.created_at.isoformat()
+    }
+
+
+def job_data(job, build_url):
+    data = {
+        'id': str(job.id),
+        'status': job.status,
+        'prompt': job.prompt,
+        'anchor': job.anchor,
+        'cached': job.cached,
+        'status_url': build_url(reverse('asset-job', args=[job.id])),
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == 'SUCCEEDED' and job.asset is not None:
+        data['asset'] = asset_data(job.asset, build_url)
+    if job.status == 'FAILED':
+        data['error'] = job.error
+    return data
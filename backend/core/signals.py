@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import ingest
+from .models import ARAsset
+
+
+@receiver(post_save, sender=ARAsset)
+def process_new_asset(sender, instance, created, raw=False, **kwargs):
+    # Deduplicated uploads arrive with their variants already
+    if created and not raw and not instance.variants and instance.asset_type == '2D_IMAGE':
+        ingest.schedule(instance.id)
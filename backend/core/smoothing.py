@@ -0,0 +1,123 @@
+"""
+Per-stream landmark smoothing and prediction.
+
+Landmarks are filtered with a One Euro filter (Casiez et al., 2012): a
+low-pass filter whose cutoff rises with speed, so jitter is removed while
+the hand or face is still and lag stays low while it moves. All landmarks
+of a hand or face are filtered at once as one array, with the cutoff
+driven by their mean velocity (far less noisy than any single landmark's).
+
+The filter's velocity estimate is also used to extrapolate landmarks to
+the capture time of frames that were never processed, so results can be
+sent for every client frame while inference runs at a lower rate.
+"""
+import numpy as np
+
+from .protocol import LANDMARK_KEYS
+
+DEFAULT_MIN_CUTOFF = 1.0  # Hz, smoothing while still
+DEFAULT_BETA = 60.0  # cutoff increase per normalized unit/s of speed
+DEFAULT_D_CUTOFF = 1.0  # Hz, smoothing of the velocity estimate
+DEFAULT_MAX_PREDICTION_MS = 200
+
+
+def _alpha(cutoff, dt):
+    """Smoothing factor of a first-order low-pass filter"""
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    """One Euro filter over an (N, 3) array of landmarks sampled together."""
+
+    def __init__(self, min_cutoff=DEFAULT_MIN_CUTOFF, beta=DEFAULT_BETA, d_cutoff=DEFAULT_D_CUTOFF):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.value = None
+        self.velocity = None
+        self.timestamp = None
+
+    def __call__(self, value, timestamp):
+        """Filter ``value`` sampled at ``timestamp`` (seconds); returns a new array."""
+        if self.value is None:
+            self.value = value.astype(np.float32)
+            self.velocity = np.zeros_like(self.value)
+            self.timestamp = timestamp
+            return self.value.copy()
+
+        dt = timestamp - self.timestamp
+        if dt <= 0:
+            # Out-of-order or duplicate sample, nothing to filter against
+            return self.value.copy()
+
+        velocity = (value - self.value) / dt
+        self.velocity += _alpha(self.d_cutoff, dt) * (velocity - self.velocity)
+        speed = np.linalg.norm(self.velocity.reshape(-1, 3).mean(axis=0))
+        cutoff = self.min_cutoff + self.beta * speed
+        self.value += _alpha(cutoff, dt) * (value - self.value)
+        self.timestamp = timestamp
+        return self.value.copy()
+
+    def predict(self, timestamp):
+        """Extrapolate the filtered value to ``timestamp`` at the estimated velocity."""
+        return self.value + self.velocity * (timestamp - self.timestamp)
+
+
+def _centroid(points):
+    return points[:, :2].mean(axis=0)
+
+
+class LandmarkSmoother:
+    """Smooths a stream's results and predicts results for skipped frames.
+
+    Each detected hand or face keeps its own filter. Filters follow the
+    nearest hand/face from frame to frame (MediaPipe doesn't keep their
+    order stable) and are dropped when it is no longer detected.
+    """
+
+    def __init__(self, min_cutoff=DEFAULT_MIN_CUTOFF, beta=DEFAULT_BETA, d_cutoff=DEFAULT_D_CUTOFF,
+                 max_prediction_ms=DEFAULT_MAX_PREDICTION_MS):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.max_prediction_ms = max_prediction_ms
+        self._filters = {key: [] for key in LANDMARK_KEYS}
+        self._last = None  # last results and their timestamp, for predictions
+
+    def _match(self, filters, landmark_arrays):
+        """Pair each landmark array with the nearest existing filter, or a new one"""
+        available = list(filters)
+        matched = []
+        for points in landmark_arrays:
+            best = None
+            if available:
+                center = _centroid(points)
+                best = min(available, key=lambda f: np.linalg.norm(_centroid(f.value) - center))
+                available.remove(best)
+            matched.append(best or OneEuroFilter(self.min_cutoff, self.beta, self.d_cutoff))
+        return matched
+
+    def update(self, results, timestamp_ms):
+        """Replace the landmarks in ``results`` with their smoothed values."""
+        timestamp = timestamp_ms / 1000
+        for key in LANDMARK_KEYS:
+            filters = self._match(self._filters[key], results[key])
+            results[key] = [f(points, timestamp) for f, points in zip(filters, results[key])]
+            self._filters[key] = filters
+        self._last = (results, timestamp_ms)
+        return results
+
+    def predict(self, timestamp_ms):
+        """Results extrapolated to ``timestamp_ms``, or None if too far from the last frame."""
+        if self._last is None:
+            return None
+        last, last_ms = self._last
+        if not 0 < timestamp_ms - last_ms <= self.max_prediction_ms:
+            return None
+        results = {key: value for key, value in last.items() if key not in LANDMARK_KEYS}
+        results['timings'] = {}
+        results['predicted'] = True
+        for key in LANDMARK_KEYS:
+            results[key] = [f.predict(timestamp_ms / 1000) for f in self._filters[key]]
+        return results
@@ -1,3 +1,1450 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import math
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import cv2
+import numpy as np
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from mediapipe.tasks.python import vision
+from PIL import Image
+
+from . import asset_cache, asset_list, consumers, detectors, inference, ingest, jobs, metrics
+from .consumers import VideoConsumer
+from .decoding import IDENTITY, FrameDecoder
+from .detectors import DetectorPool, DetectorPoolTimeout, VideoStream
+from .expressions import (
+    BLENDSHAPE_INDEX, BLENDSHAPE_NAMES, ExpressionRules, ExpressionTracker, blendshapes_to_array,
+)
+from .inference import (
+    BatchingInferenceBackend, ChannelLayerInferenceBackend, InferenceBusy, InferenceWorker,
+    ProcessInferenceBackend, ThreadInferenceBackend,
+)
+from .landmarks import INT16_SCALE, extract_landmarks, round_landmarks, unletterbox
+from .management.commands import loadtest
+from .matting import legacy_matte, remove_white_background
+from .models import ARAsset, GenerationJob
+from .pipeline import process_batch, process_frame
+from .protocol import (
+    MODE_CODES, PIXEL_RGB, PROTOCOL_VERSION, RESULT_INT16, SUBPROTOCOL, DeltaEncoder,
+    ProtocolError, pack_frame, pack_results, parse_frame, unpack_results,
+)
+from .quality import COOLDOWN_FRAMES, ResolutionController
+from .roi import RoiTracker
+from .smoothing import LandmarkSmoother, OneEuroFilter
+
+
+class FakeDetector:
+    """Stands in for a MediaPipe detector; finds nothing"""
+
+    def __init__(self, running_mode):
+        self.running_mode = running_mode
+        self.video_calls = []  # (image, timestamp) for VIDEO mode
+        self.closed = False
+
+    def recognize(self, image):
+        return SimpleNamespace(gestures=[], hand_landmarks=[])
+
+    def detect(self, image):
+        return SimpleNamespace(face_blendshapes=[], face_landmarks=[])
+
+    def recognize_for_video(self, image, timestamp_ms):
+        self.video_calls.append((image, timestamp_ms))
+        return self.recognize(image)
+
+    def detect_for_video(self, image, timestamp_ms):
+        self.video_calls.append((image, timestamp_ms))
+        return self.detect(image)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDetectorsMixin:
+    """Loads FakeDetector in place of every model, into pools of the test's own"""
+
+    def setUp(self):
+        super().setUp()
+        factories = {kind: (model, FakeDetector)
+                     for kind, (model, _) in detectors.DETECTORS.items()}
+        for patcher in (mock.patch.dict(detectors.DETECTORS, factories),
+                        mock.patch.dict(detectors._pools, clear=True),
+                        mock.patch.dict(detectors._video_timestamps, clear=True),
+                        mock.patch.object(detectors, 'model_available', return_value=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class DetectorPoolTests(FakeDetectorsMixin, SimpleTestCase):
+    def _pool(self, size=1, idle_timeout=None):
+        return DetectorPool('face', vision.RunningMode.IMAGE, size, idle_timeout)
+
+    def test_detectors_are_created_on_demand_and_reused(self):
+        pool = self._pool(size=2)
+        with pool.checkout() as first:
+            with pool.checkout() as second:
+                self.assertIsNot(first, second)
+        with pool.checkout() as again:
+            self.assertIn(again, (first, second))
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['idle'], stats['checkouts']), (2, 2, 3))
+
+    def test_checkout_waits_for_a_release(self):
+        pool = self._pool()
+        detector = pool.acquire()
+        threading.Timer(0.05, pool.release, (detector,)).start()
+        with pool.checkout(timeout=5) as waited_for:
+            self.assertIs(waited_for, detector)
+        self.assertGreaterEqual(pool.stats()['wait_max_ms'], 40)
+
+    def test_checkout_times_out(self):
+        pool = self._pool()
+        pool.acquire()
+        with self.assertRaises(DetectorPoolTimeout):
+            pool.acquire(timeout=0.01)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_failed_creation_frees_its_slot(self):
+        pool = self._pool()
+        with mock.patch.object(pool, '_factory', side_effect=RuntimeError('no model')):
+            with self.assertRaises(RuntimeError):
+                pool.acquire(timeout=0)
+        self.assertIsInstance(pool.acquire(timeout=0), FakeDetector)
+
+    def test_warm_up(self):
+        pool = self._pool(size=3)
+        pool.warm_up(2)
+        self.assertEqual((pool.stats()['created'], pool.stats()['idle']), (2, 2))
+
+    def test_shared_pools(self):
+        self.assertIs(detectors.get_pool('face'), detectors.get_pool('face'))
+        self.assertIsNot(detectors.get_pool('face'),
+                         detectors.get_pool('face', vision.RunningMode.VIDEO))
+        with mock.patch.object(detectors, 'model_available', return_value=False):
+            self.assertIsNone(detectors.get_pool('hand'))
+
+    def test_idle_detectors_are_closed_and_replaced(self):
+        pool = self._pool(idle_timeout=0.01)
+        with pool.checkout() as detector:
+            pass
+        time.sleep(0.02)
+        self.assertEqual(pool.evict_idle(), 1)
+        self.assertTrue(detector.closed)
+        with pool.checkout() as replacement:
+            self.assertIsNot(replacement, detector)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['evicted']), (1, 1))
+
+    def test_recently_used_detectors_are_kept(self):
+        pool = self._pool(idle_timeout=60)
+        pool.warm_up()
+        self.assertEqual(pool.evict_idle(), 0)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_warm_up_only_configured_kinds(self):
+        with self.settings(DETECTOR_POOL_WARMUP=['face']):
+            detectors.warm_up_pools(1)
+        self.assertEqual([stats['kind'] for stats in detectors.pool_stats()], ['face'])
+
+    def test_close_pools(self):
+        with detectors.get_pool('face').checkout() as detector:
+            pass
+        detectors.close_pools()
+        self.assertTrue(detector.closed)
+        self.assertEqual(detectors.pool_stats(), [])
+
+
+def _results(hands=(), faces=(), **meta):
+    results = {'hand_landmarks': [np.asarray(h, np.float32) for h in hands],
+               'face_landmarks': [np.asarray(f, np.float32) for f in faces],
+               'gestures': [], 'expressions': []}
+    results.update(meta)
+    return results
+
+
+def _hand(offset=0.0):
+    """21 distinct points, shifted by ``offset``"""
+    return np.linspace(0.1, 0.9, 63, dtype=np.float32).reshape(21, 3) + offset
+
+
+class FrameProtocolTests(SimpleTestCase):
+    def test_header_round_trip(self):
+        data = pack_frame(b'\x01\x02\x03', sequence=7, timestamp_ms=12.5,
+                          mode=MODE_CODES['face'], pixel_format=PIXEL_RGB, width=4, height=2)
+        header, payload = parse_frame(data)
+        self.assertEqual(header.version, PROTOCOL_VERSION)
+        self.assertEqual(header.mode, MODE_CODES['face'])
+        self.assertEqual(header.pixel_format, PIXEL_RGB)
+        self.assertEqual((header.sequence, header.timestamp_ms), (7, 12.5))
+        self.assertEqual((header.width, header.height), (4, 2))
+        self.assertEqual(bytes(payload), b'\x01\x02\x03')
+
+    def test_sequence_wraps(self):
+        header, _ = parse_frame(pack_frame(b'', sequence=2 ** 32 + 5))
+        self.assertEqual(header.sequence, 5)
+
+    def test_rejects_short_frame(self):
+        with self.assertRaises(ProtocolError):
+            parse_frame(b'\x01\x00')
+
+    def test_rejects_unknown_version(self):
+        data = bytearray(pack_frame(b'jpeg'))
+        data[0] = PROTOCOL_VERSION + 1
+        with self.assertRaises(ProtocolError):
+            parse_frame(bytes(data))
+
+
+class StubBackend:
+    """Inference backend for consumer tests, recording the frames it gets"""
+    supports_streams = False
+    workers = 1
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.pending = 0
+        self.busy = False  # refuse frames like a full queue when set
+        self.gate = None  # frames wait for this event when set
+        self.calls = []  # (frame shape, mode, timestamp, monotonic start)
+
+    async def process(self, frame, mode, stream=None, timestamp_ms=0.0):
+        if self.busy:
+            raise InferenceBusy()
+        self.calls.append((frame.shape, mode, timestamp_ms, time.monotonic()))
+        if self.gate is not None:
+            await self.gate.wait()
+        await asyncio.sleep(self.delay)
+        return _results(timings={})
+
+
+def _rgb_frame(sequence=0, timestamp_ms=0.0, mode='face'):
+    pixels = np.zeros((120, 160, 3), np.uint8)
+    return pack_frame(pixels, sequence, timestamp_ms, MODE_CODES[mode], PIXEL_RGB, 160, 120)
+
+
+def _json_frame(**fields):
+    _, jpeg = cv2.imencode('.jpg', np.zeros((120, 160, 3), np.uint8))
+    return {'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode(), **fields}
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   LANDMARK_SMOOTHING=False)
+class VideoConsumerTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = StubBackend()
+        patcher = mock.patch.object(consumers, 'get_backend', return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _connect(self, binary=True, path='/ws/detection/'):
+        communicator = WebsocketCommunicator(
+            VideoConsumer.as_asgi(), path, subprotocols=[SUBPROTOCOL] if binary else [])
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _frames_started(self, count):
+        while len(self.backend.calls) < count:
+            await asyncio.sleep(0.001)
+
+    async def test_binary_frames(self):
+        communicator = await self._connect()
+        await communicator.send_to(bytes_data=_rgb_frame(5, 100.0, 'face'))
+        results = await communicator.receive_json_from()
+        self.assertEqual((results['seq'], results['timestamp']), (5, 100.0))
+        self.assertEqual(self.backend.calls[0][:3], ((120, 160, 3), 'face', 100.0))
+        await communicator.disconnect()
+
+    async def test_json_frames(self):
+        communicator = await self._connect(binary=False)
+        await communicator.send_json_to(_json_frame())
+        results = await communicator.receive_json_from()
+        self.assertNotIn('seq', results)
+        self.assertEqual(self.backend.calls[0][:2], ((120, 160, 3), 'combined'))
+        await communicator.disconnect()
+
+    async def test_mode_from_query_string(self):
+        for query, mode in (('?mode=face', 'face'), ('?mode=legs', 'combined')):
+            communicator = await self._connect(binary=False, path='/ws/detection/' + query)
+            await communicator.send_json_to(_json_frame())
+            await communicator.receive_json_from()
+            self.assertEqual(self.backend.calls[-1][1], mode)
+            await communicator.disconnect()
+
+    async def test_packed_results(self):
+        communicator = await self._connect()
+        await communicator.send_json_to({'config': {'results': RESULT_INT16}})
+        await communicator.send_to(bytes_data=_rgb_frame(5, 100.0, 'face'))
+        results = unpack_results(await communicator.receive_from())
+        self.assertEqual((results['seq'], results['face_landmarks']), (5, []))
+        await communicator.disconnect()
+
+    async def test_malformed_binary_frame_is_dropped(self):
+        communicator = await self._connect()
+        await communicator.send_to(bytes_data=b'\x01\x02')
+        self.assertTrue(await communicator.receive_nothing())
+        self.assertEqual(self.backend.calls, [])
+        await communicator.disconnect()
+
+    async def test_frames_are_dropped_while_backend_is_busy(self):
+        self.backend.busy = True
+        communicator = await self._connect()
+        await communicator.send_to(bytes_data=_rgb_frame(5))
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_config_errors_are_reported(self):
+        communicator = await self._connect()
+        for config in ({'mode': 'legs'}, {'resolution': 'large'}):
+            await communicator.send_json_to({'config': config})
+            self.assertIn('error', await communicator.receive_json_from())
+        await communicator.disconnect()
+
+    async def test_newest_waiting_frame_is_processed(self):
+        self.backend.gate = asyncio.Event()
+        communicator = await self._connect()
+        await communicator.send_to(bytes_data=_rgb_frame(1, 1000.0))
+        await self._frames_started(1)
+        superseded = metrics.frames_superseded.value
+        for sequence in (2, 3, 4):
+            await communicator.send_to(bytes_data=_rgb_frame(sequence, 1000.0 + sequence))
+        while metrics.frames_superseded.value < superseded + 2:
+            await asyncio.sleep(0.001)
+        self.backend.gate.set()
+        self.assertEqual((await communicator.receive_json_from())['seq'], 1)
+        self.assertEqual((await communicator.receive_json_from())['seq'], 4)
+        self.assertEqual(len(self.backend.calls), 2)
+        await communicator.disconnect()
+
+    async def _gap_between_frames(self):
+        self.backend.delay = 0.05
+        communicator = await self._connect()
+        await communicator.send_to(bytes_data=_rgb_frame(1, 1000.0))
+        await communicator.receive_json_from()
+        done = time.monotonic()
+        await communicator.send_to(bytes_data=_rgb_frame(2, 1100.0))
+        await communicator.receive_json_from()
+        await communicator.disconnect()
+        return self.backend.calls[1][3] - done
+
+    @override_settings(STREAM_MAX_DUTY_CYCLE=0.5)
+    async def test_paced_while_backend_is_saturated(self):
+        self.backend.pending = self.backend.workers
+        # Rests as long as the last frame took
+        self.assertGreater(await self._gap_between_frames(), 0.03)
+
+    @override_settings(STREAM_MAX_DUTY_CYCLE=0.5)
+    async def test_not_paced_while_workers_are_free(self):
+        self.assertLess(await self._gap_between_frames(), 0.03)
+
+    async def test_disconnect_stops_processing(self):
+        self.backend.supports_streams = True
+        with mock.patch.object(consumers, 'VideoStream') as video_stream:
+            communicator = await self._connect()
+            await communicator.disconnect()
+        video_stream.return_value.close.assert_called_once_with()
+        await asyncio.sleep(0)
+        running = [task for task in asyncio.all_tasks()
+                   if task.get_coro().__qualname__ == 'VideoConsumer._run_mailbox']
+        self.assertEqual(running, [])
+
+    async def test_unusable_timestamps_are_replaced(self):
+        communicator = await self._connect(binary=False)
+        await communicator.send_json_to(_json_frame(timestamp='133'))
+        await communicator.receive_json_from()
+        communicator_binary = await self._connect()
+        await communicator_binary.send_to(bytes_data=_rgb_frame(1, float('nan')))
+        await communicator_binary.receive_json_from()
+        timestamps = [timestamp for _, _, timestamp, _ in self.backend.calls]
+        self.assertTrue(all(isinstance(t, float) and math.isfinite(t) for t in timestamps))
+        await communicator.disconnect()
+        await communicator_binary.disconnect()
+
+
+class ResultPackingTests(SimpleTestCase):
+    def test_int16_round_trip(self):
+        results = _results([_hand()], [_hand(0.05)], gestures=['Open_Palm'])
+        unpacked = unpack_results(pack_results(results, RESULT_INT16, 3, 40.0))
+        self.assertEqual((unpacked['seq'], unpacked['timestamp']), (3, 40.0))
+        self.assertEqual(unpacked['gestures'], ['Open_Palm'])
+        np.testing.assert_allclose(unpacked['hand_landmarks'][0], _hand(), atol=1 / INT16_SCALE)
+        np.testing.assert_allclose(unpacked['face_landmarks'][0], _hand(0.05),
+                                   atol=1 / INT16_SCALE)
+
+    def test_empty_results(self):
+        unpacked = unpack_results(pack_results(_results(), RESULT_INT16))
+        self.assertEqual(unpacked['hand_landmarks'], [])
+        self.assertEqual(unpacked['face_landmarks'], [])
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            pack_results(_results(), 'int8')
+
+
+class LandmarkTests(SimpleTestCase):
+    def test_extract_landmarks(self):
+        points = [SimpleNamespace(x=0.1 * n, y=0.2, z=-0.01 * n) for n in range(5)]
+        hands = extract_landmarks([points, points[:2]])
+        self.assertEqual([hand.shape for hand in hands], [(5, 3), (2, 3)])
+        self.assertEqual(hands[0].dtype, np.float32)
+        np.testing.assert_allclose(hands[0][3], (0.3, 0.2, -0.03), rtol=1e-6)
+        self.assertEqual(extract_landmarks(None), [])
+        self.assertEqual(extract_landmarks([[]])[0].shape, (0, 3))
+
+    def test_round_landmarks(self):
+        rounded = round_landmarks(np.array([[0.123456, -0.98766, 0.00004]], np.float32))
+        self.assertEqual(rounded.tolist(), [[0.1235, -0.9877, 0.0]])
+
+
+def _blank_frame():
+    return np.zeros((120, 160, 3), np.uint8)
+
+
+class InferenceBackendTests(FakeDetectorsMixin, SimpleTestCase):
+    def test_thread_backend(self):
+        backend = ThreadInferenceBackend(workers=2, max_pending=4)
+        results = asyncio.run(backend.process(_blank_frame(), 'face'))
+        self.assertEqual(results['face_landmarks'], [])
+        self.assertIn('face_ms', results['timings'])
+        self.assertEqual(backend.stats()['pending'], 0)
+        backend.shutdown()
+        with self.assertRaises(RuntimeError):
+            asyncio.run(backend.process(_blank_frame(), 'face'))
+
+    def test_frames_beyond_the_limit_are_refused(self):
+        backend = ThreadInferenceBackend(workers=1, max_pending=1)
+        self.addCleanup(backend.shutdown)
+        release = threading.Event()
+
+        def slow_process_frame(*args):
+            release.wait(5)
+            return _results()
+
+        async def two_frames():
+            first = asyncio.create_task(backend.process(_blank_frame(), 'face'))
+            await asyncio.sleep(0)
+            with self.assertRaises(InferenceBusy):
+                await backend.process(_blank_frame(), 'face')
+            release.set()
+            await first
+
+        with mock.patch.object(inference, 'process_frame', slow_process_frame):
+            asyncio.run(two_frames())
+        self.assertEqual((backend.pending, backend.rejected), (0, 1))
+
+    @override_settings(DETECTOR_POOL_WARMUP=False)
+    def test_process_workers_follow_warmup_setting(self):
+        with mock.patch.object(inference, 'warm_up_pools') as warm_up_pools:
+            inference._init_worker('base.settings')
+        warm_up_pools.assert_not_called()
+
+    @skipUnless(detectors.model_available('face'), 'face model not installed')
+    def test_process_backend(self):
+        backend = ProcessInferenceBackend(workers=1, max_pending=2)
+        self.addCleanup(backend.shutdown)
+        results = asyncio.run(backend.process(_blank_frame(), 'face'))
+        self.assertEqual(results['face_landmarks'], [])
+        self.assertEqual(backend.pending, 0)
+        # The shared memory block is kept for the next frame
+        self.assertEqual(len(backend._slots), 1)
+
+
+class VideoStreamTests(FakeDetectorsMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = object()
+
+    def _video_pool(self, kind='face'):
+        return detectors.get_pool(kind, vision.RunningMode.VIDEO)
+
+    def test_timestamps_increase_per_detector(self):
+        stream = VideoStream(max_gap_ms=500)
+        for timestamp in (1000, 1033, 1066):
+            with stream.frame(timestamp):
+                stream.detect('face', self.image)
+        detector = stream._leases['face'][1]
+        # The first frame is preceded by a blank one to clear tracking state
+        self.assertEqual([timestamp for _, timestamp in detector.video_calls], [1, 2, 35, 68])
+        self.assertIs(detector.video_calls[0][0], detectors._BLANK_IMAGE)
+
+    def test_frames_too_far_apart_use_image_mode(self):
+        stream = VideoStream(max_gap_ms=500)
+        with stream.frame(1000):
+            self.assertIsNotNone(stream.detect('face', self.image))
+        for timestamp in (5000, 4000):
+            with stream.frame(timestamp):
+                self.assertIsNone(stream.detect('face', self.image))
+
+    def test_detector_of_another_stream_starts_afresh(self):
+        first = VideoStream()
+        with first.frame(1000):
+            first.detect('face', self.image)
+        detector = first._leases['face'][1]
+        first.close()
+        second = VideoStream()
+        with second.frame(0):
+            second.detect('face', self.image)
+        self.assertIs(second._leases['face'][1], detector)
+        images = [image for image, _ in detector.video_calls]
+        self.assertEqual(images, [detectors._BLANK_IMAGE, self.image] * 2)
+        timestamps = [timestamp for _, timestamp in detector.video_calls]
+        self.assertEqual(timestamps, sorted(set(timestamps)))
+
+    def test_geometry_change_starts_afresh(self):
+        stream = VideoStream()
+        for timestamp in (1000, 1033):
+            stream.set_geometry(IDENTITY)
+            with stream.frame(timestamp):
+                stream.detect('face', self.image)
+        stream.set_geometry((0.5, 0.5, 0.25, 0.25))
+        with stream.frame(1066):
+            stream.detect('face', self.image)
+        images = [image for image, _ in stream._leases['face'][1].video_calls]
+        blank = detectors._BLANK_IMAGE
+        self.assertEqual(images, [blank, self.image, self.image, blank, self.image])
+
+    def test_no_detector_free(self):
+        stream = VideoStream()
+        with self.settings(VIDEO_DETECTOR_POOL_SIZE=0):
+            with stream.frame(0):
+                self.assertIsNone(stream.detect('face', self.image))
+
+    def test_close_returns_detectors(self):
+        stream = VideoStream()
+        with stream.frame(0):
+            stream.detect('face', self.image)
+        self.assertEqual(self._video_pool().stats()['idle'], 0)
+        stream.close()
+        self.assertEqual(self._video_pool().stats()['idle'], 1)
+
+    def test_close_waits_for_the_running_frame(self):
+        stream = VideoStream()
+        with stream.frame(0):
+            stream.detect('face', self.image)
+            stream.close()
+            self.assertEqual(self._video_pool().stats()['idle'], 0)
+        self.assertEqual(self._video_pool().stats()['idle'], 1)
+
+    def test_bad_timestamp_does_not_keep_detectors(self):
+        stream = VideoStream()
+        with stream.frame(1000):
+            stream.detect('face', self.image)
+        with self.assertRaises(TypeError):
+            with stream.frame('1033'):
+                pass
+        stream.close()
+        self.assertEqual(self._video_pool().stats()['idle'], 1)
+
+    def test_unused_detectors_are_returned(self):
+        stream = VideoStream(lease_idle_seconds=0.1)
+        with stream.frame(1000):
+            stream.detect('hand', self.image)
+            stream.detect('face', self.image)
+        for timestamp in (1033, 1066):
+            time.sleep(0.06)
+            with stream.frame(timestamp):
+                stream.detect('face', self.image)
+        self.assertEqual(self._video_pool('hand').stats()['idle'], 1)
+        self.assertEqual(self._video_pool('face').stats()['idle'], 0)
+
+
+class PipelineTests(FakeDetectorsMixin, SimpleTestCase):
+    def test_combined_mode_runs_both_models(self):
+        for parallel in (True, False):
+            with self.settings(INFERENCE_PARALLEL_MODELS=parallel):
+                results = process_frame(_blank_frame(), 'combined')
+            self.assertEqual(set(results['timings']), {'hand_ms', 'face_ms'})
+
+    def test_single_model_modes(self):
+        self.assertEqual(set(process_frame(_blank_frame(), 'hands')['timings']), {'hand_ms'})
+        self.assertEqual(set(process_frame(_blank_frame(), 'face')['timings']), {'face_ms'})
+
+
+def _marked_image(width, height, x, y):
+    """Black RGB image with a white 4x4 block at pixel (x, y)"""
+    image = np.zeros((height, width, 3), np.uint8)
+    image[y:y + 4, x:x + 4] = 255
+    return image
+
+
+def _marker_position(frame):
+    """Normalized center of the white block in a decoded frame"""
+    ys, xs = np.nonzero(frame[..., 0] > 128)
+    height, width = frame.shape[:2]
+    return np.array([[(xs.mean() + 0.5) / width, (ys.mean() + 0.5) / height, 0.0]], np.float32)
+
+
+class FrameDecoderTests(SimpleTestCase):
+    def test_resizes_to_inference_size(self):
+        decoder = FrameDecoder(160, 120)
+        frame = decoder.from_rgb(_marked_image(640, 480, 320, 240))
+        self.assertEqual(frame.shape, (120, 160, 3))
+        np.testing.assert_allclose(_marker_position(frame)[0, :2],
+                                   ((320 + 2) / 640, (240 + 2) / 480), atol=0.02)
+
+    def test_letterboxes_other_aspect_ratios(self):
+        decoder = FrameDecoder(160, 120)
+        frame = decoder.from_rgb(_marked_image(320, 120, 240, 60))
+        self.assertEqual(frame.shape, (120, 160, 3))
+        # Scaled to 160x60 and centered, so rows above and below are padding
+        self.assertFalse(frame[:25].any())
+        self.assertFalse(frame[95:].any())
+        source = unletterbox(_marker_position(frame), decoder.transform)
+        np.testing.assert_allclose(source[0, :2], ((240 + 2) / 320, (60 + 2) / 120), atol=0.02)
+
+    def test_same_size_frames_are_not_copied(self):
+        decoder = FrameDecoder(160, 120)
+        image = _marked_image(160, 120, 10, 10)
+        self.assertIs(decoder.from_rgb(image), image)
+        self.assertEqual(decoder.transform, IDENTITY)
+
+    def test_buffer_is_reused(self):
+        decoder = FrameDecoder(160, 120)
+        first = decoder.from_rgb(_marked_image(320, 240, 0, 0))
+        second = decoder.from_rgb(_marked_image(320, 240, 100, 100))
+        self.assertIs(first, second)
+
+    def test_decodes_jpeg_to_rgb(self):
+        bgr = np.zeros((240, 320, 3), np.uint8)
+        bgr[..., 2] = 255  # red
+        _, jpeg = cv2.imencode('.jpg', bgr)
+        decoder = FrameDecoder(160, 120)
+        # The second frame is decoded at reduced scale
+        for _ in range(2):
+            frame = decoder.decode(jpeg.tobytes())
+            self.assertEqual(frame.shape, (120, 160, 3))
+            self.assertGreater(frame[..., 0].mean(), 200)
+            self.assertLess(frame[..., 2].mean(), 50)
+        self.assertIsNone(decoder.decode(b'not a jpeg'))
+
+    def test_crop_maps_back_to_source(self):
+        decoder = FrameDecoder(160, 120)
+        decoder.set_crop((0.5, 0.5, 1.0, 1.0))
+        frame = decoder.from_rgb(_marked_image(640, 480, 500, 400))
+        source = unletterbox(_marker_position(frame), decoder.transform)
+        np.testing.assert_allclose(source[0, :2], ((500 + 2) / 640, (400 + 2) / 480), atol=0.01)
+
+
+class ResolutionControllerTests(SimpleTestCase):
+    LADDER = [(160, 120), (320, 240), (640, 480)]
+
+    def _controller(self, **kwargs):
+        return ResolutionController(ladder=self.LADDER, start=(160, 120), target_latency_ms=40,
+                                    **kwargs)
+
+    def _feed(self, controller, latency_ms, detected, frames):
+        changes = [controller.update(latency_ms, detected) for _ in range(frames)]
+        return [size for size in changes if size is not None]
+
+    def test_negotiate_caps_at_server_ceiling(self):
+        controller = self._controller(ceiling=(320, 240))
+        self.assertEqual(controller.negotiate([1920, 1080]), (320, 240))
+        self.assertEqual(controller.negotiate((200, 200)), (160, 120))
+
+    def test_negotiate_rejects_malformed_resolution(self):
+        controller = self._controller()
+        for resolution in ('640x480', [640], [640, 0], [True, 480], ['640', '480'], 640):
+            with self.assertRaises(ValueError):
+                controller.negotiate(resolution)
+        self.assertEqual(controller.size, (160, 120))
+
+    def test_negotiate_adaptivity_only(self):
+        controller = self._controller()
+        self.assertEqual(controller.negotiate(adaptive=False), (160, 120))
+        self.assertFalse(controller.adaptive)
+
+    def test_steps_down_when_slow(self):
+        controller = self._controller()
+        controller.negotiate([640, 480])
+        changes = self._feed(controller, 100, True, COOLDOWN_FRAMES + 1)
+        self.assertEqual(changes, [(320, 240)])
+
+    def test_steps_up_on_dropouts_within_budget(self):
+        controller = self._controller()
+        changes = []
+        for frame in range(COOLDOWN_FRAMES * 2):
+            changes += self._feed(controller, 5, frame % 2 == 0, 1)
+        self.assertEqual(changes[:1], [(320, 240)])
+
+    def test_no_step_up_when_predicted_too_slow(self):
+        controller = self._controller()
+        changes = []
+        for frame in range(COOLDOWN_FRAMES * 2):
+            changes += self._feed(controller, 20, frame % 2 == 0, 1)
+        self.assertEqual(changes, [])
+
+    def test_fixed_resolution_when_not_adaptive(self):
+        controller = self._controller(adaptive=False)
+        self.assertEqual(self._feed(controller, 500, True, COOLDOWN_FRAMES * 2), [])
+
+
+class BatchingBackendTests(FakeDetectorsMixin, SimpleTestCase):
+    def _run_frames(self, backend, count):
+        async def frames():
+            return await asyncio.gather(*(backend.process(_blank_frame(), 'face')
+                                          for _ in range(count)))
+        sizes = []
+
+        def recording_process_batch(jobs):
+            sizes.append(len(jobs))
+            return process_batch(jobs)
+
+        with mock.patch.object(inference, 'process_batch', recording_process_batch):
+            results = asyncio.run(frames())
+        self.assertEqual(len(results), count)
+        return sizes
+
+    @override_settings(INFERENCE_BATCH_MAX_WAIT_MS=200)
+    def test_concurrent_frames_share_a_batch(self):
+        backend = BatchingInferenceBackend(workers=1, max_pending=8)
+        self.addCleanup(backend.shutdown)
+        self.assertEqual(self._run_frames(backend, 4), [4])
+        stats = backend.stats()
+        self.assertEqual((stats['batches'], stats['frames'], stats['pending']), (1, 4, 0))
+
+    @override_settings(INFERENCE_BATCH_MAX_SIZE=2, INFERENCE_BATCH_MAX_WAIT_MS=200)
+    def test_batch_size_is_capped(self):
+        backend = BatchingInferenceBackend(workers=1, max_pending=8)
+        self.addCleanup(backend.shutdown)
+        self.assertEqual(self._run_frames(backend, 5), [2, 2, 1])
+        self.assertEqual(backend.stats()['batch_size_avg'], 1.67)
+
+    def test_shutdown_stops_the_batcher(self):
+        backend = BatchingInferenceBackend(workers=1, max_pending=8)
+        backend.shutdown()
+        backend._collector.join(5)
+        self.assertFalse(backend._collector.is_alive())
+
+
+class RoiTrackerTests(SimpleTestCase):
+    def setUp(self):
+        self.tracker = RoiTracker(margin=0.25, min_size=0.3, redetect_interval=3)
+
+    def _box(self, x0, y0, x1, y1):
+        return [np.array([[x0, y0, 0.0], [x1, y1, 0.0]], np.float32)]
+
+    def test_full_frame_without_landmarks(self):
+        self.assertIsNone(self.tracker.update([]))
+        self.assertIsNone(self.tracker.region)
+
+    def test_region_covers_landmarks_with_margin(self):
+        x0, y0, x1, y1 = self.tracker.update(self._box(0.4, 0.48, 0.8, 0.52))
+        self.assertAlmostEqual(x0, 0.3, places=6)
+        self.assertAlmostEqual(x1, 0.9, places=6)
+        # Narrow boxes still get min_size
+        self.assertAlmostEqual(y1 - y0, 0.3, places=6)
+
+    def test_region_is_clamped_to_frame(self):
+        region = self.tracker.update(self._box(0.0, 0.0, 0.1, 0.1))
+        self.assertEqual(region[:2], (0.0, 0.0))
+
+    def test_region_kept_while_landmarks_stay_inside(self):
+        region = self.tracker.update(self._box(0.3, 0.3, 0.7, 0.7))
+        self.assertEqual(self.tracker.update(self._box(0.32, 0.32, 0.72, 0.72)), region)
+
+    def test_region_follows_landmarks_that_leave_it(self):
+        region = self.tracker.update(self._box(0.2, 0.2, 0.4, 0.4))
+        moved = self.tracker.update(self._box(0.6, 0.6, 0.8, 0.8))
+        self.assertNotEqual(moved, region)
+        self.assertLessEqual(moved[0], 0.6)
+        self.assertGreaterEqual(moved[2], 0.8)
+
+    def test_full_frame_every_redetect_interval(self):
+        box = self._box(0.4, 0.4, 0.6, 0.6)
+        self.tracker.update(box)
+        self.assertIsNotNone(self.tracker.update(box))
+        self.assertIsNotNone(self.tracker.update(box))
+        self.assertIsNone(self.tracker.update(box))
+        self.assertIsNotNone(self.tracker.update(box))
+
+
+class DeltaEncoderTests(SimpleTestCase):
+    def setUp(self):
+        self.encoder = DeltaEncoder(keyframe_interval=30, threshold=0.001)
+
+    def test_first_message_is_a_keyframe(self):
+        message = unpack_results(self.encoder.pack(_results([_hand()])))
+        self.assertNotIn('base', message)
+        self.assertEqual(message['msg'], 1)
+
+    def test_movement_below_threshold_is_skipped(self):
+        self.encoder.pack(_results([_hand()]))
+        self.assertIsNone(self.encoder.pack(_results([_hand(0.0005)])))
+        self.assertEqual(self.encoder.skipped, 1)
+
+    def test_changed_gestures_are_sent(self):
+        keyframe = unpack_results(self.encoder.pack(_results([_hand()])))
+        message = self.encoder.pack(_results([_hand()], gestures=['Victory']))
+        self.assertIsNotNone(message)
+        self.assertEqual(unpack_results(message, keyframe)['gestures'], ['Victory'])
+
+    def test_timings_alone_are_not_sent(self):
+        self.encoder.pack(_results([_hand()], timings={'total_ms': 5}))
+        self.assertIsNone(self.encoder.pack(_results([_hand()], timings={'total_ms': 7})))
+
+    def test_delta_applies_to_previous_message(self):
+        keyframe = unpack_results(self.encoder.pack(_results([_hand()])))
+        moved = _hand()
+        moved[3] += 0.005
+        delta = unpack_results(self.encoder.pack(_results([moved])), keyframe)
+        self.assertEqual((delta['base'], delta['msg']), (keyframe['msg'], keyframe['msg'] + 1))
+        np.testing.assert_allclose(delta['hand_landmarks'][0], moved, atol=1 / INT16_SCALE)
+        self.assertEqual(self.encoder.deltas, 1)
+
+    def test_small_changes_accumulate(self):
+        # Each step is below the threshold, but the client copy must not drift
+        previous = unpack_results(self.encoder.pack(_results([_hand()])))
+        for step in range(1, 6):
+            message = self.encoder.pack(_results([_hand(0.0004 * step)]))
+            if message is not None:
+                previous = unpack_results(message, previous)
+        np.testing.assert_allclose(previous['hand_landmarks'][0], _hand(0.002),
+                                   atol=0.001 + 1 / INT16_SCALE)
+
+    def test_delta_against_wrong_message_needs_resync(self):
+        keyframe = unpack_results(self.encoder.pack(_results([_hand()])))
+        self.encoder.pack(_results([_hand(0.01)]))  # lost by the client
+        delta = self.encoder.pack(_results([_hand(0.02)]))
+        with self.assertRaises(ProtocolError):
+            unpack_results(delta, keyframe)
+        self.encoder.reset()
+        resync = unpack_results(self.encoder.pack(_results([_hand(0.02)])))
+        self.assertNotIn('base', resync)
+
+    def test_keyframe_when_shape_changes(self):
+        self.encoder.pack(_results([_hand()]))
+        message = unpack_results(self.encoder.pack(_results([_hand(), _hand(0.1)])))
+        self.assertNotIn('base', message)
+        self.assertEqual(self.encoder.keyframes, 2)
+
+    def test_keyframe_interval(self):
+        encoder = DeltaEncoder(keyframe_interval=2, threshold=0.001)
+        for step in range(4):
+            encoder.pack(_results([_hand(0.01 * step)]))
+        self.assertEqual((encoder.keyframes, encoder.deltas), (2, 2))
+
+    def test_messages_numbered_independently_of_sequence(self):
+        first = unpack_results(self.encoder.pack(_results([_hand()]), sequence=0))
+        self.encoder.reset()
+        second = unpack_results(self.encoder.pack(_results([_hand()]), sequence=0))
+        self.assertEqual((first['seq'], second['seq']), (0, 0))
+        self.assertEqual(second['msg'], first['msg'] + 1)
+
+
+class OneEuroFilterTests(SimpleTestCase):
+    def test_first_sample_passes_through(self):
+        points = _hand()
+        np.testing.assert_array_equal(OneEuroFilter()(points, 0.0), points)
+
+    def test_reduces_jitter_while_still(self):
+        rng = np.random.default_rng(0)
+        smoothing = OneEuroFilter(min_cutoff=1.0, beta=0.0)
+        raw, filtered = [], []
+        for frame in range(60):
+            points = _hand() + rng.normal(0, 0.002, (21, 3)).astype(np.float32)
+            raw.append(points)
+            filtered.append(smoothing(points, frame / 30))
+        self.assertLess(np.std(filtered[30:], axis=0).mean(), np.std(raw[30:], axis=0).mean() / 2)
+
+    def test_follows_fast_movement(self):
+        smoothing = OneEuroFilter(min_cutoff=1.0, beta=60.0)
+        for frame in range(30):
+            value = smoothing(_hand(0.01 * frame), frame / 30)
+        # Lags behind by less than two frames of movement
+        self.assertLess(np.abs(value - _hand(0.29)).max(), 0.02)
+
+    def test_ignores_out_of_order_samples(self):
+        smoothing = OneEuroFilter()
+        smoothing(_hand(), 1.0)
+        np.testing.assert_array_equal(smoothing(_hand(0.5), 0.5), _hand())
+
+    def test_predict_extrapolates_velocity(self):
+        smoothing = OneEuroFilter(min_cutoff=1.0, beta=60.0)
+        for frame in range(30):
+            smoothing(_hand(0.01 * frame), frame / 30)
+        ahead = smoothing.predict(30 / 30) - smoothing.value
+        np.testing.assert_allclose(ahead, 0.01, atol=0.002)
+
+
+class LandmarkSmootherTests(SimpleTestCase):
+    def test_filters_follow_nearest_hand(self):
+        smoother = LandmarkSmoother(beta=0.0)
+        left, right = _hand(-0.05), _hand(0.05)
+        smoother.update(_results([left, right]), 0)
+        swapped = smoother.update(_results([right, left]), 33)
+        # Listed in the new order, each smoothed against its own history
+        np.testing.assert_allclose(swapped['hand_landmarks'][0], right, atol=1e-6)
+        np.testing.assert_allclose(swapped['hand_landmarks'][1], left, atol=1e-6)
+
+    def test_predicts_skipped_frames(self):
+        smoother = LandmarkSmoother(max_prediction_ms=200)
+        self.assertIsNone(smoother.predict(10))
+        smoother.update(_results([_hand()], gestures=['Victory']), 0)
+        predicted = smoother.predict(33)
+        self.assertTrue(predicted['predicted'])
+        self.assertEqual(predicted['gestures'], ['Victory'])
+        self.assertEqual(len(predicted['hand_landmarks']), 1)
+        self.assertIsNone(smoother.predict(500))
+        self.assertIsNone(smoother.predict(0))
+
+
+def _legacy_expressions(score):
+    """The expression checks the consumer made before the rule table"""
+    expressions = []
+    if score('mouthSmileLeft') > 0.5 and score('mouthSmileRight') > 0.5:
+        expressions.append("Smiling")
+    if score('eyeBlinkLeft') > 0.5:
+        expressions.append("Left Wink")
+    if score('eyeBlinkRight') > 0.5:
+        expressions.append("Right Wink")
+    if score('jawOpen') > 0.3:
+        expressions.append("Mouth Open")
+    return expressions
+
+
+def _scores(**values):
+    scores = np.zeros(len(BLENDSHAPE_NAMES), np.float32)
+    for name, value in values.items():
+        scores[BLENDSHAPE_INDEX[name]] = value
+    return scores
+
+
+class ExpressionRulesTests(SimpleTestCase):
+    def test_default_rules_match_legacy_checks(self):
+        rules = ExpressionRules()
+        rng = np.random.default_rng(0)
+        # Include scores right at the thresholds, which must not match
+        values = np.array([0.0, 0.25, 0.3, 0.35, 0.5, 0.55, 1.0], np.float32)
+        for _ in range(500):
+            scores = rng.choice(values, len(BLENDSHAPE_NAMES)).astype(np.float32)
+            legacy = _legacy_expressions(lambda name: scores[BLENDSHAPE_INDEX[name]])
+            self.assertEqual(rules.classify(scores), legacy)
+
+    def test_any_rule(self):
+        rules = ExpressionRules([{'name': 'Squint', 'any': {'eyeSquintLeft': 0.5,
+                                                            'eyeSquintRight': 0.5}}])
+        self.assertEqual(rules.classify(_scores(eyeSquintRight=0.6)), ['Squint'])
+        self.assertEqual(rules.classify(_scores()), [])
+
+    def test_hysteresis_keeps_expression_active(self):
+        tracker = ExpressionTracker(ExpressionRules())
+        self.assertEqual(tracker.update(_scores(jawOpen=0.4)), ['Mouth Open'])
+        self.assertEqual(tracker.update(_scores(jawOpen=0.27)), ['Mouth Open'])
+        self.assertEqual(tracker.update(_scores(jawOpen=0.24)), [])
+        self.assertEqual(tracker.update(_scores(jawOpen=0.27)), [])
+
+    def test_rejects_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            ExpressionRules([{'name': 'Frown', 'all': {'browFrown': 0.5}}])
+        with self.assertRaises(ValueError):
+            ExpressionRules([{'name': 'Nothing'}])
+
+    def test_empty_table(self):
+        self.assertEqual(ExpressionRules([]).classify(_scores(jawOpen=1.0)), [])
+
+    def test_blendshapes_to_array(self):
+        categories = [SimpleNamespace(index=index, score=index / 100)
+                      for index in range(len(BLENDSHAPE_NAMES))]
+        np.testing.assert_allclose(blendshapes_to_array(categories),
+                                   np.arange(len(BLENDSHAPE_NAMES)) / 100, rtol=1e-6)
+        partial = blendshapes_to_array([SimpleNamespace(index=BLENDSHAPE_INDEX['jawOpen'],
+                                                        score=0.7)])
+        np.testing.assert_allclose(partial, _scores(jawOpen=0.7))
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        backend = mock.Mock(**{'stats.return_value': {'backend': 'thread', 'pending': 3}})
+        patcher = mock.patch.object(inference, 'get_backend', return_value=backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_render(self):
+        with mock.patch.object(metrics, '_enabled', True):
+            with metrics.timer('test_stage'):
+                pass
+            metrics.observe('test_stage', 0.003)
+            text = metrics.render()
+        self.assertIn('pixelsight_stage_seconds_count{stage="test_stage"}', text)
+        self.assertIn('pixelsight_stage_seconds_bucket{stage="test_stage",le="0.005"}', text)
+        self.assertIn('pixelsight_inference_pending{backend="thread"} 3', text)
+        self.assertIn('# TYPE pixelsight_connections_active gauge', text)
+
+    def test_disabled_metrics_record_nothing(self):
+        counter = metrics.Counter('test_total', 'Test counter.')
+        with mock.patch.object(metrics, '_enabled', False), \
+                mock.patch.object(metrics.stage_seconds, 'observe') as observe:
+            with metrics.timer('test_stage'):
+                pass
+            metrics.observe('test_stage', 0.003)
+            counter.inc()
+        observe.assert_not_called()
+        self.assertEqual(counter.value, 0)
+
+    def test_endpoint(self):
+        with mock.patch.object(metrics, '_enabled', None):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'pixelsight_frames_received_total', response.content)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_endpoint_when_disabled(self):
+        with mock.patch.object(metrics, '_enabled', None):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class BenchmarkPipelineTests(FakeDetectorsMixin, SimpleTestCase):
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/report.json'
+            call_command('benchmark_pipeline', frames=4, mode=['face', 'hands'],
+                         concurrency=[1, 2], output=output, stdout=io.StringIO())
+            with open(output) as f:
+                report = json.load(f)
+        runs = [(run['mode'], run['concurrency'], run['frames']) for run in report['runs']]
+        self.assertEqual(runs, [('face', 1, 4), ('face', 2, 4), ('hands', 1, 4), ('hands', 2, 4)])
+        self.assertEqual(report['meta']['source'], 'synthetic 640x480')
+
+
+class LoadTestCommandTests(FakeDetectorsMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(inference.shutdown_backend)
+        patcher = mock.patch.object(loadtest, 'DRAIN_SECONDS', 0.2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/report.json'
+            call_command('loadtest', clients=2, fps=20, duration=0.3, frames=2, mode='face',
+                         output=output, stdout=io.StringIO(), **options)
+            with open(output) as f:
+                return json.load(f)
+
+    def test_in_process_run(self):
+        report = self._run()
+        self.assertEqual((report['clients_failed'], report['protocol_errors']), (0, 0))
+        self.assertGreater(report['results'], 0)
+        self.assertEqual(report['results_unchanged'], 0)
+
+    def test_unchanged_delta_results_are_not_drops(self):
+        report = self._run(results='delta')
+        self.assertGreater(report['results_unchanged'], 0)
+        self.assertLess(report['drop_rate'], 0.5)
+
+    def test_channel_workers(self):
+        report = self._run(channel_workers=1)
+        self.assertEqual(report['inference']['backend'], 'channels')
+        self.assertGreater(report['inference']['remote_frames'], 0)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   INFERENCE_CHANNEL_HEARTBEAT=0.05)
+class ChannelBackendTests(FakeDetectorsMixin, SimpleTestCase):
+    def _backend(self, workers=1):
+        backend = ChannelLayerInferenceBackend(workers, max_pending=4)
+        self.addCleanup(backend.shutdown)
+        return backend
+
+    def test_frames_run_locally_without_workers(self):
+        backend = self._backend()
+        pending = []
+
+        def recording_process_frame(*args):
+            pending.append(backend.pending)
+            return _results(timings={})
+
+        with mock.patch.object(inference, 'process_frame', recording_process_frame):
+            asyncio.run(backend.process(_blank_frame(), 'face'))
+        self.assertEqual((backend.fallback_frames, backend.remote_frames), (1, 0))
+        # Counted while running, so streams are paced against the local workers
+        self.assertEqual(pending, [1])
+        self.assertEqual((backend.pending, backend.workers), (0, 1))
+
+    @override_settings(INFERENCE_CHANNEL_FALLBACK=False)
+    def test_frames_dropped_without_workers_when_fallback_is_off(self):
+        backend = self._backend()
+        with self.assertRaises(InferenceBusy):
+            asyncio.run(backend.process(_blank_frame(), 'face'))
+        self.assertEqual(backend.rejected, 1)
+
+    def test_frames_go_to_a_worker(self):
+        backend = self._backend(workers=1)
+
+        async def serve_one_frame():
+            worker = InferenceWorker(ThreadInferenceBackend(workers=3, max_pending=8))
+            serving = asyncio.create_task(worker.run())
+            await backend._ensure_started()
+            while not backend._remote:
+                await asyncio.sleep(0.01)
+            # Streams are paced against the workers' capacity, not the gateway's
+            self.assertEqual(backend.workers, 3)
+            results = await backend.process(_blank_frame(), 'face')
+            worker.stop()
+            await serving
+            worker.backend.shutdown()
+            while backend._remote:
+                await asyncio.sleep(0.01)
+            return results
+
+        results = asyncio.run(serve_one_frame())
+        self.assertEqual(results['face_landmarks'], [])
+        self.assertEqual((backend.remote_frames, backend.fallback_frames), (1, 0))
+        self.assertEqual(backend.workers, 1)
+
+    def test_capacity_counts_live_workers(self):
+        backend = self._backend(workers=2)
+        now = time.monotonic()
+        for worker, workers, seen in (('idle', 0, now), ('busy', 4, now), ('gone', 8, now - 60)):
+            backend._remote[worker] = {'in_flight': 0, 'pending': 0, 'workers': workers,
+                                       'max_pending': 4, 'seen': seen}
+        self.assertEqual(backend.workers, 4)
+        # A worker reporting no workers is not a division by zero
+        self.assertIn(backend._choose(), ('idle', 'busy'))
+        self.assertNotIn('gone', backend._remote)
+
+
+def _asset_image():
+    """A dark disc with a white spot in the middle, on white"""
+    size = 64
+    y, x = np.mgrid[:size, :size]
+    distance = np.hypot(x - size / 2, y - size / 2)
+    rgb = np.full((size, size, 3), 255, np.uint8)
+    rgb[distance < 20] = (40, 90, 200)
+    rgb[distance < 5] = 255
+    return Image.fromarray(rgb)
+
+
+class MattingTests(SimpleTestCase):
+    def test_threshold_only_matches_legacy_loop(self):
+        rng = np.random.default_rng(0)
+        noisy = rng.integers(230, 256, (32, 32, 4), np.uint8)
+        for image in (_asset_image(), Image.fromarray(noisy, 'RGBA'),
+                      _asset_image().convert('L')):
+            expected = np.asarray(legacy_matte(image))
+            actual = np.asarray(remove_white_background(image, feather=0, from_border=False))
+            np.testing.assert_array_equal(actual, expected)
+
+    def test_enclosed_white_is_kept(self):
+        alpha = np.asarray(remove_white_background(_asset_image(), feather=0))[..., 3]
+        self.assertEqual(alpha[0, 0], 0)
+        self.assertEqual(alpha[32, 32], 255)
+
+    def test_feather_softens_edges(self):
+        alpha = np.asarray(remove_white_background(_asset_image(), feather=3))[..., 3]
+        self.assertEqual(alpha[32, 40], 255)
+        self.assertTrue(((alpha > 0) & (alpha < 255)).any())
+        self.assertEqual(alpha[0, 0], 0)
+
+
+class AssetUploadTests(TestCase):
+    def test_background_removal_of_non_image_is_rejected(self):
+        response = self.client.post('/api/assets/', {
+            'name': 'notes', 'remove_background': '1',
+            'file': SimpleUploadedFile('notes.png', b'not an image'),
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+def generate_stub(prompt, anchor):
+    """ASSET_GENERATOR for tests; prompts containing 'fail' fail"""
+    if 'fail' in prompt:
+        return None
+    return ARAsset.objects.create(name=prompt[:100], anchor=anchor, file='assets/generated.png')
+
+
+def _run_now(name, workers_setting, default_workers, fn, *args):
+    fn(*args)
+
+
+@override_settings(ASSET_GENERATOR='core.tests.generate_stub', ASSET_VARIANTS_ENABLED=False,
+                   CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class GenerationJobTests(TestCase):
+    def setUp(self):
+        # Jobs stay queued unless a test runs them
+        submit = mock.patch('core.jobs.background.submit')
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+        self.addCleanup(setattr, jobs, '_queued', 0)
+
+    def _generate(self, prompt, anchor='FACE'):
+        return self.client.post('/api/assets/generate/',
+                                json.dumps({'prompt': prompt, 'anchor': anchor}),
+                                content_type='application/json')
+
+    def test_job_is_queued(self):
+        response = self._generate('a crown')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'PENDING')
+        self.assertEqual(response['Location'], response.json()['status_url'])
+        self.submit.assert_called_once()
+
+    def test_job_runs_to_completion(self):
+        self.submit.side_effect = _run_now
+        job_id = self._generate('a crown').json()['id']
+        data = self.client.get(f'/api/assets/jobs/{job_id}/').json()
+        self.assertEqual(data['status'], 'SUCCEEDED')
+        self.assertEqual(data['asset']['name'], 'a crown')
+        self.assertEqual(jobs._queued, 0)
+
+    def test_failed_generation(self):
+        self.submit.side_effect = _run_now
+        job_id = self._generate('please fail').json()['id']
+        data = self.client.get(f'/api/assets/jobs/{job_id}/').json()
+        self.assertEqual(data['status'], 'FAILED')
+        self.assertTrue(data['error'])
+
+    def test_full_queue_is_refused(self):
+        with self.settings(ASSET_GENERATION_MAX_QUEUED=1):
+            self.assertEqual(self._generate('a crown').status_code, 202)
+            response = self._generate('a hat')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+
+    def test_unknown_job(self):
+        response = self.client.get('/api/assets/jobs/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_stale_job_is_failed(self):
+        job = GenerationJob.objects.create(prompt='a crown', anchor='FACE', status='RUNNING')
+        GenerationJob.objects.filter(id=job.id).update(
+            created_at=timezone.now() - timedelta(seconds=jobs.DEFAULT_JOB_TIMEOUT + 1))
+        data = self.client.get(f'/api/assets/jobs/{job.id}/').json()
+        self.assertEqual(data['status'], 'FAILED')
+        self.assertEqual(data['error'], jobs.TIMED_OUT_ERROR)
+
+    def test_stale_job_is_not_started(self):
+        job = GenerationJob.objects.create(prompt='a crown', anchor='FACE', status='FAILED')
+        jobs._queued = 1
+        jobs._run(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIsNone(job.started_at)
+
+
+@override_settings(ASSET_GENERATOR='core.tests.generate_stub', ASSET_VARIANTS_ENABLED=False,
+                   CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class GenerationCoalescingTests(TestCase):
+    def setUp(self):
+        submit = mock.patch('core.jobs.background.submit')
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+        self.addCleanup(setattr, jobs, '_queued', 0)
+
+    def test_identical_requests_share_a_job(self):
+        first = jobs.submit_generation('A crown', 'FACE')
+        second = jobs.submit_generation('  a   CROWN ', 'FACE')
+        self.assertEqual(first.id, second.id)
+        self.submit.assert_called_once()
+        self.assertNotEqual(jobs.submit_generation('a crown', 'HAND_WRIST').id, first.id)
+
+    def test_one_unfinished_job_per_key(self):
+        GenerationJob.objects.create(prompt='a crown', cache_key='k')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            GenerationJob.objects.create(prompt='a crown', cache_key='k', status='RUNNING')
+        # Finished jobs and jobs without a key don't count
+        GenerationJob.objects.create(prompt='a crown', cache_key='k', status='SUCCEEDED')
+        GenerationJob.objects.create(prompt='a crown')
+        GenerationJob.objects.create(prompt='a crown')
+
+    def test_losing_a_race_returns_the_other_job(self):
+        # As if another process queued it after the in-flight check
+        key = asset_cache.cache_key('a crown', 'FACE')
+        other = GenerationJob.objects.create(prompt='a crown', anchor='FACE', cache_key=key)
+        self.assertEqual(jobs._queue('a crown', 'FACE', key).id, other.id)
+        self.submit.assert_not_called()
+        self.assertEqual(jobs._queued, 0)
+
+    def test_stale_job_is_not_joined(self):
+        stale = jobs.submit_generation('a crown', 'FACE')
+        GenerationJob.objects.filter(id=stale.id).update(
+            created_at=timezone.now() - timedelta(seconds=jobs.DEFAULT_JOB_TIMEOUT + 1))
+        job = jobs.submit_generation('a crown', 'FACE')
+        self.assertNotEqual(job.id, stale.id)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'FAILED')
+
+    def test_cached_result_is_returned_at_once(self):
+        self.submit.side_effect = _run_now
+        jobs.submit_generation('a crown', 'FACE')
+        response = self.client.post('/api/assets/generate/',
+                                    json.dumps({'prompt': 'A Crown', 'anchor': 'FACE'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['cached'])
+        self.assertEqual(data['status'], 'SUCCEEDED')
+        self.assertEqual(data['asset']['name'], 'a crown')
+        self.assertEqual(self.submit.call_count, 1)
+
+    def test_cache_can_be_disabled(self):
+        self.submit.side_effect = _run_now
+        jobs.submit_generation('a crown', 'FACE')
+        with self.settings(ASSET_CACHE_ENABLED=False):
+            self.assertFalse(jobs.submit_generation('a crown', 'FACE').cached)
+        self.assertEqual(self.submit.call_count, 2)
+
+
+@override_settings(ASSET_VARIANTS_ENABLED=False)
+class AssetListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _create(self, count, created_at=None):
+        assets = [ARAsset.objects.create(name=f'asset {n}', file=f'assets/{n}.png')
+                  for n in range(count)]
+        if created_at is not None:
+            ARAsset.objects.update(created_at=created_at)
+        return assets
+
+    def _pages(self, limit):
+        names, cursor = [], None
+        while True:
+            params = {'limit': limit}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get('/api/assets/', params).json()
+            names += [asset['name'] for asset in data['assets']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return names
+
+    def test_cursor_pages_through_equal_timestamps(self):
+        assets = self._create(5, timezone.now())
+        expected = [asset.name for asset in sorted(assets, key=lambda a: a.id, reverse=True)]
+        self.assertEqual(self._pages(2), expected)
+
+    def test_newest_first(self):
+        old, new = self._create(2)
+        ARAsset.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(self._pages(1), [new.name, old.name])
+
+    def test_limit_is_capped(self):
+        self._create(3)
+        with mock.patch.object(asset_list, 'MAX_PAGE_SIZE', 2):
+            data = self.client.get('/api/assets/', {'limit': 10}).json()
+        self.assertEqual(len(data['assets']), 2)
+
+    def test_bad_parameters(self):
+        for params in ({'cursor': 'not-a-cursor'}, {'limit': '0'}, {'limit': 'ten'},
+                       {'cursor': asset_list.encode_cursor(timezone.now(), 'x')[:-4]}):
+            response = self.client.get('/api/assets/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_conditional_requests(self):
+        self._create(1)
+        response = self.client.get('/api/assets/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/assets/', HTTP_IF_NONE_MATCH=etag).status_code,
+                         304)
+        self._create(1)
+        response = self.client.get('/api/assets/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['assets']), 2)
+
+    def test_deleting_changes_the_list(self):
+        asset, _ = self._create(2)
+        etag = self.client.get('/api/assets/')['ETag']
+        self.client.delete(f'/api/assets/{asset.id}/')
+        response = self.client.get('/api/assets/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['assets']), 1)
+
+    def test_saving_changes_the_list(self):
+        asset, = self._create(1)
+        etag = self.client.get('/api/assets/')['ETag']
+        asset.variants = {'thumb': {'width': 1, 'height': 1, 'webp': 'assets/thumb.webp'}}
+        asset.save()
+        response = self.client.get('/api/assets/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('thumb', response.json()['assets'][0]['variants'])
+
+    def test_version_outlives_the_cache(self):
+        self._create(1)
+        response = self.client.get('/api/assets/')
+        # As after a restart, or in another server process
+        cache.clear()
+        again = self.client.get('/api/assets/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['Last-Modified'], response['Last-Modified'])
+
+
+def _png(color=(40, 90, 200)):
+    buffer = io.BytesIO()
+    Image.new('RGBA', (600, 400), color + (255,)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class AssetIngestTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=media_root, ASSET_VARIANTS_ENABLED=False,
+                              ASSET_VARIANT_SIZES={'thumb': 128}, ASSET_VARIANT_FORMATS=['webp'])
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def _asset(self, data, name='asset'):
+        asset = ARAsset(name=name)
+        reused = ingest.attach_file(asset, ContentFile(data, name=f'{name}.png'))
+        asset.save()
+        return asset, reused
+
+    def test_identical_upload_reuses_file(self):
+        first, reused_first = self._asset(_png(), 'first')
+        second, reused_second = self._asset(_png(), 'second')
+        self.assertEqual((reused_first, reused_second), (False, True))
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(second.content_hash, first.content_hash)
+
+    def test_different_upload_is_stored(self):
+        first, _ = self._asset(_png(), 'first')
+        second, reused = self._asset(_png((200, 40, 90)), 'second')
+        self.assertFalse(reused)
+        self.assertNotEqual(second.file.name, first.file.name)
+
+    def test_missing_file_is_not_reused(self):
+        first, _ = self._asset(_png(), 'first')
+        first.file.storage.delete(first.file.name)
+        second, reused = self._asset(_png(), 'second')
+        self.assertFalse(reused)
+        self.assertTrue(second.file.storage.exists(second.file.name))
+
+    def test_reused_file_keeps_variants(self):
+        first, _ = self._asset(_png(), 'first')
+        ingest.process_asset(first.id)
+        second, _ = self._asset(_png(), 'second')
+        self.assertEqual(second.variants, ARAsset.objects.get(id=first.id).variants)
+        self.assertEqual(set(second.variants), {'thumb'})
+
+    def test_duplicates_created_during_processing_get_variants(self):
+        first, _ = self._asset(_png(), 'first')
+        render = ingest.render_variants
+
+        def render_with_duplicate(*args, **kwargs):
+            self._asset(_png(), 'second')
+            return render(*args, **kwargs)
+
+        with mock.patch('core.ingest.render_variants', render_with_duplicate):
+            ingest.process_asset(first.id)
+        self.assertEqual(ARAsset.objects.get(name='second').variants,
+                         ARAsset.objects.get(id=first.id).variants)
@@ -4,10 +4,41 @@ from google.genai import types
 from django.conf import settings
 from PIL import Image
 import io
+import threading
 import uuid
+from .ingest import attach_file
+from .matting import DEFAULT_FEATHER, remove_white_background
 from .models import ARAsset
 from django.core.files.base import ContentFile
 
+
+def _matte(image):
+    return remove_white_background(
+        image,
+        feather=getattr(settings, 'ASSET_MATTING_FEATHER', DEFAULT_FEATHER),
+        from_border=getattr(settings, 'ASSET_MATTING_FROM_BORDER', True))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_genai_client():
+    """Return the process-wide Gemini client, or None without an API key.
+
+    One client is shared so its HTTP connections are reused across requests.
+    """
+    global _client
+    if _client is None:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            return None
+        with _client_lock:
+            if _client is None:
+                _client = genai.Client(api_key=api_key)
+    return _client
+
+
 def generate_ai_asset(prompt, anchor_type):
     """
     Generates an asset image using Google Gemini (Imagen 3) and saves it to the database.
@@ -19,14 +50,12 @@ def generate_ai_asset(prompt, anchor_type):
     Returns:
         ARAsset: The created asset object or None.
     """
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
+    client = get_genai_client()
+    if client is None:
         print("Error: GEMINI_API_KEY not found.")
         return None
 
     try:
-        client = genai.Client(api_key=api_key)
-        
         enhanced_prompt = (
             f"A high quality, isolated design of {prompt}. "
             f"Front facing view, centered. "
@@ -56,18 +85,8 @@ def generate_ai_asset(prompt, anchor_type):
         img_bytes = image_data.image.image_bytes
         image = Image.open(io.BytesIO(img_bytes))
         
-        # Simple transparency processing
-        image = image.convert("RGBA")
-        datas = image.getdata()
-        
-        new_data = []
-        for item in datas:
-            if item[0] > 240 and item[1] > 240 and item[2] > 240:
-                new_data.append((255, 255, 255, 0))
-            else:
-                new_data.append(item)
-                
-        image.putdata(new_data)
+        # Make the white background transparent
+        image = _matte(image)
         
         # Save
         asset_name = f"AI: {prompt[:20]}..."
@@ -82,10 +101,20 @@ def generate_ai_asset(prompt, anchor_type):
             anchor=anchor_type
         )
         
-        asset.file.save(filename, ContentFile(output_buffer.getvalue()), save=True)
+        attach_file(asset, ContentFile(output_buffer.getvalue(), name=filename))
+        asset.save()
         
         return asset
 
     except Exception as e:
         print(f"Error generating asset: {e}")
         return None
+
+
+def matte_upload(file):
+    """Remove the white background of an uploaded image; returns a PNG ContentFile."""
+    image = _matte(Image.open(file))
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, format='PNG')
+    name = os.path.splitext(os.path.basename(file.name))[0]
+    return ContentFile(output_buffer.getvalue(), name=f"{name}.png")
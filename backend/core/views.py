@@ -1,10 +1,15 @@
 import json
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from . import asset_list, ingest, metrics
+from .jobs import QueueFull, get_job, submit_generation
 from .models import ARAsset
-from .utils import generate_ai_asset
+from .serializers import asset_data, job_data
+from .utils import matte_upload
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -12,21 +17,32 @@ class AssetListView(View):
     """List all assets or create a new asset"""
     
     def get(self, request):
-        assets = ARAsset.objects.all().order_by('-created_at')
-        data = []
-        for asset in assets:
-            data.append({
-                'id': str(asset.id),
-                'name': asset.name,
-                'asset_type': asset.asset_type,
-                'anchor': asset.anchor,
-                'file_url': request.build_absolute_uri(asset.file.url) if asset.file else '',
-                'scale': asset.scale,
-                'position_offset': asset.position_offset,
-                'rotation_offset': asset.rotation_offset,
-                'created_at': asset.created_at.isoformat()
-            })
-        return JsonResponse({'assets': data})
+        """A page of assets, newest first; follow next_cursor for the rest"""
+        try:
+            limit = min(int(request.GET.get('limit', asset_list.DEFAULT_PAGE_SIZE)),
+                        asset_list.MAX_PAGE_SIZE)
+            cursor = request.GET.get('cursor')
+            if cursor:
+                asset_list.decode_cursor(cursor)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        if limit < 1:
+            return JsonResponse({'error': 'limit must be positive'}, status=400)
+
+        version, modified = asset_list.list_version()
+        etag = f'"{version}"'
+        # Deleting an asset changes the version but can't advance Last-Modified,
+        # so requests are only validated against the ETag
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            origin = request.build_absolute_uri('/')[:-1]
+            body = asset_list.cached_page(version, origin, cursor, limit)
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified.timestamp())
+        # Clients may keep the list but must revalidate it
+        patch_cache_control(response, no_cache=True)
+        return response
     
     def post(self, request):
         try:
@@ -37,22 +53,25 @@ class AssetListView(View):
 
             if not all([name, file]):
                 return JsonResponse({'error': 'Name and file are required'}, status=400)
+
+            # Optionally cut out a white background, as for generated assets
+            if asset_type == '2D_IMAGE' and request.POST.get('remove_background') in ('1', 'true'):
+                try:
+                    file = matte_upload(file)
+                except OSError:
+                    # Includes PIL.UnidentifiedImageError for files that aren't images
+                    return JsonResponse({'error': 'File is not a readable image'}, status=400)
             
-            asset = ARAsset.objects.create(
+            asset = ARAsset(
                 name=name,
                 asset_type=asset_type,
                 anchor=anchor,
-                file=file
             )
+            # Identical uploads share one stored file; variants follow in the background
+            ingest.attach_file(asset, file)
+            asset.save()
 
-            return JsonResponse({
-                'id': str(asset.id),
-                'name': asset.name,
-                'asset_type': asset.asset_type,
-                'anchor': asset.anchor,
-                'file_url': request.build_absolute_uri(asset.file.url),
-                'created_at': asset.created_at.isoformat()
-            }, status=201)
+            return JsonResponse(asset_data(asset, request.build_absolute_uri), status=201)
             
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
@@ -60,6 +79,8 @@ class AssetListView(View):
 
 @method_decorator(csrf_exempt, name='dispatch')
 class GenerateAssetView(View):
+    """Queue an AI asset generation job; poll its status_url for the result"""
+
     def post(self, request):
         try:
             data = json.loads(request.body)
@@ -69,24 +90,34 @@ class GenerateAssetView(View):
             if not prompt:
                 return JsonResponse({'error': 'Prompt is required'}, status=400)
                 
-            asset = generate_ai_asset(prompt, anchor)
-            
-            if not asset:
-                return JsonResponse({'error': 'Failed to generate asset.'}, status=500)
-                
-            return JsonResponse({
-                'id': str(asset.id),
-                'name': asset.name,
-                'asset_type': asset.asset_type,
-                'anchor': asset.anchor,
-                'file_url': request.build_absolute_uri(asset.file.url),
-                'created_at': asset.created_at.isoformat()
-            }, status=201)
+            try:
+                job = submit_generation(prompt, anchor)
+            except QueueFull:
+                response = JsonResponse({'error': 'Too many generation jobs, try again later.'},
+                                        status=503)
+                response['Retry-After'] = '10'
+                return response
+
+            body = job_data(job, request.build_absolute_uri)
+            # Cached results are complete already
+            response = JsonResponse(body, status=200 if job.status == 'SUCCEEDED' else 202)
+            response['Location'] = body['status_url']
+            return response
             
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
 
+class GenerationJobView(View):
+    """Status of a generation job, with the asset once it succeeded"""
+
+    def get(self, request, job_id):
+        job = get_job(job_id)
+        if job is None:
+            return JsonResponse({'error': 'Job not found'}, status=404)
+        return JsonResponse(job_data(job, request.build_absolute_uri))
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class AssetDetailView(View):
     """Get, update, or delete a specific mask"""
@@ -94,14 +125,7 @@ class AssetDetailView(View):
     def get(self, request, asset_id):
         try:
             asset = ARAsset.objects.get(id=asset_id)
-            return JsonResponse({
-                'id': str(asset.id),
-                'name': asset.name,
-                'asset_type': asset.asset_type,
-                'anchor': asset.anchor,
-                'file_url': request.build_absolute_uri(asset.file.url),
-                'created_at': asset.created_at.isoformat()
-            })
+            return JsonResponse(asset_data(asset, request.build_absolute_uri))
         except ARAsset.DoesNotExist:
             return JsonResponse({'error': 'Asset not found'}, status=404)
     
@@ -113,3 +137,13 @@ class AssetDetailView(View):
             return JsonResponse({'message': 'Asset deleted'})
         except ARAsset.DoesNotExist:
             return JsonResponse({'error': 'Asset not found'}, status=404)
+
+
+class MetricsView(View):
+    """Prometheus-style metrics for the video pipeline"""
+
+    def get(self, request):
+        if not metrics.enabled():
+            raise Http404("Metrics are disabled")
+        return HttpResponse(metrics.render(),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
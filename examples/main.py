@@ -16,6 +16,13 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
 MODELS_DIR = os.path.join(PROJECT_ROOT, 'models')
 
+# Share landmark extraction and expression rules with the backend consumer
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'backend'))
+from core.expressions import ExpressionRules, ExpressionTracker, blendshapes_to_array  # noqa: E402
+from core.landmarks import landmarks_to_array, to_pixels  # noqa: E402
+
+face_expressions = ExpressionTracker(ExpressionRules())
+
 # Hand connections for drawing
 HAND_CONNECTIONS = [
     (0, 1), (1, 2), (2, 3), (3, 4),
@@ -42,29 +49,20 @@ def draw_hand_landmarks_and_gestures(rgb_image, detection_result):
     hand_landmarks_list = detection_result.hand_landmarks
     gestures_list = detection_result.gestures
 
+    height, width = annotated_image.shape[:2]
+
     # Loop through the detected hands to visualize.
     for idx in range(len(hand_landmarks_list)):
-        hand_landmarks = hand_landmarks_list[idx]
+        points = to_pixels(landmarks_to_array(hand_landmarks_list[idx]), width, height)
         
         # Draw the hand landmarks.
-        for landmark in hand_landmarks:
-            x = int(landmark.x * annotated_image.shape[1])
-            y = int(landmark.y * annotated_image.shape[0])
+        for x, y in points.tolist():
             cv2.circle(annotated_image, (x, y), 5, (0, 255, 0), -1)
             
         # Draw the connections
-        for connection in HAND_CONNECTIONS:
-            start_idx = connection[0]
-            end_idx = connection[1]
-            
-            start_point = hand_landmarks[start_idx]
-            end_point = hand_landmarks[end_idx]
-            
-            x1 = int(start_point.x * annotated_image.shape[1])
-            y1 = int(start_point.y * annotated_image.shape[0])
-            x2 = int(end_point.x * annotated_image.shape[1])
-            y2 = int(end_point.y * annotated_image.shape[0])
-            
+        for start_idx, end_idx in HAND_CONNECTIONS:
+            x1, y1 = points[start_idx].tolist()
+            x2, y2 = points[end_idx].tolist()
             cv2.line(annotated_image, (x1, y1), (x2, y2), (255, 0, 0), 2)
         
         # Draw Gesture Text
@@ -73,9 +71,8 @@ def draw_hand_landmarks_and_gestures(rgb_image, detection_result):
             confidence = gesture.score * 100
             gesture_text = f"Hand: {gesture.category_name} ({confidence:.0f}%)"
              # Approximate position near wrist (landmark 0)
-            wrist = hand_landmarks[0]
-            text_x = int(wrist.x * annotated_image.shape[1])
-            text_y = int(wrist.y * annotated_image.shape[0]) - 20
+            text_x, text_y = points[0].tolist()
+            text_y -= 20
             
             cv2.putText(annotated_image, gesture_text, (text_x, text_y), 
                         cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
@@ -93,49 +90,28 @@ def draw_face_landmarks_and_expressions(rgb_image, detection_result):
     face_landmarks_list = detection_result.face_landmarks
     face_blendshapes_list = detection_result.face_blendshapes
 
+    height, width = annotated_image.shape[:2]
+
     # Loop through the detected faces to visualize.
     for idx in range(len(face_landmarks_list)):
-        face_landmarks = face_landmarks_list[idx]
+        points = to_pixels(landmarks_to_array(face_landmarks_list[idx]), width, height)
         
         # Draw face landmarks as small dots
-        for landmark in face_landmarks:
-            x = int(landmark.x * annotated_image.shape[1])
-            y = int(landmark.y * annotated_image.shape[0])
+        for x, y in points.tolist():
             cv2.circle(annotated_image, (x, y), 1, (0, 255, 255), -1)
         
         # Analyze Blendshapes for Expressions
         if face_blendshapes_list and len(face_blendshapes_list) > idx:
-            blendshapes = face_blendshapes_list[idx]
-            # Mapping blendshapes to simple gestures
-            # Note: We iterate to find specific categories
-            
-            expressions = []
-            
-            # Helper to find score
-            def get_score(name):
-                for b in blendshapes:
-                    if b.category_name == name:
-                        return b.score
-                return 0.0
-
-            if get_score('mouthSmileLeft') > 0.5 and get_score('mouthSmileRight') > 0.5:
-                expressions.append("Smiling")
-            
-            if get_score('eyeBlinkLeft') > 0.5:
-                expressions.append("Left Wink")
-                
-            if get_score('eyeBlinkRight') > 0.5:
-                expressions.append("Right Wink")
-            
-            if get_score('jawOpen') > 0.3:
-                expressions.append("Mouth Open")
+            # Mapping blendshapes to simple expressions (single face, so one tracker)
+            scores = blendshapes_to_array(face_blendshapes_list[idx])
+            expressions = face_expressions.update(scores)
             
             if expressions:
                 text = f"Face: {', '.join(expressions)}"
                 # Draw at the top of the head (approx landmark 10)
-                head_top = face_landmarks[10]
-                text_x = int(head_top.x * annotated_image.shape[1]) - 50
-                text_y = int(head_top.y * annotated_image.shape[0]) - 30
+                text_x, text_y = points[10].tolist()
+                text_x -= 50
+                text_y -= 30
                 
                 cv2.putText(annotated_image, text, (text_x, text_y), 
                             cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2, cv2.LINE_AA)
@@ -1,7 +1,7 @@
 'use client';
 
 import React, { useState, useRef, useEffect, useCallback } from 'react';
-import { useDetectionStore, ARAsset, fetchAssets, uploadAsset, deleteAsset, generateAIAsset } from '../store/DetectionStore';
+import { useDetectionStore, ARAsset, assetImageUrl, fetchAssets, uploadAsset, deleteAsset, generateAIAsset } from '../store/DetectionStore';
 
 const ANCHOR_OPTIONS = [
     { id: 'FACE', label: 'Face' },
@@ -237,7 +237,7 @@ export default function AssetManager() {
                                         </div>
                                     ) : (
                                         <img
-                                            src={asset.file_url}
+                                            src={assetImageUrl(asset, 'thumb')}
                                             alt={asset.name}
                                             className="w-full h-full object-cover"
                                         />
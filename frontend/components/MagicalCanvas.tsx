@@ -13,7 +13,7 @@ import {
     Text
 } from '@react-three/drei';
 import { EffectComposer, Bloom, ChromaticAberration } from '@react-three/postprocessing';
-import { ARAsset, useDetectionStore } from '../store/DetectionStore';
+import { ARAsset, assetImageUrl, useDetectionStore } from '../store/DetectionStore';
 
 // --- Constants & Types ---
 const WEBSOCKET_URL = 'ws://localhost:8000/ws/detection/';
@@ -94,7 +94,7 @@ const AssetRenderer = React.memo(function AssetRenderer({
     scale?: number;
 }) {
     if (asset.asset_type === '2D_IMAGE') {
-        return <ImageAssetRenderer url={asset.file_url} position={position} scale={scale} />;
+        return <ImageAssetRenderer url={assetImageUrl(asset, 'small')} position={position} scale={scale} />;
     }
 
     if (asset.asset_type === '3D_MODEL') {
@@ -2,6 +2,16 @@ import { create } from 'zustand';
 
 type DetectionMode = 'combined' | 'face' | 'hands';
 
+// Resized WebP/AVIF copy of a 2D asset, rendered by the backend after upload
+export interface AssetVariant {
+    width: number;
+    height: number;
+    webp?: string;
+    avif?: string;
+}
+
+export type AssetVariantName = 'thumb' | 'small' | 'large';
+
 export interface ARAsset {
     id: string;
     name: string;
@@ -11,9 +21,15 @@ export interface ARAsset {
     scale: number;
     position_offset: { x: number, y: number, z: number };
     rotation_offset: { x: number, y: number, z: number };
+    variants?: Partial<Record<AssetVariantName, AssetVariant>>;
     created_at: string;
 }
 
+// Smallest download for the given size; the original file until variants exist
+export function assetImageUrl(asset: ARAsset, variant: AssetVariantName): string {
+    return asset.variants?.[variant]?.webp || asset.file_url;
+}
+
 interface DetectionState {
     activeMode: DetectionMode;
     isConnected: boolean;
@@ -57,13 +73,25 @@ export const useDetectionStore = create<DetectionState>((set) => ({
 
 // API Helpers
 const API_BASE = 'http://localhost:8000';
+const JOB_POLL_INTERVAL_MS = 1000;
+const JOB_TIMEOUT_MS = 120000;
+const ASSET_PAGE_SIZE = 500;
 
 export async function fetchAssets(): Promise<ARAsset[]> {
     try {
-        const response = await fetch(`${API_BASE}/api/assets/`);
-        if (!response.ok) throw new Error('Failed to fetch assets');
-        const data = await response.json();
-        return data.assets || [];
+        // The list is paginated; follow next_cursor until the last page
+        const assets: ARAsset[] = [];
+        let cursor: string | null = null;
+        do {
+            const params = new URLSearchParams({ limit: String(ASSET_PAGE_SIZE) });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`${API_BASE}/api/assets/?${params}`);
+            if (!response.ok) throw new Error('Failed to fetch assets');
+            const data = await response.json();
+            assets.push(...(data.assets || []));
+            cursor = data.next_cursor || null;
+        } while (cursor);
+        return assets;
     } catch (error) {
         console.error('Error fetching assets:', error);
         return [];
@@ -100,7 +128,19 @@ export async function generateAIAsset(prompt: string, anchor: string): Promise<A
         });
 
         if (!response.ok) throw new Error('Failed to generate asset');
-        return await response.json();
+
+        // Generation runs as a background job; poll it until it finishes
+        let job = await response.json();
+        const deadline = Date.now() + JOB_TIMEOUT_MS;
+        while (job.status === 'PENDING' || job.status === 'RUNNING') {
+            if (Date.now() > deadline) throw new Error('Asset generation timed out');
+            await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+            const status = await fetch(job.status_url);
+            if (!status.ok) throw new Error('Failed to fetch generation status');
+            job = await status.json();
+        }
+        if (job.status !== 'SUCCEEDED') throw new Error(job.error || 'Failed to generate asset');
+        return job.asset;
     } catch (error) {
         console.error('Error generating asset:', error);
         return null;